@@ -3,8 +3,8 @@ import sys
 import os
 sys.path.append('py')
 
-# Import the OpenAI client and model from rag_server
-from rag_server import openai_client, OPENAI_MODEL, get_combined_food_database_analysis
+# Import the memoized chat completion helper and model from rag_server
+from rag_server import chat_completion, OPENAI_MODEL, get_combined_food_database_analysis
 
 def debug_ai_prompt():
     """Debug what exactly the AI is receiving and returning"""
@@ -72,13 +72,9 @@ IMPORTANT: Respond ONLY with the JSON object, no additional text, no explanation
     print(f"\n4. Sample of prompt (first 500 chars):")
     print(prompt[:500] + "...")
     
-    print("\n5. Calling OpenAI API directly...")
+    print("\n5. Calling OpenAI API (repeated runs are answered from the completion memo)...")
     try:
-        if not openai_client:
-            print("✗ OpenAI client not configured")
-            return
-            
-        chat = openai_client.chat.completions.create(
+        chat = chat_completion(
             model=OPENAI_MODEL,
             response_format={"type": "json_object"},
             messages=[
@@ -0,0 +1,173 @@
+"""
+Admission control and circuit breakers.
+
+Each upstream has a CircuitBreaker fed by the retry engine: after
+`failure_threshold` consecutive transient failures it opens, and calls fail fast
+for `cooldown` seconds. After that a single probe call is let through; its success
+closes the breaker again.
+
+The AdmissionController sits at the edge of the expensive endpoints. It rejects a
+request up front when too many are already in flight, when the upstream queue is
+too deep, or when a breaker the request depends on is open. Batch requests are
+shed before interactive ones. Rejections carry a status (429 overload, 503
+upstream down) and a Retry-After hint, so the server keeps answering quickly at
+full saturation instead of queueing work it cannot finish.
+"""
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # Consecutive transient failures that open a breaker
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))  # Seconds an open breaker fails fast before probing
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} circuit open, retry in {retry_after:.0f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened_count = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims the probe when half-open)"""
+        with self._lock:
+            if self._state == OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                print(f"Circuit for {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                print(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self.opened_count += 1
+
+    def is_open(self) -> bool:
+        """Open and still cooling down (a half-open breaker admits a probe)"""
+        with self._lock:
+            return self._state == OPEN and time.monotonic() - self._opened_at < self.cooldown
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state != OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures, "opened": self.opened_count}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(upstream: str) -> CircuitBreaker:
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(upstream, CircuitBreaker(upstream, BREAKER_FAILURE_THRESHOLD, BREAKER_COOLDOWN))
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Dict[str, object]]:
+    return {name: breaker.stats() for name, breaker in sorted(_breakers.items())}
+
+
+@dataclass(slots=True)
+class Rejection:
+    status: int
+    reason: str
+    retry_after: float
+
+
+class AdmissionController:
+    """Bounds in-flight work at the edge; batch traffic is shed first"""
+
+    def __init__(self, max_in_flight: int, max_queue: int, batch_share: float, retry_after: float,
+                 queue_depth: Callable[[], int], required_upstreams: List[str]):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max_queue
+        self.batch_share = batch_share
+        self.retry_after = retry_after
+        self.queue_depth = queue_depth
+        self.required_upstreams = required_upstreams
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed: Dict[str, int] = {}
+
+    def try_acquire(self, batch: bool = False) -> Optional[Rejection]:
+        """Admit the request (call release() when done) or return why it was shed"""
+        share = self.batch_share if batch else 1.0
+        rejection = None
+        for upstream in self.required_upstreams:
+            breaker = breaker_for(upstream)
+            if breaker.is_open():
+                rejection = Rejection(503, f"{upstream} unavailable", breaker.retry_after())
+                break
+        with self._lock:
+            if rejection is None and self.in_flight >= max(1, int(self.max_in_flight * share)):
+                rejection = Rejection(429, "too many requests in flight", self.retry_after)
+            if rejection is None and self.queue_depth() >= self.max_queue * share:
+                rejection = Rejection(429, "upstream queue full", self.retry_after)
+            if rejection is not None:
+                self.shed[rejection.reason] = self.shed.get(rejection.reason, 0) + 1
+                return rejection
+            self.in_flight += 1
+            self.admitted += 1
+        return None
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "queue_depth": self.queue_depth(),
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+            }
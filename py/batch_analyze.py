@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Offline batch analyzer for product catalogs.
+
+Reads (product, ingredients) rows from a CSV or NDJSON file and runs them
+through the batch pipeline (rag_server.analyze_product_batch) on a pool of
+worker processes. Each worker assesses the distinct ingredients of its chunk on
+a thread pool. One result per product is written to NDJSON or SQLite as chunks
+complete:
+
+    python batch_analyze.py catalog.csv results.ndjson
+    python batch_analyze.py catalog.ndjson results.db --processes 16 --threads 8
+    python batch_analyze.py catalog.csv results.ndjson --restart
+
+The input is split into chunks of --chunk-size rows. Completed chunks are
+checkpointed, in the SQLite file itself or in <output>.checkpoint.json next to
+an NDJSON file, so rerunning an interrupted job skips everything already
+written. Assessments are shared across chunks and processes through the
+ingredient cache (CACHE_BACKEND sqlite or network). A re-scoring run over a warm
+cache is therefore CPU-bound and uses every core.
+
+Summaries leave out the batch-relative rank; SQLite output gets a catalog-wide
+`rank` column (1 = riskiest) once every chunk is done.
+
+OPENAI_CONCURRENCY and SERPAPI_CONCURRENCY are limits for the whole job: each
+worker process gets an equal share of them. Catalog rows are not written to
+analysis_log, so a batch run does not skew the warm-up's popularity counts.
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import rag_server
+
+DEFAULT_CHUNK_SIZE = 200
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+Row = Tuple[int, str, str]  # (row number, product, ingredients)
+
+
+def read_products(path: str, fmt: str, product_column: str, ingredients_column: str) -> Iterator[Row]:
+    """Every input row, numbered from 0; malformed or empty rows get empty ingredients"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            rows: Iterator[Any] = csv.DictReader(f)
+        else:
+            rows = (line for line in f if line.strip())
+        for number, row in enumerate(rows):
+            if fmt != "csv":
+                try:
+                    row = json.loads(row)
+                except json.JSONDecodeError:
+                    row = {}
+            if not isinstance(row, dict):
+                row = {}
+            product = str(row.get(product_column) or f"row {number}")
+            yield number, product, str(row.get(ingredients_column) or "").strip()
+
+
+def iter_chunks(rows: Iterator[Row], chunk_size: int) -> Iterator[Tuple[int, List[Row]]]:
+    chunk: List[Row] = []
+    index = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield index, chunk
+            chunk, index = [], index + 1
+    if chunk:
+        yield index, chunk
+
+
+def input_fingerprint(path: str, chunk_size: int) -> Dict[str, Any]:
+    """Identifies the input a checkpoint belongs to; chunk numbers only match for the same file and chunk size"""
+    stat = os.stat(path)
+    return {"input": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime, "chunk_size": chunk_size}
+
+
+def worker_environment(processes: int) -> Dict[str, str]:
+    """Per-process upstream limits, so the configured limits hold for the job rather than for each worker"""
+    return {
+        "OPENAI_CONCURRENCY": str(max(1, rag_server.OPENAI_CONCURRENCY // processes)),
+        "SERPAPI_CONCURRENCY": str(max(1, rag_server.SERPAPI_CONCURRENCY // processes)),
+        "INTERACTIVE_RESERVED_SLOTS": "0",  # No interactive traffic to keep slots for
+    }
+
+
+def _init_worker(threads: int) -> None:
+    rag_server.BATCH_CONCURRENCY = threads
+
+
+def analyze_chunk(index: int, rows: List[Row]) -> Tuple[int, List[Dict[str, Any]]]:
+    """Worker process: analyze one chunk. Returns (chunk index, one record per row)"""
+    products = [(product, ingredients) for _, product, ingredients in rows if ingredients]
+    responses = iter(rag_server.analyze_product_batch(products, ranked=False, log=False) if products else [])
+    records = []
+    for row, product, ingredients in rows:
+        response = next(responses) if ingredients else {"error": "No ingredients."}
+        records.append({"row": row, "product": product, **response})
+    return index, records
+
+
+class NdjsonSink:
+    """Appends one line per product. The checkpoint records the completed chunks and the file length they cover"""
+
+    def __init__(self, path: str, fingerprint: Dict[str, Any], restart: bool):
+        self.path = path
+        self.checkpoint_path = f"{path}.checkpoint.json"
+        self.fingerprint = fingerprint
+        state = None
+        if not restart and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("fingerprint") != fingerprint:
+                raise SystemExit(f"{self.checkpoint_path} belongs to a different input or chunk size; use --restart")
+        self.done: Set[int] = set(state["done"]) if state else set()
+        self.file = open(path, "r+b" if os.path.exists(path) else "wb")
+        # Lines written after the last checkpoint belong to chunks that will be redone
+        self.file.truncate(state["offset"] if state else 0)
+        self.file.seek(0, os.SEEK_END)
+
+    def write_chunk(self, index: int, records: List[Dict[str, Any]]) -> None:
+        self.file.write("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.done.add(index)
+        self._save(complete=False)
+
+    def _save(self, complete: bool) -> None:
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "done": sorted(self.done), "offset": self.file.tell(),
+                       "complete": complete}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def finish(self, complete: bool) -> None:
+        self._save(complete)
+        self.file.close()
+
+
+class SQLiteSink:
+    """One row per product; results and checkpoint are committed in the same transaction"""
+
+    def __init__(self, path: str, fingerprint: Dict[str, Any], restart: bool):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS batch_results (row INTEGER PRIMARY KEY, product TEXT NOT NULL, "
+            "composite_risk REAL, rank INTEGER, error TEXT, response TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS batch_checkpoint (chunk INTEGER PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS batch_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        stored = self.conn.execute("SELECT value FROM batch_meta WHERE key = 'fingerprint'").fetchone()
+        if restart or stored is None:
+            self.conn.execute("DELETE FROM batch_results")
+            self.conn.execute("DELETE FROM batch_checkpoint")
+        elif json.loads(stored[0]) != fingerprint:
+            raise SystemExit(f"{path} belongs to a different input or chunk size; use --restart")
+        self.conn.execute("INSERT OR REPLACE INTO batch_meta (key, value) VALUES ('fingerprint', ?)", (json.dumps(fingerprint),))
+        self.conn.commit()
+        self.done: Set[int] = {row[0] for row in self.conn.execute("SELECT chunk FROM batch_checkpoint")}
+
+    def write_chunk(self, index: int, records: List[Dict[str, Any]]) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO batch_results (row, product, composite_risk, error, response) VALUES (?, ?, ?, ?, ?)",
+                [(record["row"], record["product"], (record.get("summary") or {}).get("composite_risk"),
+                  record.get("error"), json.dumps(record)) for record in records],
+            )
+            self.conn.execute("INSERT OR REPLACE INTO batch_checkpoint (chunk) VALUES (?)", (index,))
+        self.done.add(index)
+
+    def finish(self, complete: bool) -> None:
+        if complete:
+            # Catalog-wide ranking: riskiest first, unscored products unranked
+            ordered = self.conn.execute(
+                "SELECT row FROM batch_results WHERE composite_risk IS NOT NULL ORDER BY composite_risk DESC, row"
+            ).fetchall()
+            with self.conn:
+                self.conn.execute("UPDATE batch_results SET rank = NULL")
+                self.conn.executemany("UPDATE batch_results SET rank = ? WHERE row = ?",
+                                      [(rank, row) for rank, (row,) in enumerate(ordered, start=1)])
+        self.conn.close()
+
+
+def run_batch(input_path: str, output_path: str, fmt: Optional[str] = None, processes: Optional[int] = None,
+              threads: int = rag_server.BATCH_CONCURRENCY, chunk_size: int = DEFAULT_CHUNK_SIZE,
+              product_column: str = "product", ingredients_column: str = "ingredients",
+              restart: bool = False) -> Dict[str, Any]:
+    """Analyze every product of the input file, resuming from the output's checkpoint"""
+    fmt = fmt or ("csv" if input_path.lower().endswith(".csv") else "ndjson")
+    processes = processes or os.cpu_count() or 1
+    if os.getenv("CACHE_BACKEND", "sqlite").lower() == "memory":
+        print("Warning: CACHE_BACKEND=memory, so worker processes will not share assessments")
+    sink_class = SQLiteSink if output_path.lower().endswith(SQLITE_SUFFIXES) else NdjsonSink
+    sink = sink_class(output_path, input_fingerprint(input_path, chunk_size), restart)
+    report: Dict[str, Any] = {"chunks_skipped": len(sink.done), "chunks_written": 0, "chunks_failed": [],
+                              "products": 0, "errors": 0, "interrupted": False}
+    started = time.perf_counter()
+    running: Dict[Future, int] = {}
+
+    def collect(futures) -> None:
+        for future in futures:
+            index = running.pop(future)
+            try:
+                _, records = future.result()
+            except Exception as e:
+                print(f"Chunk {index} failed, it will be retried on the next run: {e}")
+                report["chunks_failed"].append(index)
+                continue
+            sink.write_chunk(index, records)
+            report["chunks_written"] += 1
+            report["products"] += len(records)
+            report["errors"] += sum(1 for record in records if "error" in record)
+            elapsed = time.perf_counter() - started
+            print(f"Chunk {index} written: {report['products']} products in {elapsed:.1f}s "
+                  f"({report['products'] / max(elapsed, 1e-9):.1f}/s)")
+
+    if processes > rag_server.OPENAI_CONCURRENCY:
+        print(f"Warning: {processes} processes exceed OPENAI_CONCURRENCY={rag_server.OPENAI_CONCURRENCY}; "
+              "each still gets one OpenAI slot")
+    # Spawned workers import rag_server afresh and size their schedulers from these variables
+    saved_environment = {name: os.environ.get(name) for name in worker_environment(processes)}
+    os.environ.update(worker_environment(processes))
+    pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=_init_worker, initargs=(threads,))
+    try:
+        for index, rows in iter_chunks(read_products(input_path, fmt, product_column, ingredients_column), chunk_size):
+            if index in sink.done:
+                continue
+            # Bounded read-ahead: a huge catalog is never held in memory at once
+            while len(running) >= 2 * processes:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                collect(done)
+            running[pool.submit(analyze_chunk, index, rows)] = index
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            collect(done)
+    except KeyboardInterrupt:
+        report["interrupted"] = True
+        print("Interrupted; completed chunks are checkpointed, rerun the same command to resume")
+    finally:
+        pool.shutdown(wait=not report["interrupted"], cancel_futures=True)
+        for name, value in saved_environment.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        sink.finish(complete=not report["interrupted"] and not report["chunks_failed"])
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze a product catalog offline (CSV or NDJSON in, NDJSON or SQLite out)")
+    parser.add_argument("input", help="CSV or NDJSON file of products")
+    parser.add_argument("output", help="Results file: .ndjson, or .db/.sqlite for SQLite")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Input format (default: from the file extension)")
+    parser.add_argument("--product-column", default="product", help="Column or key holding the product id/name")
+    parser.add_argument("--ingredients-column", default="ingredients", help="Column or key holding the ingredient text")
+    parser.add_argument("--processes", type=int, help="Worker processes (default: all cores)")
+    parser.add_argument("--threads", type=int, default=rag_server.BATCH_CONCURRENCY,
+                        help="Ingredients assessed concurrently per process")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Products per work unit and checkpoint")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    print(json.dumps(run_batch(args.input, args.output, args.format, args.processes, args.threads, args.chunk_size,
+                               args.product_column, args.ingredients_column, args.restart), indent=2))
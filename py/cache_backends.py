@@ -0,0 +1,483 @@
+"""
+Cache backends for analysis results.
+
+Every uvicorn worker used to keep its own in-memory dict, so the same ingredient
+was analyzed once per worker. The SQLite backend (WAL mode) is shared by all
+workers on a host; the network backend shards keys across cache nodes with
+consistent hashing so several hosts share one cache. Values must be
+JSON-serializable.
+
+A stand-in cache node for local testing can be started with:
+
+    python cache_backends.py serve --port 8100 --db /tmp/cache-node.db
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import quote, unquote
+
+import requests
+
+
+_registry_lock = threading.Lock()
+
+
+class CacheBackend:
+    """Minimal key/value interface shared by all backends, plus the cache version registry"""
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete every key starting with prefix. Returns the number deleted, or -1 if unsupported or incomplete"""
+        return -1
+
+    def register_version(self, namespace: str, version: str) -> List[str]:
+        """Record version as the newest of namespace. Returns the recorded versions, oldest first.
+
+        This default keeps the registry under one key, which is only atomic within a process.
+        """
+        with _registry_lock:
+            registry = self.get("cache_versions") or {}
+            versions = [v for v in registry.get(namespace, []) if v != version] + [version]
+            registry[namespace] = versions
+            self.set("cache_versions", registry)
+        return versions
+
+    def forget_version(self, namespace: str, version: str) -> None:
+        with _registry_lock:
+            registry = self.get("cache_versions") or {}
+            registry[namespace] = [v for v in registry.get(namespace, []) if v != version]
+            self.set("cache_versions", registry)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+    # dict-style access so existing call sites keep working
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Per-process dict cache (the original behaviour)"""
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self._data.get(key)
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [key for key in self._data if key.startswith(prefix)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "entries": len(self._data)}
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Host-wide cache stored in a WAL-mode SQLite file shared by all workers.
+
+    Bounded by entry count and age: entries not written for max_age seconds are
+    dropped, then the least recently written ones beyond max_entries. Eviction
+    runs at startup and every EVICT_EVERY writes of this process.
+    """
+
+    EVICT_EVERY = 500
+    EVICT_TO = 0.9  # Share of max_entries left after evicting by count
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, max_age: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evicted = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_updated_at ON cache (updated_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_versions (namespace TEXT NOT NULL, version TEXT NOT NULL, "
+            "registered_at REAL NOT NULL, PRIMARY KEY (namespace, version))"
+        )
+        conn.commit()
+        self._import_registry()
+        self.evict()
+
+    def _import_registry(self) -> None:
+        """Move a registry kept under the 'cache_versions' key (older files) into the cache_versions table"""
+        registry = self.get("cache_versions")
+        if not registry:
+            return
+        conn = self._conn()
+        now = time.time()
+        for namespace, versions in registry.items():
+            # Keep their order: older versions get earlier registration times
+            conn.executemany(
+                "INSERT OR IGNORE INTO cache_versions (namespace, version, registered_at) VALUES (?, ?, ?)",
+                [(namespace, version, now - len(versions) + i) for i, version in enumerate(versions)],
+            )
+        conn.execute("DELETE FROM cache WHERE key = 'cache_versions'")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        row = self._conn().execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, updated_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time()),
+        )
+        conn.commit()
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop entries past max_age, then the oldest beyond max_entries. Returns the number removed"""
+        if self.max_age is None and self.max_entries is None:
+            return 0
+        conn = self._conn()
+        removed = 0
+        if self.max_age is not None:
+            removed += conn.execute("DELETE FROM cache WHERE updated_at < ?", (time.time() - self.max_age,)).rowcount
+        if self.max_entries is not None:
+            count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - int(self.max_entries * self.EVICT_TO)
+                removed += conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY updated_at LIMIT ?)", (excess,)
+                ).rowcount
+        conn.commit()
+        with self._lock:
+            self.evicted += removed
+        return removed
+
+    def delete(self, key: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        conn.commit()
+
+    def delete_prefix(self, prefix: str) -> int:
+        conn = self._conn()
+        cur = conn.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        conn.commit()
+        return cur.rowcount
+
+    def register_version(self, namespace: str, version: str) -> List[str]:
+        # One row per version, upserted atomically: concurrent workers never drop each other's versions
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO cache_versions (namespace, version, registered_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (namespace, version) DO UPDATE SET registered_at = excluded.registered_at",
+            (namespace, version, time.time()),
+        )
+        conn.commit()
+        rows = conn.execute(
+            "SELECT version FROM cache_versions WHERE namespace = ? ORDER BY registered_at", (namespace,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def forget_version(self, namespace: str, version: str) -> None:
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_versions WHERE namespace = ? AND version = ?", (namespace, version))
+        conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        count = self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "entries": count, "max_entries": self.max_entries,
+                "evicted": self.evicted}
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 100):
+        self.replicas = replicas
+        self._ring: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int(hashlib.md5(value.encode("utf-8")).hexdigest()[:16], 16)
+
+    def add_node(self, node: str) -> None:
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if h not in self._owners:
+                bisect.insort(self._ring, h)
+                self._owners[h] = node
+
+    def remove_node(self, node: str) -> None:
+        for i in range(self.replicas):
+            h = self._hash(f"{node}#{i}")
+            if self._owners.get(h) == node:
+                del self._owners[h]
+                self._ring.remove(h)
+
+    def get_node(self, key: str) -> str:
+        if not self._ring:
+            raise ValueError("Hash ring has no nodes")
+        idx = bisect.bisect(self._ring, self._hash(key)) % len(self._ring)
+        return self._owners[self._ring[idx]]
+
+
+class NetworkCacheBackend(CacheBackend):
+    """Multi-host cache: keys are sharded across HTTP cache nodes by consistent hashing.
+
+    Node failures are treated as cache misses so an unavailable node only costs
+    recomputation, never a failed request.
+    """
+
+    def __init__(self, nodes: List[str], timeout: float = 0.5):
+        if not nodes:
+            raise ValueError("NetworkCacheBackend needs at least one node")
+        self.nodes = [n if n.startswith("http") else f"http://{n}" for n in nodes]
+        self.ring = HashRing(self.nodes)
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.errors = 0
+
+    def _url(self, key: str) -> str:
+        return f"{self.ring.get_node(key)}/cache/{quote(key, safe='')}"
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            response = self.session.get(self._url(key), timeout=self.timeout)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache node read error for '{key}': {e}")
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        try:
+            self.session.put(self._url(key), data=json.dumps(value), timeout=self.timeout).raise_for_status()
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache node write error for '{key}': {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            self.session.delete(self._url(key), timeout=self.timeout)
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache node delete error for '{key}': {e}")
+
+    def delete_prefix(self, prefix: str) -> int:
+        """Delete the prefix on every node (a prefix spans shards); -1 when a node could not do it"""
+        deleted = 0
+        complete = True
+        for node in self.nodes:
+            try:
+                response = self.session.delete(f"{node}/cache-prefix/{quote(prefix, safe='')}", timeout=self.timeout)
+                response.raise_for_status()
+                deleted += response.json()["deleted"]
+            except Exception as e:
+                self.errors += 1
+                complete = False
+                print(f"Cache node prefix delete error on {node} for '{prefix}': {e}")
+        return deleted if complete else -1
+
+    def _versions_url(self, namespace: str, version: str) -> str:
+        # Each namespace's registry lives on one node, which updates it atomically
+        node = self.ring.get_node(f"cache_versions:{namespace}")
+        return f"{node}/cache-versions/{quote(namespace, safe='')}/{quote(version, safe='')}"
+
+    def register_version(self, namespace: str, version: str) -> List[str]:
+        try:
+            response = self.session.post(self._versions_url(namespace, version), timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()["versions"]
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache node version registry error for '{namespace}': {e}")
+            return [version]
+
+    def forget_version(self, namespace: str, version: str) -> None:
+        try:
+            self.session.delete(self._versions_url(namespace, version), timeout=self.timeout).raise_for_status()
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache node version registry error for '{namespace}': {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "network", "nodes": self.nodes, "errors": self.errors}
+
+
+def create_cache_backend(kind: Optional[str] = None) -> CacheBackend:
+    """Build the cache backend selected by CACHE_BACKEND (memory, sqlite or network)"""
+    kind = (kind or os.getenv("CACHE_BACKEND", "sqlite")).lower()
+    if kind == "memory":
+        return MemoryCacheBackend()
+    if kind == "sqlite":
+        default_path = str(Path(__file__).resolve().parent / "ingredient_cache.db")
+        max_entries = int(os.getenv("CACHE_SQLITE_MAX_ENTRIES", "200000")) or None  # 0: unbounded
+        max_age = float(os.getenv("CACHE_SQLITE_MAX_AGE", str(90 * 86400))) or None  # Seconds since last write; 0: no limit
+        return SQLiteCacheBackend(os.getenv("CACHE_SQLITE_PATH", default_path), max_entries, max_age)
+    if kind == "network":
+        nodes = [n.strip() for n in os.getenv("CACHE_NODES", "").split(",") if n.strip()]
+        return NetworkCacheBackend(nodes, timeout=float(os.getenv("CACHE_NODE_TIMEOUT", "0.5")))
+    raise ValueError(f"Unknown CACHE_BACKEND '{kind}'")
+
+
+def make_cache_node_handler(backend: CacheBackend):
+    """HTTP handler exposing a backend as GET/PUT/DELETE /cache/<key>, DELETE /cache-prefix/<prefix>
+    and POST/DELETE /cache-versions/<namespace>/<version>"""
+
+    class CacheNodeHandler(BaseHTTPRequestHandler):
+        def _send_json(self, value: Any) -> None:
+            body = json.dumps(value).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _version(self) -> Optional[List[str]]:
+            parts = self.path[len("/cache-versions/"):].split("/")
+            if len(parts) != 2:
+                self.send_error(404)
+                return None
+            return [unquote(part) for part in parts]
+
+        def _key(self) -> Optional[str]:
+            if not self.path.startswith("/cache/"):
+                self.send_error(404)
+                return None
+            return unquote(self.path[len("/cache/"):])
+
+        def do_GET(self):
+            key = self._key()
+            if key is None:
+                return
+            value = backend.get(key)
+            if value is None:
+                self.send_error(404)
+                return
+            body = json.dumps(value).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_PUT(self):
+            key = self._key()
+            if key is None:
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            backend.set(key, json.loads(self.rfile.read(length)))
+            self.send_response(204)
+            self.end_headers()
+
+        def do_DELETE(self):
+            if self.path.startswith("/cache-prefix/"):
+                deleted = backend.delete_prefix(unquote(self.path[len("/cache-prefix/"):]))
+                if deleted < 0:
+                    self.send_error(501)
+                    return
+                self._send_json({"deleted": deleted})
+                return
+            if self.path.startswith("/cache-versions/"):
+                version = self._version()
+                if version is not None:
+                    backend.forget_version(*version)
+                    self.send_response(204)
+                    self.end_headers()
+                return
+            key = self._key()
+            if key is None:
+                return
+            backend.delete(key)
+            self.send_response(204)
+            self.end_headers()
+
+        def do_POST(self):
+            if not self.path.startswith("/cache-versions/"):
+                self.send_error(404)
+                return
+            version = self._version()
+            if version is not None:
+                self._send_json({"versions": backend.register_version(*version)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return CacheNodeHandler
+
+
+def serve_cache_node(host: str = "127.0.0.1", port: int = 8100, db_path: Optional[str] = None) -> ThreadingHTTPServer:
+    """Create a stand-in cache node server (call serve_forever() to run it)"""
+    backend = SQLiteCacheBackend(db_path) if db_path else MemoryCacheBackend()
+    return ThreadingHTTPServer((host, port), make_cache_node_handler(backend))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FoodSafe AI cache node")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="Run a stand-in network cache node")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8100)
+    serve.add_argument("--db", default=None, help="SQLite file to persist entries (memory if omitted)")
+    args = parser.parse_args()
+
+    server = serve_cache_node(args.host, args.port, args.db)
+    print(f"Cache node listening on http://{args.host}:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,222 @@
+"""
+Content-addressed memo of OpenAI chat completions.
+
+Every chat completion the server makes (validation, screening, breakdown,
+assessment) is keyed on a SHA-256 of its full request: model, temperature,
+response_format, messages and any other parameter. The response text is stored
+zlib-compressed in a SQLite file shared by all workers on the host, so an
+identical prompt (a repeated debugging script, a recurring input whose research
+has not changed) is answered without calling OpenAI.
+
+The store is an LRU: every hit refreshes an entry's last_used time, and once
+the compressed total exceeds LLM_MEMO_MAX_MB the least recently used entries
+are evicted. Entries also expire after LLM_MEMO_TTL.
+
+Calls bypass the memo when their temperature is above LLM_MEMO_MAX_TEMPERATURE
+(the caller wants varied output) or when the `fresh_completions` context flag is
+set (a request sent with Cache-Control: no-cache, or a cache refresh).
+"""
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+LLM_MEMO_ENABLED = os.getenv("LLM_MEMO_ENABLED", "true").lower() == "true"
+LLM_MEMO_PATH = os.getenv("LLM_MEMO_PATH", str(Path(__file__).resolve().parent / "completion_memo.db"))
+LLM_MEMO_MAX_MB = float(os.getenv("LLM_MEMO_MAX_MB", "256"))  # Compressed size before LRU eviction
+LLM_MEMO_TTL = int(os.getenv("LLM_MEMO_TTL", str(30 * 86400)))  # Seconds an entry stays usable
+LLM_MEMO_MAX_TEMPERATURE = float(os.getenv("LLM_MEMO_MAX_TEMPERATURE", "0.3"))  # Hotter calls are never memoized
+EVICT_TO = 0.9  # Eviction frees space down to this share of the limit
+
+# Set for a request (or a refresh) that must get newly generated completions
+fresh_completions: contextvars.ContextVar = contextvars.ContextVar("fresh_completions", default=False)
+
+
+@dataclass(slots=True)
+class MemoMessage:
+    content: str
+    role: str = "assistant"
+
+
+@dataclass(slots=True)
+class MemoChoice:
+    message: MemoMessage
+    finish_reason: Optional[str] = "stop"
+    index: int = 0
+
+
+@dataclass(slots=True)
+class MemoizedCompletion:
+    """Stands in for a ChatCompletion: callers read choices[0].message.content"""
+    model: str
+    choices: List[MemoChoice] = field(default_factory=list)
+    memoized: bool = True
+
+
+def completion_key(request: Dict[str, Any]) -> str:
+    """Hash of the complete request; `stream` is excluded so streamed and plain calls share entries"""
+    canonical = {key: value for key, value in request.items() if key != "stream"}
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def memoizable(request: Dict[str, Any]) -> bool:
+    return (LLM_MEMO_ENABLED and not fresh_completions.get()
+            and float(request.get("temperature", 1.0)) <= LLM_MEMO_MAX_TEMPERATURE)
+
+
+def response_content(response: Any) -> Optional[str]:
+    """Text of a completed response, or None when it should not be memoized"""
+    try:
+        choice = response.choices[0]
+    except (AttributeError, IndexError, TypeError):
+        return None
+    if getattr(choice, "finish_reason", "stop") not in (None, "stop"):
+        return None  # Truncated or filtered output is not worth replaying
+    return choice.message.content or None
+
+
+class CompletionMemo:
+    """SQLite-backed LRU of compressed completion texts"""
+
+    def __init__(self, path: str, max_bytes: int, ttl: float):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, model TEXT NOT NULL, body BLOB NOT NULL, "
+            "size INTEGER NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_last_used ON completions(last_used)")
+        conn.commit()
+        self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[MemoizedCompletion]:
+        conn = self._conn()
+        row = conn.execute("SELECT model, body, created_at FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[2] > self.ttl:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE completions SET last_used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+        conn.commit()
+        self.hits += 1
+        return MemoizedCompletion(row[0], [MemoChoice(MemoMessage(zlib.decompress(row[1]).decode("utf-8")))])
+
+    def put(self, key: str, model: str, content: str) -> None:
+        body = zlib.compress(content.encode("utf-8"), 6)
+        now = time.time()
+        conn = self._conn()
+        # Subtract the size of the row being replaced so the running total stays exact
+        replaced = conn.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO completions (key, model, body, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model, body, len(body), now, now),
+        )
+        conn.commit()
+        with self._lock:
+            self.stores += 1
+            self._bytes += len(body) - (replaced[0] if replaced else 0)
+            over = self._bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until the store is under EVICT_TO of its limit"""
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+        target = self.max_bytes * EVICT_TO
+        if total > target:
+            # Walk from the least recently used entry until enough bytes are freed
+            freed = 0
+            cutoff = None
+            for last_used, size in conn.execute("SELECT last_used, size FROM completions ORDER BY last_used"):
+                freed += size
+                cutoff = last_used
+                if total - freed <= target:
+                    break
+            if cutoff is not None:
+                removed += conn.execute("DELETE FROM completions WHERE last_used <= ?", (cutoff,)).rowcount
+        conn.commit()
+        with self._lock:
+            self._bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+            self.evicted += removed
+        return removed
+
+    def clear(self) -> int:
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM completions").rowcount
+        conn.commit()
+        with self._lock:
+            self._bytes = 0
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._conn().execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "enabled": LLM_MEMO_ENABLED, "entries": entries, "size_kb": round(self._bytes / 1024, 1),
+            "max_mb": round(self.max_bytes / 2**20, 1), "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None, "stores": self.stores, "evicted": self.evicted,
+        }
+
+
+_memo: Optional[CompletionMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_completion_memo() -> Optional[CompletionMemo]:
+    """Return the process-wide memo, or None when disabled"""
+    global _memo
+    if _memo is None and LLM_MEMO_ENABLED:
+        with _memo_lock:
+            if _memo is None:
+                _memo = CompletionMemo(LLM_MEMO_PATH, int(LLM_MEMO_MAX_MB * 2**20), LLM_MEMO_TTL)
+    return _memo
+
+
+def lookup(request: Dict[str, Any]) -> Tuple[Optional[str], Optional[MemoizedCompletion]]:
+    """(key, memoized response or None). The key is None when this call must not be memoized"""
+    memo = get_completion_memo()
+    if memo is None or not memoizable(request):
+        return None, None
+    key = completion_key(request)
+    try:
+        return key, memo.get(key)
+    except sqlite3.Error as e:
+        print(f"Completion memo read error: {e}")
+        return key, None
+
+
+def remember(key: Optional[str], request: Dict[str, Any], content: Optional[str]) -> None:
+    """Store a completion's text under the key lookup() returned"""
+    memo = get_completion_memo()
+    if key is None or content is None or memo is None:
+        return
+    try:
+        memo.put(key, str(request.get("model", "")), content)
+    except sqlite3.Error as e:
+        print(f"Completion memo write error: {e}")
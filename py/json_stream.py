@@ -0,0 +1,123 @@
+"""
+Incremental parsing of a JSON object that arrives in chunks (streamed model output).
+
+The parser tracks strings and nesting character by character, so it knows when a
+top-level member's value is complete without re-parsing the whole buffer. Scalar
+members ("risk_level", "score", ...) are reported as soon as they close, and the
+object is parsed once, when its closing brace arrives. Any text before the opening
+brace or after the closing one is ignored.
+"""
+import json
+from typing import Any, Dict, Optional
+
+
+class IncrementalJSONParser:
+    """Feed chunks of model output; collects the first top-level JSON object"""
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._start = -1
+        self._end = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._stage = "key"  # key -> colon -> value -> after (per top-level member)
+        self._token_start = -1
+        self._value_start = -1
+        self._key: Optional[str] = None
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Consume a chunk. Returns the top-level scalar members it completed"""
+        completed: Dict[str, Any] = {}
+        if self.done or not chunk:
+            return completed
+        self._text += chunk
+        text = self._text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._start < 0:
+                if ch == "{":
+                    self._start = i
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._string_closed(i, completed)
+            elif ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._token_start = i
+                    if self._stage == "value":
+                        self._value_start = i
+            elif ch in "{[":
+                if self._depth == 1 and self._stage == "value":
+                    self._value_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_scalar(i, completed)
+                    self._end = i + 1
+                    self.done = True
+                    break
+            elif self._depth == 1:
+                if ch == ":":
+                    self._stage = "value"
+                    self._value_start = -1
+                elif ch == ",":
+                    self._close_scalar(i, completed)
+                    self._stage = "key"
+                elif self._stage == "value" and self._value_start < 0 and not ch.isspace():
+                    self._value_start = i
+            i += 1
+        self._pos = i
+        self.fields.update(completed)
+        return completed
+
+    def _string_closed(self, i: int, completed: Dict[str, Any]) -> None:
+        if self._stage == "key":
+            self._key = json.loads(self._text[self._token_start:i + 1])
+            self._stage = "colon"
+        elif self._stage == "value":
+            self._emit(self._text[self._value_start:i + 1], completed)
+            self._stage = "after"
+
+    def _close_scalar(self, i: int, completed: Dict[str, Any]) -> None:
+        """A ',' or the closing brace ends a number/true/false/null value"""
+        if self._stage == "value" and self._value_start >= 0 and self._text[self._value_start] not in '"{[':
+            self._emit(self._text[self._value_start:i].strip(), completed)
+        self._stage = "after"
+
+    def _emit(self, raw: str, completed: Dict[str, Any]) -> None:
+        if self._key is None:
+            return
+        try:
+            completed[self._key] = json.loads(raw)
+        except ValueError:
+            pass
+
+    def value(self) -> Optional[Dict[str, Any]]:
+        """The parsed object once complete, else None"""
+        if not self.done:
+            return None
+        try:
+            data = json.loads(self._text[self._start:self._end])
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+
+def first_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Parse the first complete JSON object embedded in text, or None"""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.value()
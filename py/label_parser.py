@@ -0,0 +1,205 @@
+"""
+Ingredient label parser.
+
+Turns label text such as
+
+    Ingredients: enriched flour (wheat flour, niacin, reduced iron), sugar 12%,
+    emulsifier: soy lecithin (E322), contains 2% or less of: salt, yeast.
+
+into a tree of LabelIngredient nodes in one pass over the text. It handles
+nested (), [] and {} sub-lists, percentages ("12%", "(45%)", "min. 30%"),
+"contains 2% or less of" clauses (every later item of that list gets
+max_percent), E-number annotations ("E322", "E 150d") and function prefixes
+("emulsifier:"). A bracket holding a single plain item ("thiamine mononitrate
+[vitamin b1]", "lecithin (soy)") qualifies its ingredient and is kept as a
+note; only bracketed lists become sub-ingredients. Commas between digits
+("1,5%") are decimal commas, not separators.
+
+The leaves of the tree are the ingredients to assess: a compound ingredient is
+represented by the sub-ingredients its label already lists.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+_CLOSERS = {"(": ")", "[": "]", "{": "}"}
+_LABEL_PREFIX_RE = re.compile(r"^\s*ingredients?\s*(?:list)?\s*:\s*", re.I)
+_MINOR_RE = re.compile(
+    r"^(?:and\s+)?(contains?\s+(?:less\s+than\s+)?|less\s+than\s+)(\d+(?:[.,]\d+)?)\s*%\s*(?:or\s+less\s*)?"
+    r"(?:of\s*)?(?:each\s+of\s*)?(?:the\s+following\s*)?(?:ingredients?\s*)?:?\s*",
+    re.I,
+)
+_PERCENT_RE = re.compile(r"(?:\bmin(?:imum)?\.?\s*|<\s*)?(\d+(?:[.,]\d+)?)\s*%")
+_E_NUMBER_RE = re.compile(r"\bE\s?-?(\d{3,4}[a-j]?)(?:\s?\((?:i{1,3}|iv|v)\))?(?![\w])", re.I)
+_STRIP_CHARS = " .:;*-–—\t"
+_MAX_FUNCTION_WORDS = 4
+
+
+@dataclass(slots=True)
+class LabelIngredient:
+    """One ingredient of a label; children are the sub-ingredients listed for it"""
+    name: str
+    percent: Optional[float] = None
+    max_percent: Optional[float] = None
+    e_number: Optional[str] = None
+    function: Optional[str] = None
+    note: Optional[str] = None
+    children: List["LabelIngredient"] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {"name": self.name}
+        for key in ("percent", "max_percent", "e_number", "function", "note"):
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        if self.children:
+            data["children"] = [child.to_dict() for child in self.children]
+        return data
+
+
+def _split(text: str, i: int, nested: bool) -> Tuple[List[Tuple[str, List[Any]]], int]:
+    """Items of the list starting at text[i] as (own text, sub-lists); stops after the closing bracket if nested"""
+    items: List[Tuple[str, List[Any]]] = []
+    current: List[str] = []
+    groups: List[Any] = []
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch in _CLOSERS:
+            group, i = _split(text, i + 1, True)
+            groups.append(group)
+            current.append(" ")
+            continue
+        if ch in ")]}":
+            i += 1
+            if nested:
+                break
+            continue  # stray closer
+        if ch in ",;" and not (ch == "," and 0 < i < n - 1 and text[i - 1].isdigit() and text[i + 1].isdigit()):
+            items.append(("".join(current), groups))
+            current, groups = [], []
+            i += 1
+            continue
+        current.append(ch)
+        i += 1
+    items.append(("".join(current), groups))
+    return items, i
+
+
+def _number(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+def _clean(text: str) -> str:
+    return " ".join(text.split()).strip(_STRIP_CHARS)
+
+
+def _annotation(group: List[Any]) -> Optional[Tuple[str, Any]]:
+    """A single plain item annotates its parent (percentage, E-number or note) instead of being a child"""
+    if len(group) != 1 or group[0][1] or _MINOR_RE.match(_clean(group[0][0])):
+        return None
+    text = _clean(group[0][0])
+    match = _PERCENT_RE.fullmatch(text)
+    if match:
+        return "percent", _number(match.group(1))
+    match = _E_NUMBER_RE.fullmatch(text)
+    if match:
+        return "e_number", f"E{match.group(1).lower()}"
+    return ("note", text) if text else None
+
+
+def _node(text: str, groups: List[Any]) -> Optional[LabelIngredient]:
+    node = LabelIngredient(name="")
+    if ":" in text:
+        prefix, rest = text.split(":", 1)
+        prefix = _clean(prefix)
+        if prefix and len(prefix.split()) <= _MAX_FUNCTION_WORDS and not any(c.isdigit() for c in prefix):
+            node.function = prefix.lower()
+            text = rest
+    match = _PERCENT_RE.search(text)
+    if match:
+        node.percent = _number(match.group(1))
+        text = text[:match.start()] + text[match.end():]
+    match = _E_NUMBER_RE.search(text)
+    if match:
+        node.e_number = f"E{match.group(1).lower()}"
+        text = text[:match.start()] + text[match.end():]
+    for group in groups:
+        annotation = _annotation(group)
+        if annotation is not None:
+            setattr(node, annotation[0], annotation[1])
+        else:
+            node.children.extend(_build(group))
+    node.name = _clean(text)
+    if not node.name:
+        if node.e_number:
+            node.name = node.e_number
+        elif node.note:
+            node.name, node.note = node.note, None
+        elif node.function and not node.children:
+            node.name, node.function = node.function, None
+        elif not node.children:
+            return None
+    return node
+
+
+def _build(items: List[Tuple[str, List[Any]]]) -> List[LabelIngredient]:
+    nodes: List[LabelIngredient] = []
+    max_percent: Optional[float] = None
+    for text, groups in items:
+        text = _clean(text) if not groups else " ".join(text.split())
+        match = _MINOR_RE.match(text)
+        if match:
+            max_percent = _number(match.group(2))
+            text = text[match.end():]
+        node = _node(text, groups)
+        if node is None:
+            continue
+        if not node.name:
+            # "contains 2% or less of (salt, yeast)": the sub-list holds siblings, not children
+            siblings = node.children
+        else:
+            siblings = [node]
+        for sibling in siblings:
+            if max_percent is not None and sibling.max_percent is None:
+                sibling.max_percent = max_percent
+            nodes.append(sibling)
+    return nodes
+
+
+def parse_label(text: str) -> List[LabelIngredient]:
+    """Parse label text into a list of top-level ingredients with their sub-ingredient trees"""
+    text = _LABEL_PREFIX_RE.sub("", text or "")
+    items, _ = _split(text, 0, False)
+    return _build(items)
+
+
+def label_entries(text: str) -> List[Tuple[str, Dict[str, Any]]]:
+    """Leaf ingredients of a label, in label order, with their annotations.
+
+    Annotations hold percent, max_percent, e_number, function and note when known, and
+    part_of: the top-level compound ingredient a leaf was listed under.
+    """
+    entries: List[Tuple[str, Dict[str, Any]]] = []
+
+    def walk(node: LabelIngredient, part_of: Optional[str], max_percent: Optional[float]) -> None:
+        max_percent = node.max_percent if node.max_percent is not None else max_percent
+        if node.children:
+            for child in node.children:
+                walk(child, part_of or node.name, max_percent)
+            return
+        notes: Dict[str, Any] = {}
+        for key, value in (("part_of", part_of), ("percent", node.percent), ("max_percent", max_percent),
+                           ("e_number", node.e_number), ("function", node.function), ("note", node.note)):
+            if value is not None:
+                notes[key] = value
+        entries.append((node.name, notes))
+
+    for node in parse_label(text):
+        walk(node, None, None)
+    return entries
+
+
+def ingredient_names(text: str) -> List[str]:
+    """Names of the ingredients to assess: the leaves of the label tree"""
+    return [name for name, _ in label_entries(text)]
@@ -0,0 +1,308 @@
+"""
+Typed intermediate representation for the analysis pipeline.
+
+Upstream lookups produce these compact slotted records instead of pre-formatted
+text blocks. They are cheap to cache and to pass between stages, and are only
+rendered into prompt text by the render() methods at the final step.
+"""
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+NOVA_GROUPS = {"1", "2", "3", "4"}
+
+
+def _bullets(items: List[str], empty: str) -> str:
+    return "\n".join(f"• {item}" for item in items) if items else f"• {empty}"
+
+
+@dataclass(slots=True)
+class SearchSnippet:
+    """One search result extracted from a SerpAPI response"""
+    kind: str  # organic, authoritative, direct, related or news
+    title: str
+    snippet: str
+    url: str = ""
+    position: int = 0
+    date: str = ""
+    source: str = ""
+
+    def render(self) -> str:
+        if self.kind == "authoritative":
+            return f"[AUTHORITATIVE] {self.title}: {self.snippet}"
+        if self.kind == "direct":
+            return f"[DIRECT ANSWER] {self.snippet}"
+        if self.kind == "related":
+            return f"[RELATED] Q: {self.title} A: {self.snippet}"
+        if self.kind == "news":
+            return f"[NEWS {self.date}] {self.source}: {self.title} - {self.snippet}"
+        return f"[{self.position}] {self.title}\n   Summary: {self.snippet}\n   Source: {self.url}"
+
+
+def render_snippets(query: str, snippets: List[SearchSnippet]) -> str:
+    return "\n\n".join(s.render() for s in snippets) if snippets else f"No comprehensive results found for: {query}"
+
+
+@dataclass(slots=True)
+class ResearchSection:
+    """Results of one search angle (health, safety, official, ...) for a component"""
+    search_type: str
+    query: str
+    snippets: List[SearchSnippet]
+
+    def render(self) -> str:
+        return f"=== {self.search_type.upper()} RESEARCH ===\n{render_snippets(self.query, self.snippets)}"
+
+
+@dataclass(slots=True)
+class ComponentResearch:
+    """Multi-angle research gathered for a single component"""
+    component: str
+    sections: List[ResearchSection] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ComponentResearch":
+        return cls(data["component"], [
+            ResearchSection(sec["search_type"], sec["query"], [SearchSnippet(**snip) for snip in sec["snippets"]])
+            for sec in data.get("sections", [])
+        ])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def render(self) -> str:
+        if not self.sections:
+            return f"No detailed research available for {self.component}"
+        return "\n\n".join(section.render() for section in self.sections)
+
+
+@dataclass(slots=True)
+class Nutrient:
+    name: str
+    amount: float
+    unit: str
+
+    def render(self) -> str:
+        return f"{self.name}: {self.amount} {self.unit}"
+
+
+@dataclass(slots=True)
+class UsdaFood:
+    """Best USDA FoodData Central match for a query"""
+    description: str
+    fdc_id: Any
+    ingredients: List[str] = field(default_factory=list)
+    additives: List[str] = field(default_factory=list)
+    nutrients: List[Nutrient] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UsdaFood":
+        return cls(data["description"], data["fdc_id"], list(data.get("ingredients", [])),
+                   list(data.get("additives", [])), [Nutrient(**n) for n in data.get("nutrients", [])])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def render(self) -> str:
+        return f"""=== USDA FOODDATA CENTRAL ANALYSIS ===
+Food: {self.description}
+Database ID: {self.fdc_id}
+
+INGREDIENTS LIST:
+{_bullets(self.ingredients[:15], "No detailed ingredients available")}
+
+ADDITIVES & PRESERVATIVES:
+{_bullets(self.additives, "No specific additives identified")}
+
+KEY NUTRIENTS OF CONCERN:
+{_bullets([n.render() for n in self.nutrients], "No concerning nutrient levels identified")}
+
+ADDITIONAL USDA DATA AVAILABLE:
+• Complete nutrient profile
+• Manufacturing details
+• Brand information (if applicable)
+• Preparation methods"""
+
+
+@dataclass(slots=True)
+class OpenFoodFactsProduct:
+    """One OpenFoodFacts product record"""
+    product_name: str
+    brands: str
+    barcode: str
+    ingredients_text: str = ""
+    additives: List[str] = field(default_factory=list)
+    allergens: List[str] = field(default_factory=list)
+    additives_tags: List[str] = field(default_factory=list)
+    nutrition_score: Any = "Unknown"
+    nova_group: Any = "Unknown"
+    ecoscore: Any = "Unknown"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "OpenFoodFactsProduct":
+        return cls(**data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    def render(self, index: int) -> str:
+        return f"""--- OPENFOODFACTS PRODUCT {index} ---
+Product: {self.product_name}
+Brand(s): {self.brands}
+Barcode: {self.barcode}
+
+COMPLETE INGREDIENTS LIST:
+{self.ingredients_text if self.ingredients_text else '• No ingredients data available'}
+
+IDENTIFIED ADDITIVES:
+{_bullets(self.additives, "No additives identified")}
+
+ALLERGENS:
+{_bullets(self.allergens, "No allergens identified")}
+
+QUALITY SCORES:
+• Nutrition Score: {self.nutrition_score} (A=best, E=worst)
+• NOVA Group: {self.nova_group} (1=unprocessed, 4=ultra-processed)
+• Eco Score: {self.ecoscore} (A=best environmental impact, E=worst)"""
+
+
+def render_openfoodfacts(query: str, products: List[OpenFoodFactsProduct], products_found: int) -> str:
+    analyses = "\n".join(product.render(i + 1) for i, product in enumerate(products))
+    return f"""=== OPENFOODFACTS DATABASE ANALYSIS ===
+Search Query: {query}
+Products Found: {products_found}
+Products Analyzed: {len(products)}
+
+{analyses}
+
+OPENFOODFACTS DATA ADVANTAGES:
+• Real consumer product data
+• Detailed additive identification
+• Processing level classification (NOVA)
+• Community-verified ingredients
+• Global product coverage"""
+
+
+@dataclass(slots=True)
+class DatabaseAnalysis:
+    """Combined USDA + OpenFoodFacts lookup for one ingredient"""
+    query: str
+    usda: Optional[UsdaFood] = None
+    usda_error: Optional[str] = None
+    off_products: List[OpenFoodFactsProduct] = field(default_factory=list)
+    off_products_found: int = 0
+    off_error: Optional[str] = None
+
+    @property
+    def has_data(self) -> bool:
+        return self.usda is not None or bool(self.off_products)
+
+    def nova_group(self) -> Optional[str]:
+        """First known NOVA group among the matched OpenFoodFacts products"""
+        for product in self.off_products:
+            if str(product.nova_group) in NOVA_GROUPS:
+                return str(product.nova_group)
+        return None
+
+    def render(self) -> str:
+        text = f"=== COMBINED DATABASE ANALYSIS FOR: {self.query.upper()} ===\n\n"
+        if self.usda is not None:
+            text += f"{self.usda.render()}\n\n"
+        if self.off_products:
+            text += f"{render_openfoodfacts(self.query, self.off_products, self.off_products_found)}\n\n"
+        text += """
+=== DATABASE COVERAGE SUMMARY ===
+• USDA: Official US government nutrition database
+• OpenFoodFacts: Global crowdsourced product database
+• Combined: Maximum ingredient and additive identification
+• Sources: Government + community verification
+"""
+        return text.strip()
+
+
+@dataclass(slots=True)
+class Component:
+    name: str
+    type: str = ""
+    description: str = ""
+
+
+@dataclass(slots=True)
+class IngredientBreakdown:
+    """Chemical makeup and sub-ingredients of one ingredient"""
+    ingredient: str
+    components: List[Component] = field(default_factory=list)
+    processing_chemicals: List[str] = field(default_factory=list)
+    potential_concerns: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, ingredient: str, data: Dict[str, Any]) -> "IngredientBreakdown":
+        components = []
+        for comp in data.get("components") or []:
+            if isinstance(comp, dict) and comp.get("name"):
+                components.append(Component(str(comp["name"]), str(comp.get("type", "")), str(comp.get("description", ""))))
+            elif isinstance(comp, str):
+                components.append(Component(comp))
+        return cls(
+            ingredient=str(data.get("ingredient") or ingredient),
+            components=components,
+            processing_chemicals=[str(c) for c in data.get("processing_chemicals") or []],
+            potential_concerns=[str(c) for c in data.get("potential_concerns") or []],
+        )
+
+    def research_targets(self) -> List[str]:
+        """Component names in the order they should be researched"""
+        return [c.name for c in self.components] + self.processing_chemicals + self.potential_concerns
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "ingredient": self.ingredient,
+            "components": [{"name": c.name, "type": c.type, "description": c.description} for c in self.components],
+            "processing_chemicals": self.processing_chemicals,
+            "potential_concerns": self.potential_concerns,
+        }
+
+    def render(self) -> str:
+        return f"Ingredient breakdown: {json.dumps(self.to_dict())}"
+
+
+@dataclass(slots=True)
+class RiskResult:
+    """Carcinogen risk assessment for one ingredient.
+
+    Fields left as None were not provided by the model; fill_missing_with_known
+    fills them from the static knowledge base or with "unknown".
+    """
+    name: str
+    risk_level: Optional[str] = None
+    score: Any = None
+    source: Optional[str] = None
+    explanation: Optional[str] = None
+    nova_group: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], name: str = "") -> "RiskResult":
+        nova_group = data.get("nova_group")
+        return cls(
+            name=str(data.get("name") or name),
+            risk_level=data.get("risk_level"),
+            score=data.get("score"),
+            source=data.get("source"),
+            explanation=data.get("explanation"),
+            nova_group=str(nova_group) if nova_group not in (None, "", "null") else None,
+        )
+
+    @classmethod
+    def failed(cls, name: str, explanation: str) -> "RiskResult":
+        return cls(name=name, risk_level="unknown", score="unknown", source="N/A", explanation=explanation)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "risk_level": self.risk_level,
+            "score": self.score,
+            "source": self.source,
+            "explanation": self.explanation,
+            "nova_group": self.nova_group,
+        }
+
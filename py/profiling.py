@@ -0,0 +1,195 @@
+"""
+On-demand profiling of the running server.
+
+- sample_stacks(): wall-clock sampling of every thread's Python stack via
+  sys._current_frames(). Returned as collapsed stacks ("frame;frame;frame count"),
+  which flamegraph.pl, speedscope and inferno read directly, or as a table of
+  the hottest functions (self and inclusive sample counts).
+- memory_report(): tracemalloc snapshot, diffed against the previous one so
+  growth between two calls stands out.
+- profile_call(): cProfile around a single call (the `profile=1` request mode).
+
+Only one CPU profile (sampled or cProfile) runs at a time; overlapping requests
+get ProfilerBusy.
+"""
+import contextvars
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MAX_SAMPLE_SECONDS = 60
+
+# Leaf frames of threads that are parked, not working
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running"""
+
+
+# True inside profile_call(); code that would fan out to other threads runs inline instead
+in_profile_call: contextvars.ContextVar = contextvars.ContextVar("in_profile_call", default=False)
+
+
+_cpu_lock = threading.Lock()
+_memory_lock = threading.Lock()
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    short = "/".join(path.replace("\\", "/").split("/")[-2:]) if "site-packages" in path else os.path.basename(path)
+    return f"{code.co_name} ({short}:{code.co_firstlineno})"
+
+
+def _thread_label(name: str) -> str:
+    # Pool threads (batch_0, batch_1, ...) are merged into one root
+    return re.sub(r"[_-]?\d+$", "", name) or name
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, include_idle: bool = False) -> Tuple[Counter, int]:
+    """Sample all threads for `seconds`. Returns (collapsed stack -> samples, number of sampling rounds)"""
+    seconds = min(max(seconds, 0.1), MAX_SAMPLE_SECONDS)
+    if not _cpu_lock.acquire(blocking=False):
+        raise ProfilerBusy("a CPU profile is already running")
+    try:
+        own = threading.get_ident()
+        stacks: Counter = Counter()
+        rounds = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                frames.append(_thread_label(names.get(ident, str(ident))))
+                stacks[";".join(reversed(frames))] += 1
+            rounds += 1
+            time.sleep(interval)
+        return stacks, rounds
+    finally:
+        _cpu_lock.release()
+
+
+def collapsed(stacks: Counter) -> str:
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n"
+
+
+def top_functions(stacks: Counter, limit: int = 30) -> List[Dict[str, Any]]:
+    """Hottest functions: samples where they were the leaf (self) and anywhere on the stack (total)"""
+    own: Counter = Counter()
+    total: Counter = Counter()
+    samples = sum(stacks.values()) or 1
+    for stack, count in stacks.items():
+        frames = stack.split(";")[1:]
+        if frames:
+            own[frames[-1]] += count
+        for frame in set(frames):
+            total[frame] += count
+    return [
+        {"function": name, "self": own[name], "total": count,
+         "self_pct": round(100 * own[name] / samples, 1), "total_pct": round(100 * count / samples, 1)}
+        for name, count in sorted(total.items(), key=lambda item: (own[item[0]], item[1]), reverse=True)[:limit]
+    ]
+
+
+def start_tracemalloc(frames: int = 25) -> bool:
+    """Start tracing allocations. Returns False if it was already tracing"""
+    global _last_snapshot
+    with _memory_lock:
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(frames)
+        _last_snapshot = None
+        return True
+
+
+def stop_tracemalloc() -> None:
+    global _last_snapshot
+    with _memory_lock:
+        tracemalloc.stop()
+        _last_snapshot = None
+
+
+def _location(stat, group_by: str) -> Any:
+    if group_by == "traceback":
+        return [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+    frame = stat.traceback[0]
+    return frame.filename if group_by == "filename" else f"{frame.filename}:{frame.lineno}"
+
+
+def memory_report(limit: int = 30, group_by: str = "lineno", diff: bool = True) -> Dict[str, Any]:
+    """Top allocation sites now, or their growth since the previous report when diff is set"""
+    global _last_snapshot
+    with _memory_lock:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        report: Dict[str, Any] = {"traced_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1), "group_by": group_by}
+        if diff and _last_snapshot is not None:
+            report["diff"] = True
+            report["top"] = [
+                {"location": _location(stat, group_by), "size_kb": round(stat.size / 1024, 1),
+                 "size_diff_kb": round(stat.size_diff / 1024, 1), "count": stat.count, "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(_last_snapshot, group_by)[:limit]
+            ]
+        else:
+            report["diff"] = False
+            report["top"] = [
+                {"location": _location(stat, group_by), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics(group_by)[:limit]
+            ]
+        _last_snapshot = snapshot
+        return report
+
+
+def profile_call(fn: Callable[..., Any], *args, limit: int = 30, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+    """Run fn under cProfile. Returns (result, profile summary sorted by cumulative time)"""
+    if not _cpu_lock.acquire(blocking=False):
+        raise ProfilerBusy("a CPU profile is already running")
+    try:
+        profiler = cProfile.Profile()
+        token = in_profile_call.set(True)
+        started = time.perf_counter()
+        try:
+            result = profiler.runcall(fn, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_profile_call.reset(token)
+    finally:
+        _cpu_lock.release()
+    stats = pstats.Stats(profiler)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return result, {
+        "total_seconds": round(elapsed, 4),
+        "top": [
+            {"function": f"{func} ({os.path.basename(filename)}:{line})", "calls": calls,
+             "self_seconds": round(tottime, 4), "cumulative_seconds": round(cumtime, 4)}
+            for (filename, line, func), (_, calls, tottime, cumtime, _) in rows
+        ],
+    }
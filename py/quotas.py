@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Per-client API keys, token-bucket quotas and usage accounting.
+
+Quotas are measured in upstream cost units (1 unit = 1 upstream API call by
+default). Every upstream call attempt made while serving a request is charged to
+the requesting client's token bucket as it happens, so streamed and batch
+responses are accounted exactly. A client whose bucket is empty is refused with
+429 + Retry-After until it refills, and requests whose estimated cost does not
+fit the bucket are refused up front. Background work (cache refreshes, warm-up)
+is not charged to anyone. A background job can instead run under an
+UpstreamBudget (upstream_budget), which refuses the first call it cannot pay for.
+
+Metering is off unless QUOTA_ENABLED is set. Clients without a key share per-IP
+anonymous buckets unless API_KEYS_REQUIRED is set; the web frontend sends its
+own key (FOODSAFE_API_KEY) so its users do not share the server's IP bucket. Usage counters are kept in memory and written to SQLite in batches.
+
+Keys are managed with:
+
+    python quotas.py add-key --client acme --rate 5 --burst 2000
+    python quotas.py list-keys
+    python quotas.py revoke --client acme
+    python quotas.py usage --days 7
+"""
+import argparse
+import contextvars
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+QUOTA_ENABLED = os.getenv("QUOTA_ENABLED", "false").lower() == "true"  # Off by default: the web frontend calls without a key
+API_KEYS_REQUIRED = os.getenv("API_KEYS_REQUIRED", "false").lower() == "true"  # Refuse requests without a valid key
+ANONYMOUS_RATE = float(os.getenv("ANONYMOUS_RATE", "1"))  # Cost units per second refilled for each anonymous IP
+ANONYMOUS_BURST = float(os.getenv("ANONYMOUS_BURST", "300"))  # Bucket size for each anonymous IP
+DEFAULT_KEY_RATE = float(os.getenv("DEFAULT_KEY_RATE", "5"))  # Defaults for new keys
+DEFAULT_KEY_BURST = float(os.getenv("DEFAULT_KEY_BURST", "2000"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "10"))  # Seconds between batched usage writes
+QUOTA_DB_PATH = os.getenv("ANALYSIS_DB_PATH", str(Path(__file__).resolve().parent / "analysis_log.db"))
+
+# Cost units per upstream call attempt
+UPSTREAM_COSTS: Dict[str, float] = {"openai": 1.0, "serpapi": 1.0, "usda": 1.0, "openfoodfacts": 1.0}
+# Pessimistic cost of researching one ingredient or component (5 searches), and of assessing one uncached
+# ingredient: breakdown + assessment + research for it and up to 5 components
+ESTIMATED_RESEARCH_COST = 5
+ESTIMATED_INGREDIENT_COST = 2 + ESTIMATED_RESEARCH_COST * 6
+
+request_account: contextvars.ContextVar = contextvars.ContextVar("request_account", default=None)
+# Cost budget of the background job running in this context (the cache warm-up), if any
+upstream_budget: contextvars.ContextVar = contextvars.ContextVar("upstream_budget", default=None)
+
+
+class BudgetExhausted(Exception):
+    """Raised instead of making an upstream call the current job's budget cannot pay for"""
+
+
+class UpstreamBudget:
+    """A job's cost budget, charged per upstream call attempt like a quota but never refilled"""
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.spent = 0.0
+        self.refused = False
+        self._lock = threading.Lock()
+
+    def try_spend(self, units: float) -> bool:
+        """Spend units if they fit; once something did not fit, the budget is marked refused"""
+        with self._lock:
+            if self.spent + units > self.limit:
+                self.refused = True
+                return False
+            self.spent += units
+            return True
+
+    def charge(self, upstream: str) -> None:
+        if not self.try_spend(UPSTREAM_COSTS.get(upstream, 1.0)):
+            raise BudgetExhausted(f"Upstream budget of {self.limit:g} units exhausted before a {upstream} call")
+
+
+class TokenBucket:
+    """Refills at `rate` units/second up to `capacity`; may go into debt by one request's overshoot"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def charge(self, units: float) -> None:
+        with self._lock:
+            self._refill()
+            self.tokens -= units
+
+    def wait_time(self, units: float) -> float:
+        """Seconds until `units` (at most the capacity) are available; 0 when they are now"""
+        with self._lock:
+            self._refill()
+            missing = min(units, self.capacity) - self.tokens
+            if missing <= 0:
+                return 0.0
+            return missing / self.rate if self.rate > 0 else float("inf")
+
+    def level(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+class ClientAccount:
+    __slots__ = ("client_id", "bucket", "keyed")
+
+    def __init__(self, client_id: str, bucket: TokenBucket, keyed: bool):
+        self.client_id = client_id
+        self.bucket = bucket
+        self.keyed = keyed
+
+
+def hash_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class QuotaManager:
+    """API key lookup, per-client buckets and batched usage counters"""
+
+    def __init__(self, db_path: str, key_reload_interval: float = 60.0):
+        self.db_path = db_path
+        self.key_reload_interval = key_reload_interval
+        self._lock = threading.Lock()
+        self._keys: Dict[str, Tuple[str, float, float]] = {}
+        self._keys_loaded = 0.0
+        self._accounts: Dict[str, ClientAccount] = {}
+        self._pending: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        if not self._initialized:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS api_keys (
+                    key_hash TEXT PRIMARY KEY,
+                    client_id TEXT NOT NULL,
+                    rate REAL NOT NULL,
+                    burst REAL NOT NULL,
+                    created_at TEXT NOT NULL,
+                    revoked INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS client_usage (
+                    client_id TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    requests INTEGER NOT NULL DEFAULT 0,
+                    cost_units REAL NOT NULL DEFAULT 0,
+                    calls TEXT NOT NULL DEFAULT '{}',
+                    PRIMARY KEY (client_id, day)
+                );
+            """)
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    # --- keys -------------------------------------------------------------
+
+    def _load_keys(self) -> None:
+        if time.monotonic() - self._keys_loaded < self.key_reload_interval:
+            return
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT key_hash, client_id, rate, burst FROM api_keys WHERE revoked = 0").fetchall()
+        finally:
+            conn.close()
+        self._keys = {row[0]: (row[1], row[2], row[3]) for row in rows}
+        self._keys_loaded = time.monotonic()
+
+    def add_key(self, client_id: str, rate: float = DEFAULT_KEY_RATE, burst: float = DEFAULT_KEY_BURST) -> str:
+        """Create a key for client_id and return it (only its hash is stored)"""
+        api_key = f"fsk_{secrets.token_urlsafe(24)}"
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO api_keys (key_hash, client_id, rate, burst, created_at) VALUES (?, ?, ?, ?, ?)",
+                (hash_key(api_key), client_id, rate, burst, datetime.utcnow().isoformat()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        self._keys_loaded = 0.0
+        return api_key
+
+    def revoke(self, client_id: str) -> int:
+        conn = self._connect()
+        try:
+            cur = conn.execute("UPDATE api_keys SET revoked = 1 WHERE client_id = ? AND revoked = 0", (client_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        self._keys_loaded = 0.0
+        return cur.rowcount
+
+    def list_keys(self) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT client_id, rate, burst, created_at, revoked FROM api_keys ORDER BY created_at"
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(zip(("client_id", "rate", "burst", "created_at", "revoked"), row)) for row in rows]
+
+    def authenticate(self, api_key: Optional[str], remote_addr: str) -> Optional[ClientAccount]:
+        """Account for the request; None when the key is invalid or a key is required but missing"""
+        if api_key:
+            with self._lock:
+                self._load_keys()
+                entry = self._keys.get(hash_key(api_key))
+            if entry is None:
+                return None
+            client_id, rate, burst = entry
+            return self._account(client_id, rate, burst, keyed=True)
+        if API_KEYS_REQUIRED:
+            return None
+        return self._account(f"anon:{remote_addr}", ANONYMOUS_RATE, ANONYMOUS_BURST, keyed=False)
+
+    def _account(self, client_id: str, rate: float, burst: float, keyed: bool) -> ClientAccount:
+        with self._lock:
+            account = self._accounts.get(client_id)
+            if account is None or (account.bucket.rate, account.bucket.capacity) != (rate, burst):
+                bucket = TokenBucket(rate, burst)
+                if account is not None:
+                    bucket.tokens = min(burst, account.bucket.level())
+                account = ClientAccount(client_id, bucket, keyed)
+                self._accounts[client_id] = account
+            return account
+
+    # --- usage ------------------------------------------------------------
+
+    def _usage_row(self, client_id: str) -> Dict[str, float]:
+        key = (client_id, datetime.utcnow().strftime("%Y-%m-%d"))
+        return self._pending.setdefault(key, {"requests": 0, "cost_units": 0.0})
+
+    def record_request(self, account: ClientAccount) -> None:
+        with self._lock:
+            self._usage_row(account.client_id)["requests"] += 1
+
+    def charge(self, account: ClientAccount, upstream: str) -> None:
+        units = UPSTREAM_COSTS.get(upstream, 1.0)
+        account.bucket.charge(units)
+        with self._lock:
+            row = self._usage_row(account.client_id)
+            row["cost_units"] += units
+            row[upstream] = row.get(upstream, 0) + 1
+
+    def flush(self) -> int:
+        """Write the accumulated counters in one transaction. Returns the rows written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        conn = self._connect()
+        try:
+            # Write lock up front: another worker's flush cannot merge calls between our read and write
+            conn.execute("BEGIN IMMEDIATE")
+            for (client_id, day), row in pending.items():
+                existing = conn.execute(
+                    "SELECT calls FROM client_usage WHERE client_id = ? AND day = ?", (client_id, day)
+                ).fetchone()
+                calls = json.loads(existing[0]) if existing else {}
+                for upstream in UPSTREAM_COSTS:
+                    if upstream in row:
+                        calls[upstream] = calls.get(upstream, 0) + row[upstream]
+                conn.execute(
+                    "INSERT INTO client_usage (client_id, day, requests, cost_units, calls) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (client_id, day) DO UPDATE SET requests = requests + excluded.requests, "
+                    "cost_units = cost_units + excluded.cost_units, calls = excluded.calls",
+                    (client_id, day, int(row["requests"]), row["cost_units"], json.dumps(calls)),
+                )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Usage flush failed, keeping counters for the next flush: {e}")
+            with self._lock:
+                for key, row in pending.items():
+                    current = self._pending.setdefault(key, {"requests": 0, "cost_units": 0.0})
+                    for field, value in row.items():
+                        current[field] = current.get(field, 0) + value
+            return 0
+        finally:
+            conn.close()
+        return len(pending)
+
+    def usage(self, client_id: Optional[str] = None, days: int = 30) -> List[Dict[str, Any]]:
+        self.flush()
+        conn = self._connect()
+        try:
+            query = "SELECT client_id, day, requests, cost_units, calls FROM client_usage"
+            params: tuple = ()
+            if client_id is not None:
+                query += " WHERE client_id = ?"
+                params = (client_id,)
+            rows = conn.execute(query + " ORDER BY day DESC, cost_units DESC", params).fetchall()
+        finally:
+            conn.close()
+        cutoff = datetime.utcfromtimestamp(time.time() - days * 86400).strftime("%Y-%m-%d")
+        return [
+            {"client_id": r[0], "day": r[1], "requests": r[2], "cost_units": round(r[3], 2), "calls": json.loads(r[4])}
+            for r in rows if r[1] >= cutoff
+        ]
+
+    def start_flusher(self, interval: float = USAGE_FLUSH_INTERVAL) -> None:
+        if self._flusher is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.flush()
+
+        self._flusher = threading.Thread(target=loop, name="usage-flusher", daemon=True)
+        self._flusher.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": QUOTA_ENABLED,
+                "keys_required": API_KEYS_REQUIRED,
+                "active_clients": len(self._accounts),
+                "pending_usage_rows": len(self._pending),
+            }
+
+
+quota_manager = QuotaManager(QUOTA_DB_PATH)
+
+
+def charge_upstream_call(upstream: str) -> None:
+    """Charge one upstream call attempt to the current job's budget and the current request's client, if any.
+
+    Raises BudgetExhausted, before the call is made, when the job's budget cannot pay for it.
+    """
+    budget = upstream_budget.get()
+    if budget is not None:
+        budget.charge(upstream)
+    account = request_account.get()
+    if account is not None:
+        quota_manager.charge(account, upstream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FoodSafe AI API keys and usage")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("add-key", help="Create an API key for a client")
+    add.add_argument("--client", required=True)
+    add.add_argument("--rate", type=float, default=DEFAULT_KEY_RATE, help="Cost units refilled per second")
+    add.add_argument("--burst", type=float, default=DEFAULT_KEY_BURST, help="Bucket size in cost units")
+    revoke = sub.add_parser("revoke", help="Revoke every key of a client")
+    revoke.add_argument("--client", required=True)
+    sub.add_parser("list-keys", help="List clients and their quotas")
+    usage = sub.add_parser("usage", help="Show per-client usage")
+    usage.add_argument("--client", default=None)
+    usage.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    if args.command == "add-key":
+        print(quota_manager.add_key(args.client, args.rate, args.burst))
+    elif args.command == "revoke":
+        print(f"Revoked {quota_manager.revoke(args.client)} key(s)")
+    elif args.command == "list-keys":
+        print(json.dumps(quota_manager.list_keys(), indent=2))
+    elif args.command == "usage":
+        print(json.dumps(quota_manager.usage(args.client, args.days), indent=2))
@@ -1,43 +1,120 @@
 import requests
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from starlette.requests import ClientDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Union
+from typing import List, Dict, Any, AsyncIterator, Union, Callable, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import hashlib
+import hmac
 import json
+import math
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from fastapi import Body
+from urllib.parse import quote, urlencode
+from fastapi import Body, Query
 import os
 import time
 from dotenv import load_dotenv
-from openai import OpenAI
 from pathlib import Path
+from cache_backends import CacheBackend, create_cache_backend
+from completion_memo import fresh_completions, get_completion_memo, lookup as memo_lookup, remember as memo_remember, response_content
+from label_parser import ingredient_names, label_entries
+from json_stream import IncrementalJSONParser, first_json_object
+from snippet_index import SnippetIndex
+from stage_graph import InlineExecutor, Stage, arun_stages, run_stages
+from structured_breakdown import resolve_breakdown
+from admission import AdmissionController, Rejection, breaker_stats
+from profiling import ProfilerBusy, collapsed, in_profile_call, memory_report, profile_call, sample_stacks, start_tracemalloc, stop_tracemalloc, top_functions
+from quotas import ESTIMATED_INGREDIENT_COST, QUOTA_ENABLED, quota_manager, request_account
+from research_cache import SWRCache, normalize_key
+from scoring import IngredientTable, ProductScores, score_catalog
+from retry import (
+    acall_with_retry, call_with_retry, collect_failures, record_upstream_failure, request_deadline, retry_stats,
+)
+from scheduler import BATCH, INTERACTIVE, FairScheduler, request_client, request_priority, run_in_context
+from pipeline_types import (
+    ComponentResearch, DatabaseAnalysis, IngredientBreakdown, Nutrient, OpenFoodFactsProduct,
+    ResearchSection, RiskResult, SearchSnippet, UsdaFood, render_openfoodfacts, render_snippets,
+)
+
+_import_started = time.perf_counter()
 
 _dotenv_path = Path(__file__).resolve().parent / ".env"
 load_dotenv(dotenv_path=str(_dotenv_path))
 
-app = FastAPI()
-
-# CORS: allow local Next.js dev servers and production Vercel deployment
-allowed_origins = [
-    "http://localhost:300",
-    "http://127.0.0.1:300",
-    "http://localhost:3001",
-    "http://127.0.0.1:3001",
-]
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,
-    allow_origin_regex=r"https://.*\.vercel\.app",  # Allow all Vercel deployments
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # OpenAI configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
+
+# Model routing: a fast model screens each ingredient with a short context first;
+# OPENAI_MODEL with full web research is only used when the screening is uncertain.
+# Routing only applies when the two models differ: screening with OPENAI_MODEL itself
+# would add a call and hold back the research until the screening is done.
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")  # Screening model (set OPENAI_MODEL to the larger one)
+MODEL_ROUTING_ENABLED = (os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+                         and OPENAI_FAST_MODEL != OPENAI_MODEL)
+ROUTING_MIN_CONFIDENCE = float(os.getenv("ROUTING_MIN_CONFIDENCE", "0.7"))  # Escalate screenings less confident than this
+ROUTING_ESCALATE_BANDS = os.getenv("ROUTING_ESCALATE_BANDS", "31-60,61-80")  # Borderline score bands that always escalate
+
+# Startup configuration
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"  # Run warm-up hooks in the background at startup
+WARMUP_PRECONNECT = os.getenv("WARMUP_PRECONNECT", "false").lower() == "true"  # Open upstream TLS connections during warm-up
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))  # Max pooled connections per upstream host
+
+# Local snippet index: component research is answered from previously fetched snippets when coverage is sufficient
+SNIPPET_INDEX_ENABLED = os.getenv("SNIPPET_INDEX_ENABLED", "true").lower() == "true"
+SNIPPET_INDEX_PATH = os.getenv("SNIPPET_INDEX_PATH", str(Path(__file__).resolve().parent / "snippet_index.db"))
+SNIPPET_INDEX_MAX_AGE_DAYS = float(os.getenv("SNIPPET_INDEX_MAX_AGE_DAYS", "7"))  # Older snippets don't count; capped at RESEARCH_CACHE_TTL
+SNIPPET_INDEX_MIN_SNIPPETS = int(os.getenv("SNIPPET_INDEX_MIN_SNIPPETS", "15"))  # Fresh snippets needed to skip the network
+
+# Stage caches (seconds). Stale entries are served immediately and refreshed in the background.
+RESEARCH_CACHE_TTL = float(os.getenv("RESEARCH_CACHE_TTL", str(7 * 86400)))  # Multi-angle component research
+BREAKDOWN_CACHE_TTL = float(os.getenv("BREAKDOWN_CACHE_TTL", str(30 * 86400)))  # LLM component breakdowns
+DATABASE_CACHE_TTL = float(os.getenv("DATABASE_CACHE_TTL", str(7 * 86400)))  # USDA / OpenFoodFacts matches
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", str(86400)))  # "No USDA/OpenFoodFacts data found" misses
+ASSESSMENT_CACHE_TTL = float(os.getenv("ASSESSMENT_CACHE_TTL", str(30 * 86400)))  # Per-ingredient risk assessments
+CACHE_STALE_TTL = float(os.getenv("CACHE_STALE_TTL", str(30 * 86400)))  # How long past TTL a stale entry may still be served
+CACHE_VERSION_SALT = os.getenv("CACHE_VERSION_SALT", "")  # Change to force a new cache version manually
+CACHE_VERSIONS_KEPT = int(os.getenv("CACHE_VERSIONS_KEPT", "2"))  # Previous versions still served during migration
+
+# Upstream scheduling: concurrent slots per upstream, shared by priority class with weighted fair sharing
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+SERPAPI_CONCURRENCY = int(os.getenv("SERPAPI_CONCURRENCY", "8"))
+INTERACTIVE_WEIGHT = float(os.getenv("INTERACTIVE_WEIGHT", "4"))  # Share of contended slots for interactive requests...
+BATCH_WEIGHT = float(os.getenv("BATCH_WEIGHT", "1"))  # ...versus batch work
+INTERACTIVE_RESERVED_SLOTS = int(os.getenv("INTERACTIVE_RESERVED_SLOTS", "2"))  # Slots per upstream batch work may never take
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "90"))  # Seconds per request; retries never back off past it
+OPENAI_QUEUE_TIMEOUT = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "120"))  # Max seconds a call waits for an OpenAI slot
+OPENAI_ASYNC = os.getenv("OPENAI_ASYNC", "true").lower() == "true"  # Serve /ingredients with the async OpenAI client
+STREAM_EARLY_FIELDS = ("risk_level", "score")  # Assessment fields sent to /ingredients/stream clients as soon as generated
+
+# Admission control at the /ingredients edge: excess requests are shed with 429/503 + Retry-After
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))  # Analysis requests processed at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))  # OpenAI calls waiting for a slot before shedding
+ADMISSION_BATCH_SHARE = float(os.getenv("ADMISSION_BATCH_SHARE", "0.5"))  # Fraction of both limits batch requests may use
+ADMISSION_RETRY_AFTER = float(os.getenv("ADMISSION_RETRY_AFTER", "5"))  # Retry-After (seconds) sent with 429s
+
+# Admin endpoints (/admin/profile/*, profile=1 on /ingredients) are disabled unless a key is set
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")  # Sent by admins as X-Admin-Key
+
+# Per-ingredient stage graph (database lookups, breakdown, context and research run concurrently)
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "32"))  # Threads shared by the stages of all in-flight ingredients
+
+# Batch mode
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # Distinct ingredients assessed in parallel
+BATCH_VALIDATION_CHUNK = int(os.getenv("BATCH_VALIDATION_CHUNK", "50"))  # Names per food-validation call
+NDJSON_CONCURRENCY = int(os.getenv("NDJSON_CONCURRENCY", "8"))  # Products of one NDJSON upload analyzed at once
+NDJSON_MAX_LINE_BYTES = int(os.getenv("NDJSON_MAX_LINE_BYTES", "65536"))  # Longer input lines are rejected
+
+# HTTP caching of GET /ingredients lookups by browsers, the Next.js server and CDNs
+INGREDIENT_HTTP_MAX_AGE = int(os.getenv("INGREDIENT_HTTP_MAX_AGE", "3600"))  # Seconds a lookup may be reused without revalidation
+INGREDIENT_HTTP_STALE = int(os.getenv("INGREDIENT_HTTP_STALE", "86400"))  # stale-while-revalidate window for CDNs
+INGREDIENT_MULTI_GET_MAX = int(os.getenv("INGREDIENT_MULTI_GET_MAX", "50"))  # Ids per multi-get request
 
 # Web search configuration (using free SerpAPI)
 SERPAPI_KEY = os.getenv("SERPAPI_KEY", "your_serpapi_key_here")  # Get free key from serpapi.com
@@ -51,82 +128,284 @@ USDA_BASE_URL = "https://api.nal.usda.gov/fdc/v1"
 OPENFOODFACTS_BASE_URL = "https://world.openfoodfacts.org/api/v2"
 OPENFOODFACTS_SEARCH_URL = "https://world.openfoodfacts.org/cgi/search.pl"
 
+# Shared upstream resources, created lazily on first use and reused across requests
+_resource_lock = threading.Lock()
+_http_session: Optional[requests.Session] = None
+_openai_client = None
+_async_openai_client = None
+_snippet_index: Optional[SnippetIndex] = None
+_stage_executor: Optional[ThreadPoolExecutor] = None
+
+research_cache = SWRCache(lambda: get_ingredient_cache(), "research", RESEARCH_CACHE_TTL, CACHE_STALE_TTL)
+breakdown_cache = SWRCache(lambda: get_ingredient_cache(), "breakdown", BREAKDOWN_CACHE_TTL, CACHE_STALE_TTL,
+                          versions_kept=CACHE_VERSIONS_KEPT)
+usda_cache = SWRCache(lambda: get_ingredient_cache(), "usda", DATABASE_CACHE_TTL, CACHE_STALE_TTL, NEGATIVE_CACHE_TTL)
+off_cache = SWRCache(lambda: get_ingredient_cache(), "off", DATABASE_CACHE_TTL, CACHE_STALE_TTL, NEGATIVE_CACHE_TTL)
+barcode_cache = SWRCache(lambda: get_ingredient_cache(), "barcode", DATABASE_CACHE_TTL, CACHE_STALE_TTL, NEGATIVE_CACHE_TTL)
+assessment_cache = SWRCache(lambda: get_ingredient_cache(), "assessment", ASSESSMENT_CACHE_TTL, CACHE_STALE_TTL,
+                           versions_kept=CACHE_VERSIONS_KEPT)
+
+_priority_weights = {INTERACTIVE: INTERACTIVE_WEIGHT, BATCH: BATCH_WEIGHT}
+openai_scheduler = FairScheduler("openai", OPENAI_CONCURRENCY, _priority_weights, INTERACTIVE_RESERVED_SLOTS)
+serpapi_scheduler = FairScheduler("serpapi", SERPAPI_CONCURRENCY, _priority_weights, INTERACTIVE_RESERVED_SLOTS)
+
+admission = AdmissionController(
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_BATCH_SHARE, ADMISSION_RETRY_AFTER,
+    queue_depth=lambda: openai_scheduler.waiting(), required_upstreams=["openai"],
+)
+
+routing_stats: Dict[str, int] = {
+    "breakdown_structured": 0, "breakdown_fast": 0, "breakdown_escalated": 0, "assessment_fast": 0, "assessment_escalated": 0,
+}
+
+def get_http_session() -> requests.Session:
+    """Return the process-wide pooled HTTP session used for all upstream APIs"""
+    global _http_session
+    if _http_session is None:
+        with _resource_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+def get_stage_executor() -> ThreadPoolExecutor:
+    """Return the process-wide pool that runs pipeline stages for the sync path"""
+    global _stage_executor
+    if _stage_executor is None:
+        with _resource_lock:
+            if _stage_executor is None:
+                _stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+    return _stage_executor
+
+def get_openai_client():
+    """Return the shared OpenAI client, or None when no API key is configured.
+
+    The openai package is imported here rather than at module level because it
+    dominates import time; the lifespan warm-up calls this off the request path.
+    """
+    global _openai_client
+    if _openai_client is None and OPENAI_API_KEY:
+        with _resource_lock:
+            if _openai_client is None:
+                from openai import OpenAI
+                _openai_client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)  # Retries are done by retry.py
+    return _openai_client
+
+def get_async_openai_client():
+    """Return the shared AsyncOpenAI client, or None when no API key is configured.
+
+    Async calls wait on OpenAI without holding a threadpool thread; they share
+    openai_scheduler's slots with the sync client.
+    """
+    global _async_openai_client
+    if _async_openai_client is None and OPENAI_API_KEY:
+        with _resource_lock:
+            if _async_openai_client is None:
+                from openai import AsyncOpenAI
+                _async_openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return _async_openai_client
+
+def fetch_web_snippets(query: str, search_type: str = "general") -> List[SearchSnippet]:
+    """Run one SerpAPI search and return the extracted results as structured snippets.
+
+    Raises on network or API errors; callers decide how to degrade.
+    """
+    url = "https://serpapi.com/search"
+    params = {
+        "q": query,
+        "api_key": SERPAPI_KEY,
+        "num": 10,  # Get top 10 results for comprehensive coverage
+        "hl": "en",
+        "gl": "us"
+    }
+    
+    def search():
+        with serpapi_scheduler.slot():
+            response = get_http_session().get(url, params=params, timeout=15)
+        response.raise_for_status()
+        return response.json()
+    
+    data = call_with_retry("serpapi", search)
+    
+    results: List[SearchSnippet] = []
+    
+    # Extract answer box if available (for direct answers)
+    if "answer_box" in data:
+        answer = data["answer_box"]
+        answer_text = answer.get("answer", "") or answer.get("snippet", "")
+        if answer_text:
+            results.append(SearchSnippet("direct", answer.get("title", ""), answer_text, answer.get("link", "")))
+    
+    # Extract knowledge graph if available (for authoritative info)
+    if "knowledge_graph" in data:
+        kg = data["knowledge_graph"]
+        title = kg.get("title", "")
+        description = kg.get("description", "")
+        if title and description:
+            results.append(SearchSnippet("authoritative", title, description, kg.get("source", {}).get("link", "")))
+    
+    # Extract organic results
+    for i, result in enumerate(data.get("organic_results", [])[:8]):
+        snippet = result.get("snippet", "")
+        
+        # Get additional snippet data if available
+        rich_snippet = result.get("rich_snippet", {})
+        if rich_snippet:
+            snippet += f" | Additional info: {rich_snippet.get('top', {}).get('detected_extensions', '')}"
+        
+        results.append(SearchSnippet("organic", result.get("title", ""), snippet, result.get("link", ""), position=i + 1))
+    
+    # Extract related questions for additional context
+    for rq in data.get("related_questions", [])[:3]:  # Top 3 related questions
+        question = rq.get("question", "")
+        snippet = rq.get("snippet", "")
+        if question and snippet:
+            results.append(SearchSnippet("related", question, snippet, rq.get("link", "")))
+    
+    # Extract news results if searching for recent information
+    if search_type == "recent":
+        for news in data.get("news_results", [])[:3]:
+            results.append(SearchSnippet(
+                "news", news.get("title", ""), news.get("snippet", ""), news.get("link", ""),
+                date=news.get("date", ""), source=str(news.get("source", "")),
+            ))
+    
+    return results
+
+def chat_completion(**kwargs):
+    """Create an OpenAI chat completion within the scheduler's capacity for this request's priority.
+
+    Identical requests are answered from the completion memo (see completion_memo.py).
+    """
+    key, memoized = memo_lookup(kwargs)
+    if memoized is not None:
+        return memoized
+    openai_client = get_openai_client()
+    if not openai_client:
+        raise RuntimeError("OPENAI_API_KEY is not configured")
+    def create():
+        # The slot is released between attempts so backoff does not hold capacity
+        with openai_scheduler.slot(timeout=OPENAI_QUEUE_TIMEOUT):
+            return openai_client.chat.completions.create(**kwargs)
+    response = call_with_retry("openai", create)
+    memo_remember(key, kwargs, response_content(response))
+    return response
+
+async def achat_completion(**kwargs):
+    """Async chat_completion: waits for a scheduler slot and for OpenAI without holding a thread"""
+    key, memoized = await asyncio.to_thread(memo_lookup, kwargs)
+    if memoized is not None:
+        return memoized
+    openai_client = get_async_openai_client()
+    if not openai_client:
+        raise RuntimeError("OPENAI_API_KEY is not configured")
+    async def create():
+        async with openai_scheduler.aslot(timeout=OPENAI_QUEUE_TIMEOUT):
+            return await openai_client.chat.completions.create(**kwargs)
+    response = await acall_with_retry("openai", create)
+    await asyncio.to_thread(memo_remember, key, kwargs, response_content(response))
+    return response
+
+async def astream_json_completion(on_field: Callable[[str, Any], None], **kwargs) -> Optional[Dict[str, Any]]:
+    """Stream a JSON-mode completion, parsing it as tokens arrive.
+
+    on_field is called with each top-level scalar field as soon as it is complete.
+    Returns the object as soon as it closes (the rest of the stream is dropped), or
+    None if the stream ended without a complete object.
+    """
+    parser = IncrementalJSONParser()
+    key, memoized = await asyncio.to_thread(memo_lookup, kwargs)
+    if memoized is not None:
+        # A memoized answer is replayed through the parser so on_field sees the same fields
+        for field, value in parser.feed(memoized.choices[0].message.content).items():
+            on_field(field, value)
+        return parser.value()
+    openai_client = get_async_openai_client()
+    if not openai_client:
+        raise RuntimeError("OPENAI_API_KEY is not configured")
+    async def open_stream():
+        # Each attempt takes its own slot, so backoff does not hold capacity; the slot of
+        # the attempt that opened the stream is kept until the stream has been consumed
+        cls = await openai_scheduler.acquire_async(timeout=OPENAI_QUEUE_TIMEOUT)
+        try:
+            return cls, await openai_client.chat.completions.create(stream=True, **kwargs)
+        except BaseException:
+            openai_scheduler.release(cls)
+            raise
+    text = []
+    # Only opening the stream is retried: once fields were reported, a replay could contradict them
+    cls, stream = await acall_with_retry("openai", open_stream)
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            text.append(delta)
+            for field, value in parser.feed(delta).items():
+                on_field(field, value)
+            if parser.done:
+                break
+    finally:
+        try:
+            await stream.close()
+        finally:
+            openai_scheduler.release(cls)
+    if parser.done:
+        await asyncio.to_thread(memo_remember, key, kwargs, "".join(text))
+    return parser.value()
+
+def get_snippet_index() -> Optional[SnippetIndex]:
+    """Return the shared research snippet index, or None when disabled"""
+    global _snippet_index
+    if _snippet_index is None and SNIPPET_INDEX_ENABLED:
+        with _resource_lock:
+            if _snippet_index is None:
+                _snippet_index = SnippetIndex(SNIPPET_INDEX_PATH)
+    return _snippet_index
+
 def search_web_serpapi(query: str, search_type: str = "general") -> str:
     """Enhanced web search using SerpAPI for comprehensive real-time information"""
     if not SERPAPI_KEY or SERPAPI_KEY == "your_serpapi_key_here":
         return f"Search query: {query} (API key not configured)"
     
     try:
-        url = "https://serpapi.com/search"
-        params = {
-            "q": query,
-            "api_key": SERPAPI_KEY,
-            "num": 10,  # Get top 10 results for comprehensive coverage
-            "hl": "en",
-            "gl": "us"
-        }
-        
-        response = requests.get(url, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Enhanced result extraction with more detail
-        results = []
-        
-        # Extract organic results
-        if "organic_results" in data:
-            for i, result in enumerate(data["organic_results"][:8]):
-                title = result.get("title", "")
-                snippet = result.get("snippet", "")
-                link = result.get("link", "")
-                
-                # Get additional snippet data if available
-                rich_snippet = result.get("rich_snippet", {})
-                if rich_snippet:
-                    snippet += f" | Additional info: {rich_snippet.get('top', {}).get('detected_extensions', '')}"
-                
-                results.append(f"[{i+1}] {title}\n   Summary: {snippet}\n   Source: {link}")
-        
-        # Extract knowledge graph if available (for authoritative info)
-        if "knowledge_graph" in data:
-            kg = data["knowledge_graph"]
-            title = kg.get("title", "")
-            description = kg.get("description", "")
-            if title and description:
-                results.insert(0, f"[AUTHORITATIVE] {title}: {description}")
-        
-        # Extract answer box if available (for direct answers)
-        if "answer_box" in data:
-            answer = data["answer_box"]
-            answer_text = answer.get("answer", "") or answer.get("snippet", "")
-            if answer_text:
-                results.insert(0, f"[DIRECT ANSWER] {answer_text}")
-        
-        # Extract related questions for additional context
-        if "related_questions" in data:
-            related = data["related_questions"][:3]  # Top 3 related questions
-            for rq in related:
-                question = rq.get("question", "")
-                snippet = rq.get("snippet", "")
-                if question and snippet:
-                    results.append(f"[RELATED] Q: {question} A: {snippet}")
-        
-        # Extract news results if searching for recent information
-        if "news_results" in data and search_type == "recent":
-            for news in data["news_results"][:3]:
-                title = news.get("title", "")
-                snippet = news.get("snippet", "")
-                date = news.get("date", "")
-                source = news.get("source", "")
-                results.append(f"[NEWS {date}] {source}: {title} - {snippet}")
-        
-        return "\n\n".join(results) if results else f"No comprehensive results found for: {query}"
-        
+        return render_snippets(query, fetch_web_snippets(query, search_type))
     except Exception as e:
         print(f"Enhanced web search error for '{query}': {e}")
+        record_upstream_failure("serpapi", e)
         return f"Search query: {query} (enhanced search failed: {str(e)})"
 
-def perform_multi_angle_search(component: str) -> str:
+def web_search_enabled() -> bool:
+    return USE_WEB_SEARCH and bool(SERPAPI_KEY) and SERPAPI_KEY != "your_serpapi_key_here"
+
+def research_component(component: str, refresh: bool = False) -> ComponentResearch:
+    """Multi-angle research for a component, cached by normalized component name.
+
+    A miss may be answered from the snippet index; revalidating an expired entry
+    and refresh=True always search the network, since the index only holds what
+    the expired entry was built from.
+    """
+    if not web_search_enabled():
+        return ComponentResearch(component)
+    fetch = lambda: _research_component_uncached(component, use_index=False).to_dict()
+    cacheable = lambda value: bool(value["sections"])
+    if refresh:
+        data = research_cache.refresh(normalize_key(component), fetch, cacheable=cacheable)
+    else:
+        data = research_cache.get_or_load(
+            normalize_key(component),
+            lambda: _research_component_uncached(component).to_dict(),
+            cacheable=cacheable,
+            revalidate=fetch,
+        )
+    research = ComponentResearch.from_dict(data)
+    research.component = component
+    return research
+
+def _research_component_uncached(component: str, use_index: bool = True) -> ComponentResearch:
     """Perform multiple targeted searches for comprehensive component analysis"""
     searches = [
         (f"{component} carcinogen cancer risk studies", "health"),
@@ -136,14 +415,42 @@ def perform_multi_angle_search(component: str) -> str:
         (f'"{component}" health risks recent studies 2023 2024', "recent")
     ]
     
-    all_results = []
+    research = ComponentResearch(component)
+    if not web_search_enabled():
+        return research
+    
+    # Answer from the local index when earlier searches already cover this component
+    index = get_snippet_index()
+    if index is not None and use_index:
+        # Coverage older than the research TTL would outlive the cache entry it rebuilds
+        max_age = min(SNIPPET_INDEX_MAX_AGE_DAYS * 86400, research_cache.ttl)
+        indexed = index.lookup_research(component, max_age, SNIPPET_INDEX_MIN_SNIPPETS)
+        if indexed is not None:
+            print(f"Research for {component} answered from snippet index")
+            return indexed
+    
     for search_query, search_type in searches:
         print(f"Searching: {search_query}")
-        result = search_web_serpapi(search_query, search_type)
-        if result and "api key not configured" not in result.lower():
-            all_results.append(f"=== {search_type.upper()} RESEARCH ===\n{result}")
+        try:
+            snippets = fetch_web_snippets(search_query, search_type)
+        except Exception as e:
+            print(f"Enhanced web search error for '{search_query}': {e}")
+            record_upstream_failure("serpapi", e)
+            continue
+        research.sections.append(ResearchSection(search_type, search_query, snippets))
+        if index is not None:
+            index.add(component, search_type, search_query, snippets)
     
-    return "\n\n".join(all_results) if all_results else f"No detailed research available for {component}"
+    return research
+
+def perform_multi_angle_search(component: str) -> str:
+    """Perform multiple targeted searches for comprehensive component analysis"""
+    return research_component(component).render()
+
+def _get_json(url: str, params: Dict[str, Any], timeout: float = 10) -> Any:
+    response = get_http_session().get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
 
 def search_usda_foods(food_name: str) -> dict:
     """Search USDA FoodData Central for food items"""
@@ -157,14 +464,11 @@ def search_usda_foods(food_name: str) -> dict:
             "sortOrder": "desc"
         }
         
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        return data
+        return call_with_retry("usda", _get_json, url, params)
         
     except Exception as e:
         print(f"USDA search error for '{food_name}': {e}")
+        record_upstream_failure("usda", e)
         return {"foods": [], "error": str(e)}
 
 def get_usda_food_details(fdc_id: str) -> dict:
@@ -176,94 +480,77 @@ def get_usda_food_details(fdc_id: str) -> dict:
             "format": "full"  # Get full details including nutrients and ingredients
         }
         
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        return data
+        return call_with_retry("usda", _get_json, url, params)
         
     except Exception as e:
         print(f"USDA details error for FDC ID '{fdc_id}': {e}")
+        record_upstream_failure("usda", e)
         return {"error": str(e)}
 
-def analyze_usda_food_data(food_name: str) -> str:
-    """Comprehensive analysis of food using USDA database"""
+def fetch_usda_food(food_name: str) -> tuple:
+    """Look up the best USDA match for a food. Returns (UsdaFood or None, error message).
+
+    Matches and "no results" misses are cached; upstream errors are not.
+    """
+    data = usda_cache.get_or_load(
+        normalize_key(food_name),
+        lambda: _encode_usda_lookup(*_fetch_usda_food_uncached(food_name)),
+        cacheable=lambda value: value["food"] is not None or value["error"] == "No results",
+        negative=lambda value: value["food"] is None,
+    )
+    return (UsdaFood.from_dict(data["food"]) if data["food"] else None), data["error"]
+
+def _encode_usda_lookup(food: Optional[UsdaFood], error: Optional[str]) -> Dict[str, Any]:
+    return {"food": food.to_dict() if food else None, "error": error}
+
+def _fetch_usda_food_uncached(food_name: str) -> tuple:
     print(f"Searching USDA database for: {food_name}")
     
     # Search for the food
     search_results = search_usda_foods(food_name)
     
     if "error" in search_results or not search_results.get("foods"):
-        return f"No USDA data found for '{food_name}' - {search_results.get('error', 'No results')}"
+        return None, search_results.get("error", "No results")
     
     # Get detailed info for the best match
     best_match = search_results["foods"][0]
     fdc_id = best_match.get("fdcId")
-    food_description = best_match.get("description", food_name)
+    food = UsdaFood(description=best_match.get("description", food_name), fdc_id=fdc_id)
     
-    print(f"Found USDA match: {food_description} (ID: {fdc_id})")
+    print(f"Found USDA match: {food.description} (ID: {fdc_id})")
     
     detailed_data = get_usda_food_details(str(fdc_id))
     
     if "error" in detailed_data:
-        return f"Error getting details for '{food_description}': {detailed_data['error']}"
-    
-    # Extract comprehensive information
-    analysis = {
-        "food_name": food_description,
-        "fdc_id": fdc_id,
-        "ingredients": [],
-        "nutrients": [],
-        "additives": [],
-        "concerning_components": []
-    }
+        return None, f"Error getting details for '{food.description}': {detailed_data['error']}"
     
     # Extract ingredients list
     if "ingredients" in detailed_data:
-        ingredients_text = detailed_data["ingredients"]
-        analysis["ingredients"] = [ing.strip() for ing in ingredients_text.split(",") if ing.strip()]
+        food.ingredients = [ing.strip() for ing in detailed_data["ingredients"].split(",") if ing.strip()]
     
     # Extract food additives/components of concern
-    if "foodComponents" in detailed_data:
-        for component in detailed_data["foodComponents"]:
-            name = component.get("name", "")
-            if any(keyword in name.lower() for keyword in ["preservative", "color", "artificial", "sodium", "phosphate"]):
-                analysis["additives"].append(name)
+    for component in detailed_data.get("foodComponents", []):
+        name = component.get("name", "")
+        if any(keyword in name.lower() for keyword in ["preservative", "color", "artificial", "sodium", "phosphate"]):
+            food.additives.append(name)
     
     # Extract key nutrients that might be concerning
-    if "foodNutrients" in detailed_data:
-        concerning_nutrients = ["sodium", "sugar", "saturated fat", "trans fat", "cholesterol"]
-        for nutrient in detailed_data["foodNutrients"][:20]:  # Top 20 nutrients
-            nutrient_name = nutrient.get("nutrient", {}).get("name", "").lower()
-            amount = nutrient.get("amount", 0)
-            unit = nutrient.get("nutrient", {}).get("unitName", "")
-            
-            if any(concern in nutrient_name for concern in concerning_nutrients):
-                analysis["nutrients"].append(f"{nutrient_name}: {amount} {unit}")
-    
-    # Format comprehensive analysis
-    usda_analysis = f"""
-=== USDA FOODDATA CENTRAL ANALYSIS ===
-Food: {analysis['food_name']}
-Database ID: {analysis['fdc_id']}
-
-INGREDIENTS LIST:
-{chr(10).join(f"• {ing}" for ing in analysis['ingredients'][:15]) if analysis['ingredients'] else "• No detailed ingredients available"}
-
-ADDITIVES & PRESERVATIVES:
-{chr(10).join(f"• {add}" for add in analysis['additives']) if analysis['additives'] else "• No specific additives identified"}
-
-KEY NUTRIENTS OF CONCERN:
-{chr(10).join(f"• {nut}" for nut in analysis['nutrients']) if analysis['nutrients'] else "• No concerning nutrient levels identified"}
-
-ADDITIONAL USDA DATA AVAILABLE:
-• Complete nutrient profile
-• Manufacturing details
-• Brand information (if applicable)
-• Preparation methods
-"""
+    concerning_nutrients = ["sodium", "sugar", "saturated fat", "trans fat", "cholesterol"]
+    for nutrient in detailed_data.get("foodNutrients", [])[:20]:  # Top 20 nutrients
+        nutrient_name = nutrient.get("nutrient", {}).get("name", "").lower()
+        if any(concern in nutrient_name for concern in concerning_nutrients):
+            food.nutrients.append(Nutrient(nutrient_name, nutrient.get("amount", 0), nutrient.get("nutrient", {}).get("unitName", "")))
     
-    return usda_analysis.strip()
+    return food, None
+
+def analyze_usda_food_data(food_name: str) -> str:
+    """Comprehensive analysis of food using USDA database"""
+    food, error = fetch_usda_food(food_name)
+    if food is None:
+        if error and error.startswith("Error getting details"):
+            return error
+        return f"No USDA data found for '{food_name}' - {error}"
+    return food.render()
 
 def search_openfoodfacts(food_name: str) -> dict:
     """Search OpenFoodFacts database for food products"""
@@ -277,155 +564,160 @@ def search_openfoodfacts(food_name: str) -> dict:
             "fields": "product_name,brands,ingredients_text,additives_tags,allergens_tags,nutrition_score_fr,nova_group,ecoscore_grade,code"
         }
         
-        response = requests.get(OPENFOODFACTS_SEARCH_URL, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        return data
+        return call_with_retry("openfoodfacts", _get_json, OPENFOODFACTS_SEARCH_URL, params)
         
     except Exception as e:
         print(f"OpenFoodFacts search error for '{food_name}': {e}")
+        record_upstream_failure("openfoodfacts", e)
         return {"products": [], "error": str(e)}
 
 def get_openfoodfacts_product_details(barcode: str) -> dict:
     """Get detailed product information from OpenFoodFacts using barcode"""
     try:
         url = f"{OPENFOODFACTS_BASE_URL}/product/{barcode}"
+        params = {
+            "fields": "product_name,brands,ingredients_text,additives_tags,allergens_tags,nutrition_score_fr,nova_group,ecoscore_grade,code"
+        }
         
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        return data
+        return call_with_retry("openfoodfacts", _get_json, url, params)
         
     except Exception as e:
         print(f"OpenFoodFacts details error for barcode '{barcode}': {e}")
+        record_upstream_failure("openfoodfacts", e)
         return {"error": str(e)}
 
-def analyze_openfoodfacts_data(food_name: str) -> str:
-    """Comprehensive analysis of food using OpenFoodFacts database"""
+def _clean_tags(tags: List[str]) -> List[str]:
+    return [tag.replace("en:", "").replace("-", " ").title() for tag in tags or []]
+
+def parse_openfoodfacts_product(product: Dict[str, Any], fallback_name: str = "") -> OpenFoodFactsProduct:
+    """Convert a raw OpenFoodFacts product record into its typed form"""
+    additives_tags = product.get("additives_tags") or []
+    return OpenFoodFactsProduct(
+        product_name=product.get("product_name", fallback_name),
+        brands=product.get("brands", "No brand"),
+        barcode=product.get("code", ""),
+        ingredients_text=product.get("ingredients_text", ""),
+        # Additives are particularly important for carcinogen analysis
+        additives=_clean_tags(additives_tags),
+        allergens=_clean_tags(product.get("allergens_tags")),
+        additives_tags=list(additives_tags),
+        nutrition_score=product.get("nutrition_score_fr", "Unknown"),
+        nova_group=product.get("nova_group", "Unknown"),
+        ecoscore=product.get("ecoscore_grade", "Unknown"),
+    )
+
+def fetch_openfoodfacts_products(food_name: str) -> tuple:
+    """Search OpenFoodFacts and return (best products (up to 3), products found, error message).
+
+    Matches and "no results" misses are cached; upstream errors are not.
+    """
+    def load():
+        products, found, error = _fetch_openfoodfacts_products_uncached(food_name)
+        return {"products": [p.to_dict() for p in products], "found": found, "error": error}
+
+    data = off_cache.get_or_load(
+        normalize_key(food_name),
+        load,
+        cacheable=lambda value: bool(value["products"]) or value["error"] == "No results",
+        negative=lambda value: not value["products"],
+    )
+    return [OpenFoodFactsProduct.from_dict(p) for p in data["products"]], data["found"], data["error"]
+
+def _fetch_openfoodfacts_products_uncached(food_name: str) -> tuple:
+    """Search OpenFoodFacts and return (best products (up to 3), products found, error message)"""
     print(f"Searching OpenFoodFacts database for: {food_name}")
     
-    # Search for the food
     search_results = search_openfoodfacts(food_name)
     
     if "error" in search_results or not search_results.get("products"):
-        return f"No OpenFoodFacts data found for '{food_name}' - {search_results.get('error', 'No results')}"
-    
-    products = search_results.get("products", [])
-    if not products:
-        return f"No OpenFoodFacts products found for '{food_name}'"
-    
-    # Analyze the best matches (up to 3 products)
-    analyses = []
+        return [], 0, search_results.get("error", "No results")
     
+    products = search_results["products"]
+    parsed = []
     for i, product in enumerate(products[:3]):
-        product_name = product.get("product_name", food_name)
-        brands = product.get("brands", "No brand")
-        barcode = product.get("code", "")
-        
-        print(f"Analyzing OpenFoodFacts product {i+1}: {product_name}")
-        
-        # Extract comprehensive information
-        analysis = {
-            "product_name": product_name,
-            "brands": brands,
-            "barcode": barcode,
-            "ingredients": product.get("ingredients_text", ""),
-            "additives": [],
-            "allergens": [],
-            "nutrition_score": product.get("nutrition_score_fr", "Unknown"),
-            "nova_group": product.get("nova_group", "Unknown"),
-            "ecoscore": product.get("ecoscore_grade", "Unknown")
-        }
-        
-        # Extract additives (these are particularly important for carcinogen analysis)
-        additives_tags = product.get("additives_tags", [])
-        if additives_tags:
-            analysis["additives"] = [tag.replace("en:", "").replace("-", " ").title() for tag in additives_tags]
-        
-        # Extract allergens
-        allergen_tags = product.get("allergens_tags", [])
-        if allergen_tags:
-            analysis["allergens"] = [tag.replace("en:", "").replace("-", " ").title() for tag in allergen_tags]
-        
-        # Format individual product analysis
-        product_analysis = f"""
---- OPENFOODFACTS PRODUCT {i+1} ---
-Product: {analysis['product_name']}
-Brand(s): {analysis['brands']}
-Barcode: {analysis['barcode']}
-
-COMPLETE INGREDIENTS LIST:
-{analysis['ingredients'] if analysis['ingredients'] else '• No ingredients data available'}
-
-IDENTIFIED ADDITIVES:
-{chr(10).join(f"• {additive}" for additive in analysis['additives']) if analysis['additives'] else "• No additives identified"}
-
-ALLERGENS:
-{chr(10).join(f"• {allergen}" for allergen in analysis['allergens']) if analysis['allergens'] else "• No allergens identified"}
-
-QUALITY SCORES:
-• Nutrition Score: {analysis['nutrition_score']} (A=best, E=worst)
-• NOVA Group: {analysis['nova_group']} (1=unprocessed, 4=ultra-processed)
-• Eco Score: {analysis['ecoscore']} (A=best environmental impact, E=worst)
-"""
-        
-        analyses.append(product_analysis.strip())
-    
-    # Combine all product analyses
-    final_analysis = f"""
-=== OPENFOODFACTS DATABASE ANALYSIS ===
-Search Query: {food_name}
-Products Found: {len(products)}
-Products Analyzed: {len(analyses)}
-
-{chr(10).join(analyses)}
-
-OPENFOODFACTS DATA ADVANTAGES:
-• Real consumer product data
-• Detailed additive identification
-• Processing level classification (NOVA)
-• Community-verified ingredients
-• Global product coverage
-"""
+        print(f"Analyzing OpenFoodFacts product {i+1}: {product.get('product_name', food_name)}")
+        parsed.append(parse_openfoodfacts_product(product, food_name))
     
-    return final_analysis.strip()
+    return parsed, len(products), None
 
-def get_combined_food_database_analysis(food_name: str) -> str:
+def analyze_openfoodfacts_data(food_name: str) -> str:
+    """Comprehensive analysis of food using OpenFoodFacts database"""
+    products, products_found, error = fetch_openfoodfacts_products(food_name)
+    if not products:
+        return f"No OpenFoodFacts data found for '{food_name}' - {error}"
+    return render_openfoodfacts(food_name, products, products_found)
+
+def fetch_product_by_barcode(barcode: str) -> tuple:
+    """Resolve an exact OpenFoodFacts product by barcode. Returns (product or None, error message).
+
+    Found products and "product not found" misses are cached; upstream errors are not.
+    """
+    def load():
+        data = get_openfoodfacts_product_details(barcode)
+        if "error" in data:
+            return {"product": None, "error": data["error"]}
+        if data.get("status") != 1 or not data.get("product"):
+            return {"product": None, "error": "Product not found"}
+        product = data["product"]
+        product.setdefault("code", barcode)
+        return {"product": parse_openfoodfacts_product(product, barcode).to_dict(), "error": None}
+
+    data = barcode_cache.get_or_load(
+        barcode,
+        load,
+        cacheable=lambda value: value["product"] is not None or value["error"] == "Product not found",
+        negative=lambda value: value["product"] is None,
+    )
+    return (OpenFoodFactsProduct.from_dict(data["product"]) if data["product"] else None), data["error"]
+
+def get_combined_food_database_data(food_name: str) -> DatabaseAnalysis:
     """Combine data from both USDA and OpenFoodFacts databases"""
     print(f"Performing combined database analysis for: {food_name}")
     
-    combined_analysis = f"=== COMBINED DATABASE ANALYSIS FOR: {food_name.upper()} ===\n\n"
-    
-    # Get USDA data
-    usda_data = analyze_usda_food_data(food_name)
-    if usda_data and "No USDA data found" not in usda_data:
-        combined_analysis += f"{usda_data}\n\n"
-    
-    # Get OpenFoodFacts data
-    off_data = analyze_openfoodfacts_data(food_name)
-    if off_data and "No OpenFoodFacts data found" not in off_data:
-        combined_analysis += f"{off_data}\n\n"
-    
-    # Add summary
-    combined_analysis += """
-=== DATABASE COVERAGE SUMMARY ===
-• USDA: Official US government nutrition database
-• OpenFoodFacts: Global crowdsourced product database
-• Combined: Maximum ingredient and additive identification
-• Sources: Government + community verification
-"""
-    
-    return combined_analysis.strip()
+    analysis = DatabaseAnalysis(query=food_name)
+    analysis.usda, analysis.usda_error = fetch_usda_food(food_name)
+    analysis.off_products, analysis.off_products_found, analysis.off_error = fetch_openfoodfacts_products(food_name)
+    return analysis
 
-def get_ingredient_breakdown(ingredient: str) -> str:
-    """Get the chemical makeup and sub-ingredients of a food ingredient using OpenAI"""
-    if not openai_client:
-        return f"Unable to analyze {ingredient} - OpenAI not configured"
-    
-    try:
-        breakdown_prompt = f"""You are a food science expert. Analyze the ingredient: "{ingredient}"
+def get_combined_food_database_analysis(food_name: str) -> str:
+    """Combine data from both USDA and OpenFoodFacts databases, rendered as report text"""
+    return get_combined_food_database_data(food_name).render()
+
+def get_ingredient_breakdown(ingredient: str, database: Optional[DatabaseAnalysis] = None) -> str:
+    """Component breakdown JSON for an ingredient, cached by normalized name.
+
+    Built from the database records and the additive taxonomy when they are rich
+    enough (see structured_breakdown.py); otherwise requested from OpenAI.
+    """
+    return breakdown_cache.get_or_load(
+        normalize_key(ingredient),
+        lambda: _structured_breakdown(ingredient, database) or _get_ingredient_breakdown_uncached(ingredient),
+        cacheable=lambda value: parse_ingredient_breakdown(ingredient, value) is not None,
+    )
+
+async def aget_ingredient_breakdown(ingredient: str, database: Optional[DatabaseAnalysis] = None) -> str:
+    """Async get_ingredient_breakdown sharing the same cache entries"""
+    async def aload() -> str:
+        return _structured_breakdown(ingredient, database) or await _aget_ingredient_breakdown_uncached(ingredient)
+
+    return await breakdown_cache.aget_or_load(
+        normalize_key(ingredient),
+        aload,
+        lambda: _structured_breakdown(ingredient, database) or _get_ingredient_breakdown_uncached(ingredient),
+        cacheable=lambda value: parse_ingredient_breakdown(ingredient, value) is not None,
+    )
+
+def _structured_breakdown(ingredient: str, database: Optional[DatabaseAnalysis]) -> Optional[str]:
+    """Breakdown JSON from structured data, or None when the LLM has to be asked"""
+    breakdown = resolve_breakdown(ingredient, database)
+    if breakdown is None:
+        return None
+    routing_stats["breakdown_structured"] += 1
+    print(f"Breakdown of {ingredient} built from structured data ({len(breakdown.components)} components)")
+    return json.dumps(breakdown.to_dict())
+
+def build_breakdown_messages(ingredient: str) -> List[Dict[str, str]]:
+    breakdown_prompt = f"""You are a food science expert. Analyze the ingredient: "{ingredient}"
 
 Provide a comprehensive breakdown including:
 1. Primary chemical components and additives
@@ -445,21 +737,73 @@ Respond in this JSON format:
 }}
 
 Focus on components that might have health implications. Be thorough but factual."""
+    return [
+        {"role": "system", "content": "You are a food science expert specializing in ingredient analysis."},
+        {"role": "user", "content": breakdown_prompt}
+    ]
 
-        chat = openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": "You are a food science expert specializing in ingredient analysis."},
-                {"role": "user", "content": breakdown_prompt}
-            ],
-            temperature=0.2,
-        )
+def _request_breakdown(ingredient: str, model: str) -> str:
+    chat = chat_completion(
+        model=model,
+        response_format={"type": "json_object"},
+        messages=build_breakdown_messages(ingredient),
+        temperature=0.2,
+    )
+    return chat.choices[0].message.content or ""
+
+def _get_ingredient_breakdown_uncached(ingredient: str) -> str:
+    """Get the chemical makeup and sub-ingredients of a food ingredient using OpenAI.
+
+    With model routing the fast model is tried first; its answer is kept unless it
+    is unparseable or names nothing to research.
+    """
+    if not get_openai_client():
+        return f"Unable to analyze {ingredient} - OpenAI not configured"
+    
+    try:
+        if MODEL_ROUTING_ENABLED:
+            content = _request_breakdown(ingredient, OPENAI_FAST_MODEL)
+            breakdown = parse_ingredient_breakdown(ingredient, content)
+            if breakdown is not None and breakdown.research_targets():
+                routing_stats["breakdown_fast"] += 1
+                return content
+            print(f"Escalating breakdown of {ingredient} to {OPENAI_MODEL}")
+            routing_stats["breakdown_escalated"] += 1
+        return _request_breakdown(ingredient, OPENAI_MODEL)
         
-        return chat.choices[0].message.content or ""
+    except Exception as e:
+        print(f"Error getting ingredient breakdown for {ingredient}: {e}")
+        record_upstream_failure("openai", e)
+        return f"Error analyzing {ingredient}: {str(e)}"
+
+async def _arequest_breakdown(ingredient: str, model: str) -> str:
+    chat = await achat_completion(
+        model=model,
+        response_format={"type": "json_object"},
+        messages=build_breakdown_messages(ingredient),
+        temperature=0.2,
+    )
+    return chat.choices[0].message.content or ""
+
+async def _aget_ingredient_breakdown_uncached(ingredient: str) -> str:
+    """Async _get_ingredient_breakdown_uncached, with the same model routing"""
+    if not get_async_openai_client():
+        return f"Unable to analyze {ingredient} - OpenAI not configured"
+    
+    try:
+        if MODEL_ROUTING_ENABLED:
+            content = await _arequest_breakdown(ingredient, OPENAI_FAST_MODEL)
+            breakdown = parse_ingredient_breakdown(ingredient, content)
+            if breakdown is not None and breakdown.research_targets():
+                routing_stats["breakdown_fast"] += 1
+                return content
+            print(f"Escalating breakdown of {ingredient} to {OPENAI_MODEL}")
+            routing_stats["breakdown_escalated"] += 1
+        return await _arequest_breakdown(ingredient, OPENAI_MODEL)
         
     except Exception as e:
         print(f"Error getting ingredient breakdown for {ingredient}: {e}")
+        record_upstream_failure("openai", e)
         return f"Error analyzing {ingredient}: {str(e)}"
 
 def retrieve_context(ingredient: str) -> str:
@@ -522,64 +866,175 @@ def fill_missing_with_known(ingredients: List[str], llm_data: Any) -> List[Dict[
         llm_list = json.loads(llm_data) if isinstance(llm_data, str) else llm_data
     except Exception:
         llm_list = []
-    llm_dict = {item.get("name", "").strip().lower(): item for item in llm_list if isinstance(item, dict)}
+    llm_dict = {}
+    for item in llm_list:
+        if isinstance(item, RiskResult):
+            llm_dict[item.name.strip().lower()] = item
+        elif isinstance(item, dict):
+            llm_dict[item.get("name", "").strip().lower()] = RiskResult.from_dict(item)
     result = []
     for ing in ingredients:
         key = ing.strip().lower()
-        # Ignore the word 'ingredients' as an ingredient
-        if not key or key == "ingredients" or key == "invalid" or key == "invalid name":
-            entry = {"name": ing, "risk_level": "unknown", "score": "unknown", "source": "unknown", "explanation": "unknown", "nova_group": None}
-            result.append(entry)
-            continue
-        llm_item = llm_dict.get(key, {})
+        llm_item = llm_dict.get(key)
         known = KNOWN_CARCINOGEN_SCORES.get(key, {})
-        # If LLM and known are both empty, mark as unknown
-        if not llm_item and not known:
-            entry = {"name": ing, "risk_level": "unknown", "score": "unknown", "source": "unknown", "explanation": "unknown", "nova_group": None}
-            result.append(entry)
+        # Ignore the word 'ingredients' as an ingredient; if LLM and known are both empty, mark as unknown
+        if not key or key in ("ingredients", "invalid", "invalid name") or (llm_item is None and not known):
+            result.append(RiskResult(ing, "unknown", "unknown", "unknown", "unknown", None).to_dict())
             continue
-        score = llm_item.get("score") or known.get("score", "unknown")
+        llm_item = llm_item or RiskResult(ing)
+        score = llm_item.score or known.get("score", "unknown")
         # If score is 0, set risk_level to 'unknown'
         if score == 0 or score == "0":
             risk_level = "unknown"
         else:
-            risk_level = llm_item.get("risk_level") or known.get("risk_level", "unknown")
-        entry = {
-            "name": ing,
-            "risk_level": risk_level,
-            "score": score,
-            "source": llm_item.get("source") or known.get("source", "unknown"),
-            "explanation": llm_item.get("explanation") or known.get("explanation", "unknown"),
-            "nova_group": llm_item.get("nova_group") or known.get("nova_group", None),
-        }
-        result.append(entry)
+            risk_level = llm_item.risk_level or known.get("risk_level", "unknown")
+        entry = RiskResult(
+            name=ing,
+            risk_level=risk_level,
+            score=score,
+            source=llm_item.source or known.get("source", "unknown"),
+            explanation=llm_item.explanation or known.get("explanation", "unknown"),
+            nova_group=llm_item.nova_group or known.get("nova_group", None),
+        )
+        result.append(entry.to_dict())
     return result
 
-# Initialize SQLite DB and table
-DB_PATH = "analysis_log.db"
+# SQLite analysis log. The path is resolved relative to this file so the server
+# finds the same database regardless of the working directory it is started from.
+DB_PATH = os.getenv("ANALYSIS_DB_PATH", str(Path(__file__).resolve().parent / "analysis_log.db"))
+_db_local = threading.local()
+_db_initialized = False
+
+def get_db_connection() -> sqlite3.Connection:
+    """Return this thread's cached connection to the analysis log database"""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        _db_local.conn = conn
+    if not _db_initialized:
+        init_db()
+    return conn
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS analysis_log (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT,
-        input TEXT,
-        result TEXT,
-        error TEXT
-    )''')
-    conn.commit()
-    conn.close()
-init_db()
+    global _db_initialized
+    with _resource_lock:
+        if _db_initialized:
+            return
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS analysis_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            input TEXT,
+            result TEXT,
+            error TEXT
+        )''')
+        conn.commit()
+        conn.close()
+        _db_initialized = True
 
 def log_analysis(input_str: str, result: str = None, error: str = None):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute(
+    conn = get_db_connection()
+    conn.execute(
         "INSERT INTO analysis_log (timestamp, input, result, error) VALUES (?, ?, ?, ?)",
         (datetime.utcnow().isoformat(), input_str, result, error)
     )
     conn.commit()
-    conn.close()
+
+# Startup lifecycle: the app starts accepting connections immediately and runs
+# the warm-up hooks in a background thread. /ready reports 503 until they finish,
+# so autoscaled instances only receive traffic once they can answer quickly.
+startup_state: Dict[str, Any] = {
+    "ready": False,
+    "import_seconds": None,
+    "time_to_ready_seconds": None,
+    "warmup_steps": {},
+    "warmup_errors": {},
+}
+_warmup_hooks: List[tuple] = []
+
+def register_warmup(name: str):
+    """Decorator registering a function to run during the startup warm-up phase"""
+    def decorator(fn: Callable[[], Any]):
+        _warmup_hooks.append((name, fn))
+        return fn
+    return decorator
+
+@register_warmup("database")
+def _warm_database():
+    get_db_connection()
+
+@register_warmup("openai_client")
+def _warm_openai_client():
+    get_openai_client()
+    if OPENAI_ASYNC:
+        get_async_openai_client()
+
+@register_warmup("snippet_index")
+def _warm_snippet_index():
+    get_snippet_index()
+
+@register_warmup("http_pool")
+def _warm_http_pool():
+    session = get_http_session()
+    if WARMUP_PRECONNECT:
+        for url in (USDA_BASE_URL, OPENFOODFACTS_BASE_URL, "https://serpapi.com"):
+            try:
+                session.head(url, timeout=5)
+            except Exception as e:
+                print(f"Pre-connect to {url} failed: {e}")
+
+def run_warmup(started: float):
+    """Run every registered warm-up hook, recording per-step timings"""
+    for name, fn in _warmup_hooks:
+        step_started = time.perf_counter()
+        try:
+            fn()
+        except Exception as e:
+            print(f"Warm-up step '{name}' failed: {e}")
+            startup_state["warmup_errors"][name] = str(e)
+        startup_state["warmup_steps"][name] = round(time.perf_counter() - step_started, 4)
+    startup_state["time_to_ready_seconds"] = round(time.perf_counter() - started, 4)
+    startup_state["ready"] = True
+    print(f"Server ready in {startup_state['time_to_ready_seconds']}s (warm-up steps: {startup_state['warmup_steps']})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=run_warmup, args=(started,), name="warmup", daemon=True).start()
+    else:
+        # Resources are still created lazily on first use
+        startup_state["ready"] = True
+        startup_state["time_to_ready_seconds"] = round(time.perf_counter() - started, 4)
+    # Popularity-driven cache warmer (see warm_cache.py); imported here to avoid a circular import
+    import warm_cache
+    if warm_cache.CACHE_WARMER_ENABLED or warm_cache.CACHE_WARMER_ON_STARTUP:
+        warm_cache.start_background_warmer()
+    if QUOTA_ENABLED:
+        quota_manager.start_flusher()
+    yield
+    quota_manager.stop()
+    if _http_session is not None:
+        _http_session.close()
+
+app = FastAPI(lifespan=lifespan)
+
+# CORS: allow local Next.js dev servers and production Vercel deployment
+allowed_origins = [
+    "http://localhost:300",
+    "http://127.0.0.1:300",
+    "http://localhost:3001",
+    "http://127.0.0.1:3001",
+]
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=allowed_origins,
+    allow_origin_regex=r"https://.*\.vercel\.app",  # Allow all Vercel deployments
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
 
 class IngredientRequest(BaseModel):
     ingredients: str  # Accepts a string of comma-separated ingredients
@@ -588,21 +1043,23 @@ class ProductRequest(BaseModel):
     product: str
     ingredients: str
 
-# Ingredient score cache (in-memory, server lifetime)
-ingredient_cache: Dict[str, List[Dict[str, Any]]] = {}
+# Ingredient score cache, shared across uvicorn workers (see cache_backends.py)
+_ingredient_cache: Optional[CacheBackend] = None
 
-def validate_food_input(ingredients: str) -> Dict[str, Any]:
-    """
-    Validate if the input contains food products using OpenAI and database searches.
-    Returns validation result with any non-food items identified.
-    """
-    if not openai_client:
-        return {"is_valid": True, "non_food_items": [], "message": "OpenAI not configured, skipping validation"}
-    
-    ingredient_list = [i.strip() for i in ingredients.split(",") if i.strip()]
-    if not ingredient_list:
-        return {"is_valid": False, "non_food_items": [], "message": "No ingredients provided"}
-    
+def get_ingredient_cache() -> CacheBackend:
+    """Return the process-wide ingredient cache backend selected by CACHE_BACKEND"""
+    global _ingredient_cache
+    if _ingredient_cache is None:
+        with _resource_lock:
+            if _ingredient_cache is None:
+                _ingredient_cache = create_cache_backend()
+    return _ingredient_cache
+
+@register_warmup("ingredient_cache")
+def _warm_ingredient_cache():
+    get_ingredient_cache()
+
+def build_validation_messages(ingredient_list: List[str]) -> List[Dict[str, str]]:
     # Create a comprehensive validation prompt
     validation_prompt = f"""
 You are a food safety expert. Your task is to determine if each item in the following list is a food product that could be consumed by humans.
@@ -649,42 +1106,83 @@ Respond with a JSON object in this exact format:
 Be strict in your validation - if you're unsure whether something is food, mark it as non-food.
 """
 
-    try:
-        response = openai_client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=[{"role": "user", "content": validation_prompt}],
-            temperature=0.1,
-            response_format={"type": "json_object"}
-        )
-        
-        validation_result = json.loads(response.choices[0].message.content)
+    return [{"role": "user", "content": validation_prompt}]
+
+def combine_validation_results(ingredient_list: List[str], validation_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Cross-check the model's validation against the food databases"""
+    # Also do a quick database search to cross-validate
+    database_validation = validate_with_databases(ingredient_list)
+    
+    # Combine results - prioritize AI validation, only use database validation as additional confirmation
+    ai_non_food = set(validation_result.get("non_food_items", []))
+    db_non_food = set(database_validation.get("non_food_items", []))
+    
+    # Only flag as non-food if BOTH AI and database agree it's non-food, OR if AI is very confident it's non-food
+    final_non_food = set()
+    for item in ai_non_food:
+        # Check if AI validation shows high confidence it's non-food
+        ai_details = validation_result.get("validation_details", [])
+        ai_item_detail = next((d for d in ai_details if d.get("item") == item), {})
+        ai_confidence = ai_item_detail.get("confidence", 0.0)
         
-        # Also do a quick database search to cross-validate
-        database_validation = validate_with_databases(ingredient_list)
+        # If AI is very confident it's non-food (confidence > 0.8), or if both AI and DB agree
+        if ai_confidence > 0.8 or item in db_non_food:
+            final_non_food.add(item)
+    
+    return {
+        "is_valid": len(final_non_food) == 0,
+        "non_food_items": list(final_non_food),
+        "message": validation_result.get("message", ""),
+        "validation_details": validation_result.get("validation_results", []),
+        "database_validation": database_validation
+    }
+
+def validate_food_input(ingredients: str) -> Dict[str, Any]:
+    """
+    Validate if the input contains food products using OpenAI and database searches.
+    Returns validation result with any non-food items identified.
+    """
+    if not get_openai_client():
+        return {"is_valid": True, "non_food_items": [], "message": "OpenAI not configured, skipping validation"}
+    
+    ingredient_list = ingredient_names(ingredients)
+    if not ingredient_list:
+        return {"is_valid": False, "non_food_items": [], "message": "No ingredients provided"}
+    
+    try:
+        response = chat_completion(
+            model=OPENAI_MODEL,
+            messages=build_validation_messages(ingredient_list),
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
         
-        # Combine results - prioritize AI validation, only use database validation as additional confirmation
-        ai_non_food = set(validation_result.get("non_food_items", []))
-        db_non_food = set(database_validation.get("non_food_items", []))
+        validation_result = json.loads(response.choices[0].message.content)
+        return combine_validation_results(ingredient_list, validation_result)
         
-        # Only flag as non-food if BOTH AI and database agree it's non-food, OR if AI is very confident it's non-food
-        final_non_food = set()
-        for item in ai_non_food:
-            # Check if AI validation shows high confidence it's non-food
-            ai_details = validation_result.get("validation_details", [])
-            ai_item_detail = next((d for d in ai_details if d.get("item") == item), {})
-            ai_confidence = ai_item_detail.get("confidence", 0.0)
-            
-            # If AI is very confident it's non-food (confidence > 0.8), or if both AI and DB agree
-            if ai_confidence > 0.8 or item in db_non_food:
-                final_non_food.add(item)
+    except Exception as e:
+        print(f"Food validation error: {e}")
+        return {"is_valid": True, "non_food_items": [], "message": f"Validation error: {str(e)}"}
+
+async def avalidate_food_input(ingredients: str) -> Dict[str, Any]:
+    """Async validate_food_input; the database cross-check runs in a worker thread"""
+    if not get_async_openai_client():
+        return {"is_valid": True, "non_food_items": [], "message": "OpenAI not configured, skipping validation"}
+    
+    ingredient_list = ingredient_names(ingredients)
+    if not ingredient_list:
+        return {"is_valid": False, "non_food_items": [], "message": "No ingredients provided"}
+    
+    try:
+        response = await achat_completion(
+            model=OPENAI_MODEL,
+            messages=build_validation_messages(ingredient_list),
+            temperature=0.1,
+            response_format={"type": "json_object"}
+        )
         
-        return {
-            "is_valid": len(final_non_food) == 0,
-            "non_food_items": list(final_non_food),
-            "message": validation_result.get("message", ""),
-            "validation_details": validation_result.get("validation_results", []),
-            "database_validation": database_validation
-        }
+        validation_result = json.loads(response.choices[0].message.content)
+        return await asyncio.to_thread(combine_validation_results, ingredient_list, validation_result)
         
     except Exception as e:
         print(f"Food validation error: {e}")
@@ -736,111 +1234,19 @@ def validate_with_databases(ingredient_list: List[str]) -> Dict[str, Any]:
         "message": f"Database validation found {len(non_food_items)} non-food items" if non_food_items else "All items found in food databases"
     }
 
-def analyze_ingredients(ingredients: str):
-    # First, validate that all inputs are food products
-    validation_result = validate_food_input(ingredients)
-    if not validation_result["is_valid"]:
-        return {
-            "error": f"Non-food items detected: {', '.join(validation_result['non_food_items'])}. Please enter only food products, ingredients, or consumable items.",
-            "validation_details": validation_result
-        }
-    
-    print(f"Validation passed for: {ingredients}")
-    
-    cache_key = ",".join(sorted([i.strip().lower() for i in ingredients.split(",") if i.strip()]))
-    if cache_key in ingredient_cache:
-        result = ingredient_cache[cache_key]
-        high_risk = [item["name"] for item in result if isinstance(item.get("score"), (int, float)) and item["score"] > 80]
-        warning = None
-        if high_risk:
-            warning = f"Warning: High carcinogen risk for: {', '.join(high_risk)}."
-        log_analysis(ingredients, json.dumps(result), None)
-        response_json = {"ingredients": result}
-        if warning:
-            response_json["warning"] = warning
-        response_json["cached"] = True
-        return response_json
-    
-    ingredient_list = [i.strip() for i in ingredients.split(",") if i.strip()]
-    results = []
-    
-    for ingredient in ingredient_list:
-        if not ingredient or ingredient.lower() == "ingredients":
-            continue
-            
-        # Step 1: Get comprehensive database information (USDA + OpenFoodFacts)
-        print(f"Querying food databases for: {ingredient}")
-        database_data = get_combined_food_database_analysis(ingredient)
-        
-        # Step 2: Get ingredient breakdown (components, chemicals, sub-ingredients)
-        print(f"Analyzing component breakdown for: {ingredient}")
-        breakdown_json = get_ingredient_breakdown(ingredient)
-        
-        # Step 2: Extract components for individual risk assessment
-        components_to_analyze = []
-        breakdown_info = ""
-        
-        try:
-            breakdown_data = json.loads(breakdown_json)
-            breakdown_info = f"Ingredient breakdown: {breakdown_json}"
-            
-            # Collect all components for analysis
-            if "components" in breakdown_data:
-                for comp in breakdown_data["components"]:
-                    components_to_analyze.append(comp["name"])
-            
-            if "processing_chemicals" in breakdown_data:
-                components_to_analyze.extend(breakdown_data["processing_chemicals"])
-                
-            if "potential_concerns" in breakdown_data:
-                components_to_analyze.extend(breakdown_data["potential_concerns"])
-                
-        except json.JSONDecodeError:
-            print(f"Could not parse breakdown JSON for {ingredient}")
-            breakdown_info = f"Component analysis: {breakdown_json}"
-            components_to_analyze = [ingredient]  # Fallback to original ingredient
-        
-        # Step 3: Perform comprehensive multi-angle research on key components
-        component_research = []
-        priority_components = components_to_analyze[:5]  # Focus on top 5 most important components
-        
-        print(f"Performing detailed research on {len(priority_components)} key components")
-        
-        for component in priority_components:
-            if USE_WEB_SEARCH and SERPAPI_KEY != "your_serpapi_key_here":
-                print(f"Deep research analysis for: {component}")
-                detailed_research = perform_multi_angle_search(component)
-                component_research.append(f"=== COMPREHENSIVE ANALYSIS: {component.upper()} ===\n{detailed_research}")
-                
-                # Add a small delay to respect API rate limits
-                time.sleep(0.5)
-        
-        # Step 4: Retrieve general context for the main ingredient
-        general_context = retrieve_context(ingredient)
-        
-        # Step 5: Perform additional targeted search for the main ingredient
-        main_ingredient_research = ""
-        if USE_WEB_SEARCH and SERPAPI_KEY != "your_serpapi_key_here":
-            print(f"Researching main ingredient: {ingredient}")
-            main_ingredient_research = perform_multi_angle_search(ingredient)
-        
-        # Step 6: Compile all research including database data
-        all_research = ""
-        
-        # Add combined database data first (most authoritative)
-        if database_data and any(keyword not in database_data for keyword in ["No USDA data found", "No OpenFoodFacts data found"]):
-            all_research += f"{database_data}\n\n"
-        
-        if main_ingredient_research:
-            all_research += f"=== MAIN INGREDIENT RESEARCH: {ingredient.upper()} ===\n{main_ingredient_research}\n\n"
-        
-        if component_research:
-            all_research += "\n\n".join(component_research)
-        
-        if not all_research:
-            all_research = "No detailed research available - using static knowledge base only"
-        
-        prompt = f"""<s>[INST] You are an expert in food safety and carcinogen risk assessment.
+def parse_ingredient_breakdown(ingredient: str, breakdown_json: str) -> Optional[IngredientBreakdown]:
+    """Parse the breakdown model output, or None when it is not valid JSON"""
+    try:
+        data = json.loads(breakdown_json)
+    except (json.JSONDecodeError, TypeError):
+        print(f"Could not parse breakdown JSON for {ingredient}")
+        return None
+    if not isinstance(data, dict):
+        return None
+    return IngredientBreakdown.from_dict(ingredient, data)
+
+def build_assessment_prompt(ingredient: str, breakdown_info: str, all_research: str, general_context: str) -> str:
+    return f"""<s>[INST] You are an expert in food safety and carcinogen risk assessment.
 
 INGREDIENT TO ANALYZE: {ingredient}
 
@@ -885,121 +1291,1245 @@ NOVA Group extraction (CRITICAL - look for this exact pattern):
 - IMPORTANT: Always include the nova_group field in your JSON response, even if null
 
 IMPORTANT: Respond ONLY with the JSON object, no additional text, no explanations outside the JSON. [/INST]"""
+
+def build_assessment_messages(prompt: str) -> List[Dict[str, str]]:
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are an expert in food safety and carcinogen risk assessment. "
+                "Always output only valid JSON with the required keys."
+            ),
+        },
+        {
+            "role": "user",
+            "content": prompt,
+        },
+    ]
+
+def build_screening_prompt(ingredient: str, breakdown_info: str, database_info: str) -> str:
+    """Short-context prompt for the fast model's first pass (no web research)"""
+    return f"""Screen the food ingredient "{ingredient}" for carcinogen risk using only the data below and your own knowledge.
+
+COMPONENT BREAKDOWN:
+{breakdown_info}
+
+FOOD DATABASE DATA:
+{database_info}
+
+Respond with ONLY a valid JSON object in this exact format:
+{{
+  "name": "{ingredient}",
+  "risk_level": "Low/Medium/High/Unknown",
+  "score": 0-100,
+  "source": "Primary sources cited or 'Multiple sources'",
+  "explanation": "Short explanation of the main risk factors",
+  "nova_group": "1-4 or null (from the NOVA Group in the database data, if any)",
+  "confidence": 0.0-1.0
+}}
+
+Scoring guidelines: 0-30 Low, 31-60 Medium, 61-100 High.
+"confidence" is how sure you are of the score without further research. Use a low value when the evidence is mixed, depends on dose or processing, or you would need to check recent studies."""
+
+def parse_score_bands(spec: str) -> List[tuple]:
+    """Parse "31-60,61-80" into [(31, 60), (61, 80)]"""
+    bands = []
+    for part in spec.split(","):
+        if "-" in part:
+            low, high = part.split("-", 1)
+            bands.append((float(low), float(high)))
+    return bands
+
+_escalate_bands = parse_score_bands(ROUTING_ESCALATE_BANDS)
+
+def escalation_reason(result: RiskResult, confidence: Any) -> Optional[str]:
+    """Why a screening result needs the full pipeline, or None when it can be kept"""
+    if not isinstance(result.score, (int, float)) or isinstance(result.score, bool):
+        return "no score"
+    try:
+        confidence = float(confidence)
+    except (TypeError, ValueError):
+        return "no confidence"
+    if confidence < ROUTING_MIN_CONFIDENCE:
+        return f"confidence {confidence:.2f}"
+    for low, high in _escalate_bands:
+        if low <= result.score <= high:
+            return f"borderline score {result.score}"
+    return None
+
+def compute_cache_fingerprint(*parts: Any) -> str:
+    """Short stable hash of everything that determines a cached model output"""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+# Cache versions: a new model, prompt template or knowledge-base edit yields a new
+# version. Old-version entries keep being served while the new ones are computed
+# in the background, and are evicted as each key migrates (see research_cache.py).
+_routing_fingerprint = (
+    [OPENAI_FAST_MODEL, ROUTING_MIN_CONFIDENCE, _escalate_bands] if MODEL_ROUTING_ENABLED else None
+)
+BREAKDOWN_CACHE_VERSION = compute_cache_fingerprint(
+    OPENAI_MODEL, build_breakdown_messages("{ingredient}"), CACHE_VERSION_SALT,
+    *([OPENAI_FAST_MODEL] if MODEL_ROUTING_ENABLED else []),
+)
+ASSESSMENT_CACHE_VERSION = compute_cache_fingerprint(
+    OPENAI_MODEL,
+    build_assessment_messages(build_assessment_prompt("{ingredient}", "{breakdown}", "{research}", "{context}")),
+    KNOWN_CARCINOGEN_SCORES,
+    BREAKDOWN_CACHE_VERSION,
+    *([_routing_fingerprint, build_screening_prompt("{ingredient}", "{breakdown}", "{database}")]
+      if MODEL_ROUTING_ENABLED else []),
+)
+breakdown_cache.set_version(BREAKDOWN_CACHE_VERSION)
+assessment_cache.set_version(ASSESSMENT_CACHE_VERSION)
+
+def render_research(ingredient: str, database: DatabaseAnalysis, main_research: Optional[ComponentResearch],
+                    component_research: List[ComponentResearch]) -> str:
+    """Render the gathered research into the prompt's research section"""
+    all_research = ""
+    
+    # Add combined database data first (most authoritative)
+    if database.has_data:
+        all_research += f"{database.render()}\n\n"
+    
+    if main_research is not None and main_research.sections:
+        all_research += f"=== MAIN INGREDIENT RESEARCH: {ingredient.upper()} ===\n{main_research.render()}\n\n"
+    
+    if component_research:
+        all_research += "\n\n".join(
+            f"=== COMPREHENSIVE ANALYSIS: {research.component.upper()} ===\n{research.render()}"
+            for research in component_research
+        )
+    
+    return all_research or "No detailed research available - using static knowledge base only"
+
+def extract_json_object(llm_output: str) -> Optional[Dict[str, Any]]:
+    """Parse a JSON object from model output, tolerating surrounding text"""
+    try:
+        # First try direct JSON parsing
+        data = json.loads(llm_output)
+    except json.JSONDecodeError:
+        # If that fails, scan for the first complete object in the response
+        return first_json_object(llm_output)
+    return data if isinstance(data, dict) else None
+
+def parse_assessment_output(ingredient: str, llm_output: str) -> RiskResult:
+    """Parse the final assessment JSON, tolerating surrounding text"""
+    data = extract_json_object(llm_output)
+    if data is None:
+        return RiskResult.failed(ingredient, f"Unable to parse AI response. Raw response: {llm_output[:200]}...")
+    return RiskResult.from_dict(data, ingredient)
+
+def _screening_messages(ingredient: str, breakdown_info: str, database: DatabaseAnalysis) -> List[Dict[str, str]]:
+    database_info = database.render() if database.has_data else "No database data found"
+    return build_assessment_messages(build_screening_prompt(ingredient, breakdown_info, database_info))
+
+def accept_screening(ingredient: str, data: Optional[Dict[str, Any]]) -> Optional[RiskResult]:
+    """Keep a fast-model screening result, or return None to escalate"""
+    if data is None:
+        reason = "unparseable screening"
+        result = None
+    else:
+        result = RiskResult.from_dict(data, ingredient)
+        reason = escalation_reason(result, data.get("confidence"))
+    if reason:
+        print(f"Escalating assessment of {ingredient} to {OPENAI_MODEL}: {reason}")
+        routing_stats["assessment_escalated"] += 1
+        return None
+    print(f"Fast assessment kept for {ingredient}: score {result.score}, confidence {data.get('confidence')}")
+    routing_stats["assessment_fast"] += 1
+    return result
+
+def screen_ingredient(ingredient: str, breakdown_info: str, database: DatabaseAnalysis) -> Optional[RiskResult]:
+    """Fast-model first pass. Returns the result when it can be kept, None to escalate"""
+    try:
+        chat = chat_completion(
+            model=OPENAI_FAST_MODEL,
+            response_format={"type": "json_object"},
+            messages=_screening_messages(ingredient, breakdown_info, database),
+            temperature=0.2,
+        )
+        data = extract_json_object((chat.choices[0].message.content or "").strip())
+    except Exception as e:
+        print(f"Screening of {ingredient} failed, escalating: {e}")
+        data = None
+    return accept_screening(ingredient, data)
+
+async def ascreen_ingredient(ingredient: str, breakdown_info: str, database: DatabaseAnalysis) -> Optional[RiskResult]:
+    """Async screen_ingredient"""
+    try:
+        chat = await achat_completion(
+            model=OPENAI_FAST_MODEL,
+            response_format={"type": "json_object"},
+            messages=_screening_messages(ingredient, breakdown_info, database),
+            temperature=0.2,
+        )
+        data = extract_json_object((chat.choices[0].message.content or "").strip())
+    except Exception as e:
+        print(f"Screening of {ingredient} failed, escalating: {e}")
+        data = None
+    return accept_screening(ingredient, data)
+
+def describe_breakdown(ingredient: str, breakdown_json: str) -> tuple:
+    """Prompt text for the breakdown and the components to research, in priority order"""
+    breakdown = parse_ingredient_breakdown(ingredient, breakdown_json)
+    if breakdown is not None:
+        return breakdown.render(), breakdown.research_targets()
+    return f"Component analysis: {breakdown_json}", [ingredient]  # Fallback to original ingredient
+
+def ingredient_stages(ingredient: str, breakdown_stage: Callable[..., Any], screening_stage: Callable[..., Any]) -> List[Stage]:
+    """The per-ingredient pipeline as a stage graph (see stage_graph.py).
+
+    usda + off -> database -> breakdown -> research_0..4 -> component_research, while
+    context and main_research need nothing and start at once. With model routing the
+    screening (breakdown + database) comes first and the research stages are only
+    added when it escalates, so a kept fast result costs no web searches.
+    breakdown_stage(database) returns describe_breakdown()'s tuple,
+    screening_stage(breakdown, database) an Optional[RiskResult].
+    """
+    def research_stages(components_to_analyze: List[str]) -> List[Stage]:
+        # Focus on top 5 most important components, each researched as soon as the breakdown names it
+        priority_components = components_to_analyze[:5] if web_search_enabled() else []
+        print(f"Performing detailed research on {len(priority_components)} key components")
+        names = tuple(f"research_{i}" for i in range(len(priority_components)))
+        stages = [Stage(name, lambda component=component: research_component(component))
+                  for name, component in zip(names, priority_components)]
+        stages.append(Stage("component_research", lambda **done: [done[name] for name in names], names))
+        return stages
+
+    context = Stage("context", lambda: retrieve_context(ingredient))
+    main_research = Stage("main_research", lambda: research_component(ingredient) if web_search_enabled() else None)
+    stages = [
+        Stage("usda", lambda: fetch_usda_food(ingredient)),
+        Stage("off", lambda: fetch_openfoodfacts_products(ingredient)),
+        Stage("database", lambda usda, off: DatabaseAnalysis(ingredient, *usda, *off), ("usda", "off")),
+    ]
+    if MODEL_ROUTING_ENABLED:
+        stages.append(Stage("breakdown", breakdown_stage, ("database",)))
+        stages.append(Stage(
+            "screening", screening_stage, ("breakdown", "database"),
+            expand=lambda result, done: [] if result is not None else research_stages(done["breakdown"][1]) + [context, main_research],
+        ))
+    else:
+        stages.append(Stage("breakdown", breakdown_stage, ("database",),
+                            expand=lambda breakdown, done: research_stages(breakdown[1])))
+        stages += [context, main_research]
+    return stages
+
+def research_prompt(ingredient: str, results: Dict[str, Any]) -> str:
+    """Full assessment prompt from the results of an escalated (or unrouted) stage graph"""
+    breakdown_info = results["breakdown"][0]
+    # Render all research into the prompt only now, at the final step
+    all_research = render_research(ingredient, results["database"], results["main_research"], results["component_research"])
+    return build_assessment_prompt(ingredient, breakdown_info, all_research, results["context"])
+
+def finish_assessment(ingredient: str, result: RiskResult, database: DatabaseAnalysis) -> RiskResult:
+    if not isinstance(result.score, (int, float)):
+        # An unparseable answer is a failed result: keep it out of the list cache too
+        record_upstream_failure("openai", result.explanation)
+    result.name = ingredient
+    # Prefer the NOVA group read directly from OpenFoodFacts over the model's extraction
+    if result.nova_group is None:
+        result.nova_group = database.nova_group()
+    return result
+
+def assess_ingredient(ingredient: str) -> RiskResult:
+    """Run the full research + assessment pipeline for a single ingredient"""
+    # Steps 1-4 run as a stage graph, each stage starting as soon as its inputs are ready:
+    # database lookups (USDA + OpenFoodFacts), component breakdown, fast-model screening
+    # when routing is enabled, and the web research and context for the full prompt.
+    # Under profile=1 they run inline so cProfile, which sees one thread, covers them.
+    print(f"Querying food databases and analyzing component breakdown for: {ingredient}")
+    results = run_stages(ingredient_stages(
+        ingredient,
+        lambda database: describe_breakdown(ingredient, get_ingredient_breakdown(ingredient, database)),
+        lambda breakdown, database: screen_ingredient(ingredient, breakdown[0], database),
+    ), InlineExecutor() if in_profile_call.get() else get_stage_executor())
+    database = results["database"]
+    
+    # A confident, clear-cut screening result is kept
+    if results.get("screening") is not None:
+        return finish_assessment(ingredient, results["screening"], database)
+    
+    prompt = research_prompt(ingredient, results)
+    
+    try:
+        # Step 5: Generate response using OpenAI Chat Completions in JSON mode
+        chat = chat_completion(
+            model=OPENAI_MODEL,
+            response_format={"type": "json_object"},
+            messages=build_assessment_messages(prompt),
+            temperature=0.2,
+        )
+
+        llm_output = (chat.choices[0].message.content or "").strip()
         
-        try:
-            # Generate response using OpenAI Chat Completions in JSON mode
-            if not openai_client:
-                raise RuntimeError("OPENAI_API_KEY is not configured")
+        # Debug: Print what the AI returned
+        print(f"AI response for {ingredient}: {llm_output[:500]}...")
+        
+        result = parse_assessment_output(ingredient, llm_output)
+    except Exception as e:
+        record_upstream_failure("openai", e)
+        return RiskResult.failed(ingredient, f"Error during analysis: {str(e)}")
+    
+    return finish_assessment(ingredient, result, database)
+
+async def aassess_ingredient(ingredient: str, on_field: Optional[Callable[[str, Any], None]] = None) -> RiskResult:
+    """Async assess_ingredient: OpenAI calls are awaited, database and web research run in worker threads.
+
+    With on_field, the final assessment is streamed and its fields are reported as they arrive.
+    """
+    async def breakdown_stage(database: DatabaseAnalysis) -> tuple:
+        return describe_breakdown(ingredient, await aget_ingredient_breakdown(ingredient, database))
+
+    async def screening_stage(breakdown: tuple, database: DatabaseAnalysis) -> Optional[RiskResult]:
+        return await ascreen_ingredient(ingredient, breakdown[0], database)
 
-            chat = openai_client.chat.completions.create(
+    print(f"Querying food databases and analyzing component breakdown for: {ingredient}")
+    results = await arun_stages(ingredient_stages(ingredient, breakdown_stage, screening_stage))
+    database = results["database"]
+    
+    if results.get("screening") is not None:
+        return finish_assessment(ingredient, results["screening"], database)
+    
+    prompt = research_prompt(ingredient, results)
+    
+    try:
+        if on_field is not None:
+            data = await astream_json_completion(
+                on_field,
                 model=OPENAI_MODEL,
                 response_format={"type": "json_object"},
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an expert in food safety and carcinogen risk assessment. "
-                            "Always output only valid JSON with the required keys."
-                        ),
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    },
-                ],
+                messages=build_assessment_messages(prompt),
+                temperature=0.2,
+            )
+            if data is None:
+                return RiskResult.failed(ingredient, "AI response ended before the JSON object was complete")
+            result = RiskResult.from_dict(data, ingredient)
+        else:
+            chat = await achat_completion(
+                model=OPENAI_MODEL,
+                response_format={"type": "json_object"},
+                messages=build_assessment_messages(prompt),
                 temperature=0.2,
             )
-
             llm_output = (chat.choices[0].message.content or "").strip()
-            
-            # Debug: Print what the AI returned
             print(f"AI response for {ingredient}: {llm_output[:500]}...")
-            
-            # Try to parse JSON from response
-            try:
-                # First try direct JSON parsing
-                result = json.loads(llm_output)
-                results.append(result)
-            except json.JSONDecodeError:
-                # If that fails, try to extract JSON from the response
-                import re
-                json_match = re.search(r'\{.*\}', llm_output, re.DOTALL)
-                if json_match:
-                    try:
-                        extracted_json = json_match.group(0)
-                        result = json.loads(extracted_json)
-                        results.append(result)
-                    except json.JSONDecodeError:
-                        # If still fails, create a fallback entry
-                        results.append({
-                            "name": ingredient,
-                            "risk_level": "unknown",
-                            "score": "unknown", 
-                            "source": "N/A",
-                            "explanation": f"Unable to parse AI response. Raw response: {llm_output[:200]}...",
-                            "nova_group": None
-                        })
-                else:
-                    # No JSON found in response
-                    results.append({
-                        "name": ingredient,
-                        "risk_level": "unknown",
-                        "score": "unknown", 
-                        "source": "N/A",
-                        "explanation": f"AI did not return valid JSON. Raw response: {llm_output[:200]}...",
-                        "nova_group": None
-                    })
-        
-        except Exception as e:
-            results.append({
-                "name": ingredient,
-                "risk_level": "unknown",
-                "score": "unknown",
-                "source": "N/A", 
-                "explanation": f"Error during analysis: {str(e)}",
-                "nova_group": None
-            })
-        
-        # Apply fallback logic
-        result = fill_missing_with_known(ingredient_list, results)
-        ingredient_cache[cache_key] = result
-        
-        # Add warning if any score > 80
-        high_risk = [item["name"] for item in result if isinstance(item.get("score"), (int, float)) and item["score"] > 80]
-        warning = None
-        if high_risk:
-            warning = f"Warning: High carcinogen risk for: {', '.join(high_risk)}."
-        
+            result = parse_assessment_output(ingredient, llm_output)
+    except Exception as e:
+        record_upstream_failure("openai", e)
+        return RiskResult.failed(ingredient, f"Error during analysis: {str(e)}")
+    
+    return finish_assessment(ingredient, result, database)
+
+def get_ingredient_assessment(ingredient: str, refresh: bool = False) -> RiskResult:
+    """Per-ingredient assessment, cached by normalized ingredient name.
+
+    Shared by free-text analysis, barcode lookups and batches, so an ingredient
+    assessed for one product is reused for every other product containing it.
+    refresh=True recomputes and overwrites the cached entry, bypassing the completion memo.
+    """
+    token = fresh_completions.set(True) if refresh else None
+    try:
+        data = (assessment_cache.refresh if refresh else assessment_cache.get_or_load)(
+            normalize_key(ingredient),
+            lambda: assess_ingredient(ingredient).to_dict(),
+            cacheable=lambda value: isinstance(value.get("score"), (int, float)),
+        )
+    finally:
+        if token is not None:
+            fresh_completions.reset(token)
+    result = RiskResult.from_dict(data, ingredient)
+    result.name = ingredient
+    return result
+
+async def aget_ingredient_assessment(ingredient: str,
+                                     on_field: Optional[Callable[[str, Any], None]] = None) -> RiskResult:
+    """Async get_ingredient_assessment sharing the same cache entries"""
+    data = await assessment_cache.aget_or_load(
+        normalize_key(ingredient),
+        lambda: _aassess_to_dict(ingredient, on_field),
+        lambda: assess_ingredient(ingredient).to_dict(),
+        cacheable=lambda value: isinstance(value.get("score"), (int, float)),
+    )
+    result = RiskResult.from_dict(data, ingredient)
+    result.name = ingredient
+    return result
+
+async def _aassess_to_dict(ingredient: str, on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+    return (await aassess_ingredient(ingredient, on_field)).to_dict()
+
+def annotate_label(result: List[Dict[str, Any]], entries: List[tuple]) -> List[Dict[str, Any]]:
+    """Add the label annotations (part_of, percent, e_number, ...) of each entry to its result"""
+    for item, (_, notes) in zip(result, entries):
+        item.update(notes)
+    return result
+
+def usda_nutrients(key: str) -> Optional[List[Dict[str, Any]]]:
+    """Nutrients of the cached USDA match for an ingredient (never fetches)"""
+    data = usda_cache.peek(key)
+    return data["food"]["nutrients"] if data and data.get("food") else None
+
+def score_result_lists(result_lists: List[List[Dict[str, Any]]]) -> ProductScores:
+    """Product-level scores of several per-ingredient result lists, ranked against each other"""
+    records: Dict[str, tuple] = {}
+    products = []
+    for result in result_lists:
+        keys = [normalize_key(item["name"]) for item in result]
+        for key, item in zip(keys, result):
+            if key not in records:
+                records[key] = (key, item, usda_nutrients(key))
+        products.append(keys)
+    return score_catalog(products, IngredientTable.from_records(records.values()))
+
+def build_ingredients_response(result: List[Dict[str, Any]], cached: bool, degraded: bool = False,
+                               summary: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Wrap per-ingredient results with the product-level summary, adding a warning if any score > 80.
+
+    degraded marks results computed while an upstream failed; they are not cached.
+    Reads cached USDA nutrients, so async callers run it in a thread.
+    """
+    high_risk = [item["name"] for item in result if isinstance(item.get("score"), (int, float)) and item["score"] > 80]
+    response_json: Dict[str, Any] = {"ingredients": result}
+    if high_risk:
+        response_json["warning"] = f"Warning: High carcinogen risk for: {', '.join(high_risk)}."
+    if summary is None:
+        summary = score_result_lists([result]).to_dict(0)
+        # Rankings only mean something within a batch
+        summary.pop("rank")
+        summary.pop("percentile")
+    response_json["summary"] = summary
+    response_json["cached"] = cached
+    if degraded:
+        response_json["degraded"] = True
+    return response_json
+
+def list_cache_key(ingredients: str) -> str:
+    # Whole-list results are not migrated; on a version change they are rebuilt from per-ingredient assessments
+    names = ",".join(sorted(name.lower() for name in ingredient_names(ingredients)))
+    return f"list:{ASSESSMENT_CACHE_VERSION}:{names}"
+
+def analyze_ingredients(ingredients: str):
+    # First, validate that all inputs are food products
+    validation_result = validate_food_input(ingredients)
+    if not validation_result["is_valid"]:
+        return {
+            "error": f"Non-food items detected: {', '.join(validation_result['non_food_items'])}. Please enter only food products, ingredients, or consumable items.",
+            "validation_details": validation_result
+        }
+    
+    print(f"Validation passed for: {ingredients}")
+    
+    cache_key = list_cache_key(ingredients)
+    result = get_ingredient_cache().get(cache_key)
+    if result is not None:
         log_analysis(ingredients, json.dumps(result), None)
-        response_json = {"ingredients": result}
-        if warning:
-            response_json["warning"] = warning
-        response_json["cached"] = False
-        return response_json
+        return build_ingredients_response(result, cached=True)
+    
+    # Sub-ingredients listed on the label are assessed directly, in place of their compound ingredient
+    entries = label_entries(ingredients)
+    ingredient_list = [name for name, _ in entries]
+    results: List[RiskResult] = []
+    
+    with collect_failures() as failures:
+        for ingredient in ingredient_list:
+            if not ingredient or ingredient.lower() == "ingredients":
+                continue
+            results.append(get_ingredient_assessment(ingredient))
+    
+    # Apply fallback logic
+    result = annotate_label(fill_missing_with_known(ingredient_list, results), entries)
+    if not failures:
+        get_ingredient_cache().set(cache_key, result)
+    
+    log_analysis(ingredients, json.dumps(result), None)
+    return build_ingredients_response(result, cached=False, degraded=bool(failures))
+
+async def aanalyze_ingredients(ingredients: str):
+    """Async analyze_ingredients: the ingredients of the list are assessed concurrently.
+
+    Waiting on OpenAI holds no thread; the openai scheduler bounds how many calls
+    run at once across the whole process.
+    """
+    validation_result = await avalidate_food_input(ingredients)
+    if not validation_result["is_valid"]:
+        return {
+            "error": f"Non-food items detected: {', '.join(validation_result['non_food_items'])}. Please enter only food products, ingredients, or consumable items.",
+            "validation_details": validation_result
+        }
+    
+    print(f"Validation passed for: {ingredients}")
+    
+    cache_key = list_cache_key(ingredients)
+    result = await asyncio.to_thread(get_ingredient_cache().get, cache_key)
+    if result is not None:
+        await asyncio.to_thread(log_analysis, ingredients, json.dumps(result), None)
+        return await asyncio.to_thread(build_ingredients_response, result, True)
+    
+    entries = label_entries(ingredients)
+    ingredient_list = [name for name, _ in entries]
+    to_assess = [i for i in ingredient_list if i.lower() != "ingredients"]
+    with collect_failures() as failures:
+        results = await asyncio.gather(*(aget_ingredient_assessment(i) for i in to_assess))
+    
+    # Apply fallback logic
+    result = annotate_label(fill_missing_with_known(ingredient_list, list(results)), entries)
+    if not failures:
+        await asyncio.to_thread(get_ingredient_cache().set, cache_key, result)
+    
+    await asyncio.to_thread(log_analysis, ingredients, json.dumps(result), None)
+    return await asyncio.to_thread(build_ingredients_response, result, False, bool(failures))
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_ingredient_events(ingredients: str):
+    """Server-sent events for an ingredient list.
+
+    "field" events carry risk_level/score of an ingredient as soon as the model
+    produces them, "result" events each finished ingredient, and a final "done"
+    event the same response body as POST /ingredients.
+    """
+    validation_result = await avalidate_food_input(ingredients)
+    if not validation_result["is_valid"]:
+        yield sse_event("error", {
+            "error": f"Non-food items detected: {', '.join(validation_result['non_food_items'])}. Please enter only food products, ingredients, or consumable items.",
+            "validation_details": validation_result
+        })
+        return
+    
+    cache_key = list_cache_key(ingredients)
+    result = await asyncio.to_thread(get_ingredient_cache().get, cache_key)
+    if result is not None:
+        for item in result:
+            yield sse_event("result", item)
+        await asyncio.to_thread(log_analysis, ingredients, json.dumps(result), None)
+        yield sse_event("done", await asyncio.to_thread(build_ingredients_response, result, True))
+        return
+    
+    entries = label_entries(ingredients)
+    ingredient_list = [name for name, _ in entries]
+    events: asyncio.Queue = asyncio.Queue()
+    
+    async def assess(ingredient: str, notes: Dict[str, Any]) -> RiskResult:
+        def on_field(field: str, value: Any) -> None:
+            if field in STREAM_EARLY_FIELDS:
+                events.put_nowait(sse_event("field", {"name": ingredient, "field": field, "value": value}))
+        assessment = await aget_ingredient_assessment(ingredient, on_field)
+        events.put_nowait(sse_event("result", {**fill_missing_with_known([ingredient], [assessment])[0], **notes}))
+        return assessment
+    
+    with collect_failures() as failures:
+        # The collector is bound to each task's context when the tasks are created
+        assessments = asyncio.ensure_future(asyncio.gather(
+            *(assess(name, notes) for name, notes in entries if name.lower() != "ingredients")
+        ))
+    while not assessments.done():
+        next_event = asyncio.ensure_future(events.get())
+        await asyncio.wait({next_event, assessments}, return_when=asyncio.FIRST_COMPLETED)
+        if next_event.done():
+            yield next_event.result()
+        else:
+            next_event.cancel()
+    while not events.empty():
+        yield events.get_nowait()
+    
+    result = annotate_label(fill_missing_with_known(ingredient_list, list(assessments.result())), entries)
+    if not failures:
+        await asyncio.to_thread(get_ingredient_cache().set, cache_key, result)
+    await asyncio.to_thread(log_analysis, ingredients, json.dumps(result), None)
+    yield sse_event("done", await asyncio.to_thread(build_ingredients_response, result, False, bool(failures)))
+
+def plan_batch(products: List[tuple]) -> Dict[str, str]:
+    """Collect the distinct ingredient vocabulary of a batch.
+
+    Returns normalized name -> first spelling seen, in first-seen order.
+    """
+    vocabulary: Dict[str, str] = {}
+    for _, ingredients in products:
+        for ingredient in ingredient_names(ingredients):
+            key = normalize_key(ingredient)
+            if key and key != "ingredients" and key not in vocabulary:
+                vocabulary[key] = ingredient
+    return vocabulary
+
+def validate_vocabulary(vocabulary: Dict[str, str]) -> set:
+    """Validate the distinct batch vocabulary in chunks. Returns normalized non-food names"""
+    non_food = set()
+    names = list(vocabulary.values())
+    for start in range(0, len(names), BATCH_VALIDATION_CHUNK):
+        validation_result = validate_food_input(", ".join(names[start:start + BATCH_VALIDATION_CHUNK]))
+        non_food.update(normalize_key(item) for item in validation_result.get("non_food_items", []))
+    return non_food
+
+def assess_collecting_failures(ingredient: str) -> tuple:
+    """(assessment, whether an upstream failed while computing it)"""
+    with collect_failures() as failures:
+        result = get_ingredient_assessment(ingredient)
+    return result, bool(failures)
+
+def assess_vocabulary(names: List[str]) -> tuple:
+    """Assess each distinct ingredient once, BATCH_CONCURRENCY at a time, in the caller's context.
+
+    Returns (normalized name -> RiskResult, normalized names whose assessment saw an upstream failure).
+    """
+    assessments: Dict[str, RiskResult] = {}
+    degraded = set()
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix="batch") as pool:
+        for name, (result, failed) in zip(names, pool.map(run_in_context(assess_collecting_failures), names)):
+            assessments[normalize_key(name)] = result
+            if failed:
+                degraded.add(normalize_key(name))
+    return assessments, degraded
+
+def product_results(ingredient_list: List[str], assessments: Dict[str, RiskResult]) -> List[RiskResult]:
+    """One product's results from the shared batch assessments, under the product's own spellings"""
+    results = []
+    for ingredient in ingredient_list:
+        assessment = assessments.get(normalize_key(ingredient))
+        if assessment is not None:
+            results.append(RiskResult(ingredient, assessment.risk_level, assessment.score, assessment.source,
+                                      assessment.explanation, assessment.nova_group))
+    return results
+
+def analyze_batch(products: List[tuple]) -> Dict[str, Any]:
+    """Analyze many (product, ingredients) pairs, assessing each distinct ingredient once. Keyed by product"""
+    return {product: response for (product, _), response in zip(products, analyze_product_batch(products))}
+
+def analyze_product_batch(products: List[tuple], ranked: bool = True, log: bool = True) -> List[Dict[str, Any]]:
+    """Responses for many (product, ingredients) pairs, in input order.
+
+    The cost of a catalog upload is bounded by its distinct ingredient vocabulary:
+    validation runs once per chunk of unique names, assessments run once per unique
+    ingredient with bounded concurrency, and per-product results are assembled after.
+    ranked=False leaves out the batch-relative rank and percentile (batch_analyze.py
+    scores catalogs in independent chunks). log=False keeps the products out of
+    analysis_log, whose popularity counts drive the cache warm-up.
+    """
+    request_priority.set(BATCH)
+    vocabulary = plan_batch(products)
+    print(f"Batch of {len(products)} products has {len(vocabulary)} distinct ingredients")
+    
+    non_food = validate_vocabulary(vocabulary)
+    to_assess = [name for key, name in vocabulary.items() if key not in non_food]
+    
+    assessments, degraded = assess_vocabulary(to_assess)
+    
+    responses: List[Optional[Dict[str, Any]]] = [None] * len(products)
+    assembled = []
+    for i, (product, ingredients) in enumerate(products):
+        entries = label_entries(ingredients)
+        ingredient_list = [name for name, _ in entries]
+        rejected = [i for i in ingredient_list if normalize_key(i) in non_food]
+        if rejected:
+            responses[i] = {
+                "error": f"Non-food items detected: {', '.join(rejected)}. Please enter only food products, ingredients, or consumable items.",
+            }
+            continue
+        result = annotate_label(fill_missing_with_known(ingredient_list, product_results(ingredient_list, assessments)), entries)
+        product_degraded = any(normalize_key(i) in degraded for i in ingredient_list)
+        if not product_degraded:
+            get_ingredient_cache().set(list_cache_key(ingredients), result)
+        if log:
+            log_analysis(ingredients, json.dumps(result), None)
+        assembled.append((i, result, product_degraded))
+    
+    # Score every product of the batch in one vectorized pass so ranks compare the whole batch
+    scores = score_result_lists([result for _, result, _ in assembled])
+    for j, (i, result, product_degraded) in enumerate(assembled):
+        summary = scores.to_dict(j)
+        if not ranked:
+            summary.pop("rank")
+            summary.pop("percentile")
+        responses[i] = build_ingredients_response(result, cached=False, degraded=product_degraded, summary=summary)
+    return responses
+
+# Endpoints that spend upstream quota: callers are identified and charged
+METERED_PATH_PREFIXES = ("/ingredients", "/products")
+
+def request_api_key(request: Request) -> Optional[str]:
+    auth = request.headers.get("Authorization", "")
+    if auth.lower().startswith("bearer "):
+        return auth[7:].strip()
+    return request.headers.get("X-API-Key")
+
+def quota_response(client_id: str, retry_after: float, estimated_cost: Optional[float] = None) -> JSONResponse:
+    retry_after = max(1, math.ceil(min(retry_after, 3600)))
+    content: Dict[str, Any] = {"error": f"Quota exceeded for client '{client_id}'. Please retry later.", "retry_after": retry_after}
+    if estimated_cost is not None:
+        content["estimated_cost"] = estimated_cost
+    return JSONResponse(status_code=429, content=content, headers={"Retry-After": str(retry_after)})
+
+@app.middleware("http")
+async def assign_client_and_priority(request: Request, call_next):
+    """Tag the request with its client id and priority class for upstream scheduling"""
+    remote_addr = request.client.host if request.client else "anonymous"
+    request_client.set(request.headers.get("X-Client-Id") or remote_addr)
+    # Clients may voluntarily downgrade themselves to batch priority, never upgrade
+    request_priority.set(BATCH if request.headers.get("X-Priority", "").lower() == BATCH else INTERACTIVE)
+    request_deadline.set(time.monotonic() + REQUEST_DEADLINE)
+    # fresh=1 (admin only) asks for newly generated completions instead of memoized ones
+    fresh = request.query_params.get("fresh", "").lower() in ("1", "true")
+    if fresh:
+        denied = admin_rejection(request)
+        if denied is not None:
+            return denied
+    fresh_completions.set(fresh)
+    account = None
+    if QUOTA_ENABLED and request.url.path.startswith(METERED_PATH_PREFIXES):
+        account = quota_manager.authenticate(request_api_key(request), remote_addr)
+        if account is None:
+            return JSONResponse(status_code=401, content={"error": "Invalid or missing API key."})
+        if account.keyed:
+            request_client.set(account.client_id)
+        # A client still in debt from earlier requests waits until its bucket refills
+        wait = account.bucket.wait_time(1)
+        if wait > 0:
+            return quota_response(account.client_id, wait)
+        request_account.set(account)
+        quota_manager.record_request(account)
+    response = await call_next(request)
+    if account is not None:
+        response.headers["X-Quota-Remaining"] = str(max(0, math.floor(account.bucket.level())))
+    return response
+
+def estimated_cost(names: List[str]) -> float:
+    """Pessimistic upstream cost of the ingredients that have no cached assessment"""
+    keys = {normalize_key(name) for name in names if name.strip() and name.strip().lower() != "ingredients"}
+    return sum(ESTIMATED_INGREDIENT_COST for key in keys if assessment_cache.peek(key) is None)
+
+async def quota_rejection(names: List[str]) -> Optional[JSONResponse]:
+    """429 when the request's estimated cost does not fit the client's bucket (at most a full bucket is required)"""
+    account = request_account.get()
+    if account is None:
+        return None
+    cost = await asyncio.to_thread(estimated_cost, names)
+    wait = account.bucket.wait_time(cost)
+    return quota_response(account.client_id, wait, cost) if wait > 0 else None
+
+def cached_only_response(ingredients: str) -> Optional[Dict[str, Any]]:
+    """Answer from caches alone (any age or version), or None when an ingredient was never assessed"""
+    result = get_ingredient_cache().get(list_cache_key(ingredients))
+    if result is not None:
+        return build_ingredients_response(result, cached=True)
+    entries = label_entries(ingredients)
+    ingredient_list = [name for name, _ in entries]
+    results = []
+    for ingredient in ingredient_list:
+        if ingredient.lower() == "ingredients":
+            continue
+        data = assessment_cache.peek(normalize_key(ingredient), any_version=True)
+        if data is None:
+            return None
+        results.append(RiskResult.from_dict(data, ingredient))
+    if not results:
+        return None
+    result = annotate_label(fill_missing_with_known(ingredient_list, results), entries)
+    response_json = build_ingredients_response(result, cached=True, degraded=True)
+    response_json["cache_only"] = True
+    return response_json
+
+def shed_response(rejection: Rejection) -> JSONResponse:
+    retry_after = max(1, math.ceil(rejection.retry_after))
+    return JSONResponse(
+        status_code=rejection.status,
+        content={"error": f"Server busy: {rejection.reason}. Please retry later.", "retry_after": retry_after},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+def admin_rejection(request: Request) -> Optional[JSONResponse]:
+    """403 unless the request carries the admin key"""
+    key = request.headers.get("X-Admin-Key", "")
+    if not ADMIN_API_KEY or not hmac.compare_digest(key.encode("utf-8"), ADMIN_API_KEY.encode("utf-8")):
+        return JSONResponse(status_code=403, content={"error": "Admin key required."})
+    return None
+
+async def profiled_analysis(ingredients: str):
+    """analyze_ingredients under cProfile.
+
+    The sync path runs in one worker thread, and profile_call makes its pipeline
+    stages run inline in that thread, so the profile covers the whole analysis.
+    """
+    try:
+        result, profile = await asyncio.to_thread(run_in_context(profile_call), analyze_ingredients, ingredients)
+    except ProfilerBusy as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    return {**result, "profile": profile}
 
 @app.post("/ingredients")
-def get_llm_response(
-    request: Union[IngredientRequest, list[ProductRequest]] = Body(...)
+async def get_llm_response(
+    http_request: Request,
+    request: Union[IngredientRequest, list[ProductRequest]] = Body(...),
+    profile: bool = False,
 ):
     # Batch mode: list of products
     if isinstance(request, list):
-        batch_results = {}
+        products = []
         for prod in request:
             if not isinstance(prod, dict) and not isinstance(prod, ProductRequest):
                 continue
             prod_name = prod["product"] if isinstance(prod, dict) else prod.product
             prod_ingredients = prod["ingredients"] if isinstance(prod, dict) else prod.ingredients
-            batch_results[prod_name] = analyze_ingredients(prod_ingredients)
-        return batch_results
+            products.append((prod_name, prod_ingredients))
+        over_quota = await quota_rejection([name for _, text in products for name in ingredient_names(text)])
+        if over_quota is not None:
+            return over_quota
+        rejection = admission.try_acquire(batch=True)
+        if rejection is not None:
+            return shed_response(rejection)
+        try:
+            return await asyncio.to_thread(analyze_batch, products)
+        finally:
+            admission.release()
     # Single mode: one ingredient string
-    elif isinstance(request, IngredientRequest):
-        return analyze_ingredients(request.ingredients)
-    # Fallback: try to parse as dict
-    elif isinstance(request, dict) and "ingredients" in request:
-        return analyze_ingredients(request["ingredients"])
+    elif isinstance(request, (IngredientRequest, dict)):
+        ingredients = request.ingredients if isinstance(request, IngredientRequest) else request.get("ingredients")
+        if ingredients is None:
+            return {"error": "Invalid request format."}
+        over_quota = await quota_rejection(ingredient_names(ingredients))
+        if over_quota is not None:
+            return over_quota
+        denied = admin_rejection(http_request) if profile else None
+        if denied is not None:
+            return denied
+        rejection = admission.try_acquire(batch=request_priority.get() == BATCH)
+        if rejection is not None:
+            # Shed, but answer from the caches when every ingredient has been assessed before
+            cached = await asyncio.to_thread(cached_only_response, ingredients)
+            return cached if cached is not None else shed_response(rejection)
+        try:
+            if profile:
+                return await profiled_analysis(ingredients)
+            if OPENAI_ASYNC:
+                return await aanalyze_ingredients(ingredients)
+            return await asyncio.to_thread(analyze_ingredients, ingredients)
+        finally:
+            admission.release()
     else:
         return {"error": "Invalid request format."}
 
+async def _release_when_done(events):
+    try:
+        async for event in events:
+            yield event
+    finally:
+        admission.release()
+
+@app.post("/ingredients/stream")
+async def stream_llm_response(request: IngredientRequest):
+    """Like POST /ingredients, streamed as server-sent events"""
+    over_quota = await quota_rejection(ingredient_names(request.ingredients))
+    if over_quota is not None:
+        return over_quota
+    rejection = admission.try_acquire(batch=request_priority.get() == BATCH)
+    if rejection is not None:
+        cached = await asyncio.to_thread(cached_only_response, request.ingredients)
+        if cached is None:
+            return shed_response(rejection)
+        events = iter([sse_event("done", cached)])
+        return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+    return StreamingResponse(
+        _release_when_done(stream_ingredient_events(request.ingredients)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def ndjson_lines(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[tuple]:
+    """(line number, text) for each non-blank line of an NDJSON byte stream; text is None for over-long lines.
+
+    Only the current partial line is buffered, and at most max_bytes of it.
+    """
+    buffer = bytearray()
+    number = 1
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            line = bytes(buffer[start:end])
+            start = end + 1
+            if skipping or len(line) > max_bytes:
+                yield number, None
+            elif line.strip():
+                yield number, line.decode("utf-8", "replace")
+            skipping = False
+            number += 1
+        del buffer[:start]
+        if len(buffer) > max_bytes:
+            skipping = True
+            buffer.clear()
+    if skipping:
+        yield number, None
+    elif buffer.strip():
+        yield number, buffer.decode("utf-8", "replace")
+
+async def ndjson_product_result(number: int, line: Optional[str]) -> Dict[str, Any]:
+    """Result record for one NDJSON input line: its line number, product and the POST /ingredients response"""
+    if line is None:
+        return {"line": number, "error": f"Line longer than {NDJSON_MAX_LINE_BYTES} bytes."}
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"line": number, "error": f"Invalid JSON: {e}"}
+    if not isinstance(data, dict) or not isinstance(data.get("ingredients"), str):
+        return {"line": number, "error": 'Expected an object with "product" and "ingredients".'}
+    record: Dict[str, Any] = {"line": number, "product": data.get("product")}
+    over_quota = await quota_rejection(ingredient_names(data["ingredients"]))
+    if over_quota is not None:
+        record.update(json.loads(over_quota.body))
+        return record
+    # Each product gets the full request deadline, however long the upload runs
+    request_deadline.set(time.monotonic() + REQUEST_DEADLINE)
+    try:
+        if OPENAI_ASYNC:
+            record.update(await aanalyze_ingredients(data["ingredients"]))
+        else:
+            record.update(await asyncio.to_thread(analyze_ingredients, data["ingredients"]))
+    except Exception as e:
+        record["error"] = f"Error during analysis: {str(e)}"
+    return record
+
+async def ndjson_batch_results(chunks: AsyncIterator[bytes]):
+    """NDJSON result lines for an NDJSON product stream, in completion order.
+
+    A reader task feeds a queue of NDJSON_CONCURRENCY products to as many workers,
+    whose results pass through an equally small queue to the response. When the
+    client stops reading results the workers block, then the reader, and the
+    upload stalls: memory stays flat however large the upload is.
+    """
+    request_priority.set(BATCH)
+    products: asyncio.Queue = asyncio.Queue(maxsize=NDJSON_CONCURRENCY)
+    results: asyncio.Queue = asyncio.Queue(maxsize=NDJSON_CONCURRENCY)
+
+    async def read():
+        try:
+            async for item in ndjson_lines(chunks, NDJSON_MAX_LINE_BYTES):
+                await products.put(item)
+        except Exception as e:
+            # A client disconnect or a broken upload ends the input; what was read is still answered
+            print(f"NDJSON upload ended early: {e}")
+        for _ in range(NDJSON_CONCURRENCY):
+            await products.put(None)
+
+    async def work():
+        while True:
+            item = await products.get()
+            if item is None:
+                break
+            await results.put(await ndjson_product_result(*item))
+        await results.put(None)
+
+    tasks = [asyncio.create_task(read())] + [asyncio.create_task(work()) for _ in range(NDJSON_CONCURRENCY)]
+    finished = 0
+    try:
+        while finished < NDJSON_CONCURRENCY:
+            record = await results.get()
+            if record is None:
+                finished += 1
+                continue
+            yield json.dumps(record) + "\n"
+    finally:
+        # The client went away (or everything is done): stop reading and analyzing
+        for task in tasks:
+            task.cancel()
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse for endpoints still reading the request body while they respond.
+
+    StreamingResponse watches for client disconnects by calling receive() itself,
+    which would swallow the body chunks of a concurrently streamed upload. Here a
+    disconnect is noticed by the body reader (ClientDisconnect) or a failed send.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+@app.post("/ingredients/ndjson")
+async def stream_batch_ndjson(request: Request):
+    """Batch mode over NDJSON: one {"product", "ingredients"} object per request line, one result line per
+    product as soon as it finishes. The upload is parsed incrementally, with backpressure in both directions."""
+    rejection = admission.try_acquire(batch=True)
+    if rejection is not None:
+        return shed_response(rejection)
+    return DuplexStreamingResponse(
+        _release_when_done(ndjson_batch_results(request.stream())),
+        media_type="application/x-ndjson",
+        headers={"X-Accel-Buffering": "no"},
+    )
+
+class BarcodeBatchRequest(BaseModel):
+    barcodes: List[str]
+
+def lookup_barcode(barcode: str) -> tuple:
+    """(product, label entries, None) for a barcode with an ingredient list, else (None, None, error response)"""
+    barcode = barcode.strip()
+    if not barcode.isdigit() or not 8 <= len(barcode) <= 14:
+        return None, None, {"barcode": barcode, "error": "Invalid barcode: expected 8-14 digits.", "status": 400}
+    
+    product, error = fetch_product_by_barcode(barcode)
+    if product is None:
+        status = 404 if error == "Product not found" else 502
+        return None, None, {"barcode": barcode, "error": f"{error} for barcode {barcode}.", "status": status}
+    
+    entries = label_entries(product.ingredients_text)
+    if not entries:
+        return None, None, {"barcode": barcode, "error": "Product has no ingredient list on OpenFoodFacts.", "status": 404}
+    return product, entries, None
+
+def barcode_response(barcode: str, product: OpenFoodFactsProduct, entries: list,
+                     assessments: Dict[str, RiskResult], degraded: set) -> Dict[str, Any]:
+    """Response for one looked-up product from the assessments of its ingredients"""
+    ingredient_list = [name for name, _ in entries]
+    result = annotate_label(fill_missing_with_known(ingredient_list, product_results(ingredient_list, assessments)), entries)
+    log_analysis(f"barcode:{barcode}", json.dumps(result), None)
+    
+    product_degraded = any(normalize_key(name) in degraded for name in ingredient_list)
+    response_json = build_ingredients_response(result, cached=False, degraded=product_degraded)
+    response_json.pop("cached")
+    response_json["barcode"] = barcode
+    response_json["product"] = {
+        "name": product.product_name,
+        "brands": product.brands,
+        "nova_group": product.nova_group,
+        "additives": product.additives,
+        "ingredients_text": product.ingredients_text,
+    }
+    return response_json
+
+def assess_barcode(barcode: str, product: OpenFoodFactsProduct, entries: list) -> Dict[str, Any]:
+    """Analyze one exact product: its label ingredients go straight into the per-ingredient pipeline"""
+    assessments, degraded = assess_vocabulary(list(plan_batch([(barcode, product.ingredients_text)]).values()))
+    return barcode_response(barcode, product, entries, assessments, degraded)
+
+def analyze_barcode_batch(barcodes: List[str], looked_up: List[tuple]) -> Dict[str, Any]:
+    """Responses keyed by barcode for products already looked up, assessing each distinct ingredient once"""
+    request_priority.set(BATCH)
+    found = [(barcode, product.ingredients_text) for barcode, (product, _, _) in zip(barcodes, looked_up) if product]
+    vocabulary = plan_batch(found)
+    print(f"Barcode batch of {len(found)} products has {len(vocabulary)} distinct ingredients")
+    assessments, degraded = assess_vocabulary(list(vocabulary.values()))
+    
+    results = {}
+    for barcode, (product, entries, error) in zip(barcodes, looked_up):
+        if error is not None:
+            error.pop("status", None)
+            results[barcode] = error
+        else:
+            results[barcode] = barcode_response(barcode, product, entries, assessments, degraded)
+    return results
+
+@app.get("/products/{barcode}")
+async def get_product_by_barcode(barcode: str):
+    """Exact product lookup by barcode (cacheable alternative to fuzzy name search)"""
+    rejection = admission.try_acquire(batch=request_priority.get() == BATCH)
+    if rejection is not None:
+        return shed_response(rejection)
+    try:
+        product, entries, error = await asyncio.to_thread(run_in_context(lookup_barcode), barcode)
+        if error is not None:
+            return JSONResponse(status_code=error.pop("status"), content=error)
+        # The ingredient list is only known after the lookup; the assessments are checked against the quota before they start
+        over_quota = await quota_rejection([name for name, _ in entries])
+        if over_quota is not None:
+            return over_quota
+        return await asyncio.to_thread(run_in_context(assess_barcode), barcode.strip(), product, entries)
+    finally:
+        admission.release()
+
+@app.post("/products")
+async def get_products_by_barcode(request: BarcodeBatchRequest):
+    """Batch barcode lookup: results keyed by barcode, errors reported per barcode.
+
+    Runs like a POST /ingredients batch: one batch admission slot, batch priority, and
+    each distinct ingredient across all the products assessed once.
+    """
+    barcodes = list(dict.fromkeys(b.strip() for b in request.barcodes))
+    rejection = admission.try_acquire(batch=True)
+    if rejection is not None:
+        return shed_response(rejection)
+    try:
+        looked_up = await asyncio.gather(*(asyncio.to_thread(run_in_context(lookup_barcode), b) for b in barcodes))
+        over_quota = await quota_rejection([name for _, entries, _ in looked_up if entries for name, _ in entries])
+        if over_quota is not None:
+            return over_quota
+        return await asyncio.to_thread(analyze_barcode_batch, barcodes, list(looked_up))
+    finally:
+        admission.release()
+
+def lookup_etag(body: Any) -> str:
+    """Strong ETag: the assessment cache version plus a hash of the exact response body"""
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f'"{ASSESSMENT_CACHE_VERSION}-{digest}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("If-None-Match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+def lookup_response(request: Request, body: Dict[str, Any], cacheable: bool) -> Response:
+    """JSON response with ETag and Cache-Control, or 304 when the client already has this body"""
+    if not cacheable:
+        return JSONResponse(content=body, headers={"Cache-Control": "no-store"})
+    etag = lookup_etag(body)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={INGREDIENT_HTTP_MAX_AGE}, stale-while-revalidate={INGREDIENT_HTTP_STALE}",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=body, headers=headers)
+
+async def lookup_assessments(keys: List[str]) -> Union[JSONResponse, tuple]:
+    """(one item per canonical id, whether all are complete), or a 429/503 response.
+
+    Cached ids are answered from the assessment cache; only ids never assessed are
+    validated, charged to the quota and admitted before the pipeline runs.
+    """
+    missing = [key for key in keys if await asyncio.to_thread(assessment_cache.peek, key, True) is None]
+    non_food = set()
+    if missing:
+        over_quota = await quota_rejection(missing)
+        if over_quota is not None:
+            return over_quota
+        rejection = admission.try_acquire(batch=request_priority.get() == BATCH)
+        if rejection is not None:
+            return shed_response(rejection)
+    try:
+        if missing:
+            if OPENAI_ASYNC:
+                validation_result = await avalidate_food_input(", ".join(missing))
+            else:
+                validation_result = await asyncio.to_thread(validate_food_input, ", ".join(missing))
+            non_food = {normalize_key(item) for item in validation_result.get("non_food_items", [])}
+        to_assess = [key for key in keys if key not in non_food]
+        with collect_failures() as failures:
+            if OPENAI_ASYNC:
+                results = await asyncio.gather(*(aget_ingredient_assessment(key) for key in to_assess))
+            else:
+                results = await asyncio.gather(*(asyncio.to_thread(get_ingredient_assessment, key) for key in to_assess))
+    finally:
+        if missing:
+            admission.release()
+    assessed = dict(zip(to_assess, results))
+    items = []
+    for key in keys:
+        if key in non_food:
+            items.append({"id": key, "error": "Not a food product, ingredient, or consumable item."})
+        else:
+            items.append({"id": key, **assessed[key].to_dict()})
+    complete = not failures and all(isinstance(item.get("score"), (int, float)) for item in items)
+    return items, complete
+
+@app.get("/ingredients/{canonical_id:path}")
+async def get_ingredient(request: Request, canonical_id: str):
+    """Cacheable assessment of one ingredient by its canonical id (normalized name, e.g. "sodium nitrite").
+
+    Other spellings are redirected to the canonical URL so every client shares one cache entry.
+    """
+    key = normalize_key(canonical_id)
+    if not key:
+        return JSONResponse(status_code=404, content={"error": "Unknown ingredient id."})
+    if key != canonical_id:
+        return RedirectResponse(f"/ingredients/{quote(key, safe='')}", status_code=308)
+    looked_up = await lookup_assessments([key])
+    if isinstance(looked_up, JSONResponse):
+        return looked_up
+    items, complete = looked_up
+    if "error" in items[0]:
+        return JSONResponse(status_code=422, content=items[0], headers={"Cache-Control": "no-store"})
+    return lookup_response(request, items[0], complete)
+
+@app.get("/ingredients")
+async def get_ingredients(request: Request, id: List[str] = Query(default=[])):
+    """Multi-get: GET /ingredients?id=salt&id=sugar. Ids are canonicalized, deduplicated and sorted (redirecting
+    other forms), so the same set of ingredients always has one URL and one ETag."""
+    keys = sorted({normalize_key(item) for item in id} - {""})
+    if not keys:
+        return JSONResponse(status_code=400, content={"error": "Pass one or more ingredient ids as ?id=..."})
+    if len(keys) > INGREDIENT_MULTI_GET_MAX:
+        return JSONResponse(status_code=400, content={"error": f"At most {INGREDIENT_MULTI_GET_MAX} ids per request."})
+    if id != keys:
+        return RedirectResponse(f"/ingredients?{urlencode([('id', key) for key in keys])}", status_code=308)
+    looked_up = await lookup_assessments(keys)
+    if isinstance(looked_up, JSONResponse):
+        return looked_up
+    items, complete = looked_up
+    return lookup_response(request, {"ingredients": items}, complete)
+
+@app.get("/usage")
+def get_usage(request: Request, days: int = 30):
+    """Daily usage (requests, cost units, upstream calls) of the calling API key's client"""
+    api_key = request_api_key(request)
+    account = quota_manager.authenticate(api_key, "") if api_key else None
+    if account is None:
+        return JSONResponse(status_code=401, content={"error": "Invalid or missing API key."})
+    return {
+        "client_id": account.client_id,
+        "quota": {"rate": account.bucket.rate, "burst": account.bucket.capacity, "remaining": round(account.bucket.level(), 2)},
+        "usage": quota_manager.usage(account.client_id, days),
+    }
+
+@app.get("/admin/profile/cpu")
+async def profile_cpu(request: Request, seconds: float = 10, interval_ms: float = 5, format: str = "collapsed",
+                      include_idle: bool = False, limit: int = 30):
+    """Sample every thread's stack for `seconds`; collapsed stacks (flamegraph input) or a top-functions table"""
+    denied = admin_rejection(request)
+    if denied is not None:
+        return denied
+    try:
+        stacks, rounds = await asyncio.to_thread(sample_stacks, seconds, interval_ms / 1000, include_idle)
+    except ProfilerBusy as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    if format == "collapsed":
+        return PlainTextResponse(collapsed(stacks))
+    return {"rounds": rounds, "samples": sum(stacks.values()), "top": top_functions(stacks, limit)}
+
+@app.post("/admin/profile/memory/start")
+def profile_memory_start(request: Request, frames: int = 25):
+    """Start tracemalloc; allocations made from now on are traced"""
+    denied = admin_rejection(request)
+    if denied is not None:
+        return denied
+    return {"started": start_tracemalloc(frames)}
+
+@app.get("/admin/profile/memory")
+def profile_memory(request: Request, limit: int = 30, group_by: str = "lineno", diff: bool = True):
+    """Top allocation sites, diffed against the previous snapshot when there is one"""
+    denied = admin_rejection(request)
+    if denied is not None:
+        return denied
+    if group_by not in ("lineno", "filename", "traceback"):
+        return JSONResponse(status_code=400, content={"error": "group_by must be lineno, filename or traceback."})
+    try:
+        return memory_report(limit, group_by, diff)
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
+@app.post("/admin/profile/memory/stop")
+def profile_memory_stop(request: Request):
+    denied = admin_rejection(request)
+    if denied is not None:
+        return denied
+    stop_tracemalloc()
+    return {"stopped": True}
+
+@app.delete("/admin/completion-memo")
+def clear_completion_memo(request: Request):
+    """Drop every memoized OpenAI completion (e.g. after editing prompts outside the fingerprinted templates)"""
+    denied = admin_rejection(request)
+    if denied is not None:
+        return denied
+    memo = get_completion_memo()
+    return {"cleared": memo.clear() if memo else 0}
+
 @app.get("/test")
 def test_endpoint():
     """Simple test endpoint to check if backend is running"""
@@ -1008,7 +2538,7 @@ def test_endpoint():
         "timestamp": datetime.utcnow().isoformat(),
         "provider": "openai",
         "model": OPENAI_MODEL,
-        "openai_configured": bool(openai_client is not None),
+        "openai_configured": bool(OPENAI_API_KEY),
     }
 
 @app.get("/health")
@@ -1018,5 +2548,26 @@ def health_check():
         "status": "healthy",
         "provider": "openai",
         "model": OPENAI_MODEL,
-        "openai_configured": bool(openai_client is not None),
-    } 
\ No newline at end of file
+        "openai_configured": bool(OPENAI_API_KEY),
+        "ready": startup_state["ready"],
+        "startup": startup_state,
+        "cache": get_ingredient_cache().stats() if _ingredient_cache is not None else None,
+        "stage_caches": {c.namespace: c.stats() for c in (research_cache, breakdown_cache, usda_cache, off_cache)},
+        "schedulers": {s.name: s.stats() for s in (openai_scheduler, serpapi_scheduler)},
+        "cache_versions": {"assessment": ASSESSMENT_CACHE_VERSION, "breakdown": BREAKDOWN_CACHE_VERSION},
+        "retries": retry_stats,
+        "admission": admission.stats(),
+        "breakers": breaker_stats(),
+        "quotas": quota_manager.stats(),
+        "completion_memo": get_completion_memo().stats() if get_completion_memo() else {"enabled": False},
+        "model_routing": {"enabled": MODEL_ROUTING_ENABLED, "fast_model": OPENAI_FAST_MODEL, "model": OPENAI_MODEL, **routing_stats},
+    }
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 503 until the startup warm-up has finished"""
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content={"ready": False}, headers={"Retry-After": "1"})
+    return {"ready": True, "time_to_ready_seconds": startup_state["time_to_ready_seconds"]}
+
+startup_state["import_seconds"] = round(time.perf_counter() - _import_started, 4)
@@ -0,0 +1,240 @@
+"""
+TTL cache with stale-while-revalidate for research stages.
+
+Entries are stored in a shared CacheBackend as {"v": value, "t": stored_at, "neg": bool}.
+A fresh entry is returned as is. A stale entry (older than its TTL but within the
+stale window) is returned immediately while a background thread refreshes it, so
+popular components never block a request on network I/O. Negative entries
+(lookups that found nothing) use their own, shorter TTL. Values computed while an
+upstream call failed (see retry.py) are returned but never stored, so a transient
+outage is retried on the next request instead of being pinned in the cache.
+
+Caches of model outputs are versioned by a fingerprint of their inputs (model,
+prompt template, knowledge base). Versions are recorded per namespace in the
+backend's version registry (CacheBackend.register_version). When the version changes, a miss in the current version
+falls back to an entry from one of the previous versions, which is served while
+the current version is computed in the background. Each old-version entry is
+evicted once its key has migrated, and versions older than the ones kept are
+purged in bulk where the backend supports it.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from cache_backends import CacheBackend
+from retry import collect_failures, detach_from_request
+from scheduler import BATCH, request_priority
+
+_refresh_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_refresh_executor(max_workers: int = 4) -> ThreadPoolExecutor:
+    """Shared pool for background revalidation"""
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _executor_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cache-refresh")
+    return _refresh_executor
+
+
+def normalize_key(name: str) -> str:
+    """Normalize a component/ingredient name for use as a cache key"""
+    return " ".join(name.lower().replace("_", " ").split()).strip(" .,;:*")
+
+
+class SWRCache:
+    """Namespaced TTL + stale-while-revalidate cache over a CacheBackend"""
+
+    def __init__(self, backend_factory: Callable[[], CacheBackend], namespace: str, ttl: float,
+                 stale_ttl: float, negative_ttl: Optional[float] = None, versions_kept: int = 2):
+        self._backend_factory = backend_factory
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.version = ""
+        self.versions_kept = versions_kept
+        self._previous_versions: Optional[List[str]] = None
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"fresh": 0, "stale": 0, "miss": 0, "refreshed": 0, "old_version": 0, "migrated": 0,
+                                   "not_stored_degraded": 0}
+
+    def set_version(self, version: str) -> None:
+        self.version = version
+        self._previous_versions = None
+
+    def _key(self, key: str, version: Optional[str] = None) -> str:
+        version = self.version if version is None else version
+        return f"{self.namespace}:{version}:{key}" if version else f"{self.namespace}:{key}"
+
+    def previous_versions(self) -> List[str]:
+        """Older versions still served during migration, newest first (registers the current one)"""
+        if self._previous_versions is None:
+            if not self.version:
+                self._previous_versions = []
+            else:
+                self._previous_versions = self._register_version()
+        return self._previous_versions
+
+    def _register_version(self) -> List[str]:
+        backend = self._backend_factory()
+        history = [v for v in backend.register_version(self.namespace, self.version) if v != self.version]
+        cut = max(0, len(history) - self.versions_kept)
+        kept, expired = history[cut:], history[:cut]
+        for old in expired:
+            purged = backend.delete_prefix(f"{self.namespace}:{old}:")
+            if purged >= 0:
+                print(f"Purged {purged} '{self.namespace}' cache entries of version {old}")
+            backend.forget_version(self.namespace, old)
+        return list(reversed(kept))
+
+    def _store(self, key: str, value: Any, negative: bool) -> None:
+        self._backend_factory().set(self._key(key), {"v": value, "t": time.time(), "neg": negative})
+
+    def _load(self, key: str, loader: Callable[[], Any], cacheable: Callable[[Any], bool],
+              negative: Callable[[Any], bool]) -> tuple:
+        """Call loader; store the value unless it is not cacheable or degraded. Returns (value, stored)"""
+        with collect_failures() as failures:
+            value = loader()
+        return value, self._store_if_complete(key, value, failures, cacheable, negative)
+
+    def _store_if_complete(self, key: str, value: Any, failures: list, cacheable: Callable[[Any], bool],
+                           negative: Callable[[Any], bool]) -> bool:
+        if not cacheable(value):
+            return False
+        if failures:
+            self.counters["not_stored_degraded"] += 1
+            return False
+        self._store(key, value, negative(value))
+        return True
+
+    def _evict_old_versions(self, key: str) -> None:
+        backend = self._backend_factory()
+        for old in self.previous_versions():
+            backend.delete(self._key(key, old))
+
+    def _cached(self, key: str, loader: Callable[[], Any], cacheable: Callable[[Any], bool],
+                negative: Callable[[Any], bool], revalidate: Optional[Callable[[], Any]] = None) -> tuple:
+        """(True, value) on a fresh, stale or previous-version hit, (False, None) on a miss"""
+        revalidate = revalidate or loader
+        entry = self._backend_factory().get(self._key(key))
+        if entry is not None:
+            ttl = self.negative_ttl if entry.get("neg") else self.ttl
+            age = time.time() - entry.get("t", 0)
+            if age < ttl:
+                self.counters["fresh"] += 1
+                return True, entry["v"]
+            if age < ttl + self.stale_ttl:
+                self.counters["stale"] += 1
+                self._refresh_in_background(key, revalidate, cacheable, negative)
+                return True, entry["v"]
+
+        # Fall back to a previous cache version while this one is computed in the background
+        for old in self.previous_versions():
+            entry = self._backend_factory().get(self._key(key, old))
+            if entry is not None and time.time() - entry.get("t", 0) < self.ttl + self.stale_ttl:
+                self.counters["old_version"] += 1
+                self._refresh_in_background(key, revalidate, cacheable, negative)
+                return True, entry["v"]
+
+        self.counters["miss"] += 1
+        return False, None
+
+    def get_or_load(self, key: str, loader: Callable[[], Any],
+                    cacheable: Callable[[Any], bool] = lambda value: value is not None,
+                    negative: Callable[[Any], bool] = lambda value: False,
+                    revalidate: Optional[Callable[[], Any]] = None) -> Any:
+        """Return the cached value for `key`, calling `loader` on a miss.
+
+        Only values accepted by `cacheable` are stored; `negative` marks values that
+        record a miss (e.g. "no database match") and get the negative TTL.
+        `revalidate`, when given, replaces `loader` for background revalidation.
+        """
+        hit, value = self._cached(key, loader, cacheable, negative, revalidate)
+        if hit:
+            return value
+        return self._load(key, loader, cacheable, negative)[0]
+
+    async def aget_or_load(self, key: str, aloader: Callable[[], Awaitable[Any]], loader: Callable[[], Any],
+                           cacheable: Callable[[Any], bool] = lambda value: value is not None,
+                           negative: Callable[[Any], bool] = lambda value: False,
+                           revalidate: Optional[Callable[[], Any]] = None) -> Any:
+        """Async get_or_load: awaits `aloader` on a miss.
+
+        The backend lookup runs in a worker thread so a slow network cache cannot
+        stall the event loop; background revalidation still uses the sync `loader`
+        (or `revalidate`).
+        """
+        hit, value = await asyncio.to_thread(self._cached, key, loader, cacheable, negative, revalidate)
+        if hit:
+            return value
+        with collect_failures() as failures:
+            value = await aloader()
+        await asyncio.to_thread(self._store_if_complete, key, value, failures, cacheable, negative)
+        return value
+
+    def _refresh_in_background(self, key: str, loader: Callable[[], Any],
+                               cacheable: Callable[[Any], bool], negative: Callable[[Any], bool]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            # Revalidation is background work and must not compete with interactive requests
+            request_priority.set(BATCH)
+            detach_from_request()
+            try:
+                _, stored = self._load(key, loader, cacheable, negative)
+                if stored:
+                    self.counters["refreshed"] += 1
+                    if self.previous_versions():
+                        self._evict_old_versions(key)
+                        self.counters["migrated"] += 1
+            except Exception as e:
+                print(f"Background refresh of {self._key(key)} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        get_refresh_executor().submit(contextvars.copy_context().run, refresh)
+
+    def peek(self, key: str, any_version: bool = False) -> Optional[Any]:
+        """Cached value regardless of age, without loading or refreshing.
+
+        any_version also falls back to entries of the previous cache versions.
+        """
+        versions = [self.version] + (self.previous_versions() if any_version else [])
+        for version in versions:
+            entry = self._backend_factory().get(self._key(key, version))
+            if entry is not None:
+                return entry["v"]
+        return None
+
+    def entry_age(self, key: str) -> Optional[float]:
+        """Seconds since the entry was stored, or None when absent"""
+        entry = self._backend_factory().get(self._key(key))
+        return time.time() - entry.get("t", 0) if entry is not None else None
+
+    def refresh(self, key: str, loader: Callable[[], Any],
+                cacheable: Callable[[Any], bool] = lambda value: value is not None,
+                negative: Callable[[Any], bool] = lambda value: False) -> Any:
+        """Load and store regardless of the cached entry (used by the warm-up job)"""
+        value, stored = self._load(key, loader, cacheable, negative)
+        if stored:
+            self.counters["refreshed"] += 1
+            self._evict_old_versions(key)
+        return value
+
+    def invalidate(self, key: str) -> None:
+        self._backend_factory().delete(self._key(key))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.version, "ttl": self.ttl, "stale_ttl": self.stale_ttl,
+                "negative_ttl": self.negative_ttl, **self.counters}
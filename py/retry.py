@@ -0,0 +1,194 @@
+"""
+Retry engine shared by all upstream calls (OpenAI, SerpAPI, USDA, OpenFoodFacts).
+
+Errors are classified (rate_limit, server, timeout, connection, client, other)
+and each class has its own policy: how many attempts and how long to back off.
+Backoff uses full jitter, honours Retry-After, and never sleeps past the current
+request's deadline; when the next attempt would not fit, the last error is raised.
+Only idempotent calls (reads and completions, which have no side effects) go
+through the engine, so replaying them is safe.
+
+Every attempt reports to the upstream's circuit breaker (admission.py): transient
+errors count as failures, anything else proves the upstream is reachable. While
+a breaker is open, calls fail fast with CircuitOpenError and are not retried.
+Every attempt that goes out is charged to the requesting client's quota and to
+the running job's budget (quotas.py); an attempt the budget cannot pay for is
+not made and fails with BudgetExhausted.
+
+Upstream failures that survive the retries are recorded with
+record_upstream_failure(). Code that must not persist partial results (the stage
+caches) wraps its work in collect_failures() and checks the returned list.
+"""
+import asyncio
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from admission import CircuitOpenError, breaker_for
+from quotas import BudgetExhausted, charge_upstream_call, request_account
+
+# Absolute time.monotonic() by which the current request must be answered (None: no deadline)
+request_deadline: contextvars.ContextVar = contextvars.ContextVar("request_deadline", default=None)
+_failure_collectors: contextvars.ContextVar = contextvars.ContextVar("failure_collectors", default=())
+
+
+@dataclass(slots=True)
+class RetryPolicy:
+    max_attempts: int
+    base_delay: float
+    max_delay: float
+
+
+DEFAULT_POLICIES: Dict[str, RetryPolicy] = {
+    "rate_limit": RetryPolicy(max_attempts=5, base_delay=1.0, max_delay=20.0),
+    "server": RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=8.0),
+    "timeout": RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=4.0),
+    "connection": RetryPolicy(max_attempts=3, base_delay=0.25, max_delay=4.0),
+    "client": RetryPolicy(max_attempts=1, base_delay=0.0, max_delay=0.0),
+    "other": RetryPolicy(max_attempts=1, base_delay=0.0, max_delay=0.0),
+}
+
+TRANSIENT_ERRORS = {"rate_limit", "server", "timeout", "connection"}
+
+retry_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    # openai.APIStatusError carries status_code; requests.HTTPError carries response
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def classify_error(exc: BaseException) -> str:
+    """Error class used to pick a retry policy"""
+    status = _status_code(exc)
+    if status is not None:
+        if status == 429:
+            return "rate_limit"
+        if status in (408, 425) or status >= 500:
+            return "server"
+        return "client"
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    # Checked by name so the openai package is not imported here
+    if names & {"Timeout", "ReadTimeout", "ConnectTimeout", "APITimeoutError"}:
+        return "timeout"
+    if names & {"ConnectionError", "APIConnectionError", "ChunkedEncodingError"}:
+        return "connection"
+    return "other"
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by the upstream's Retry-After header, if any"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def remaining_time() -> Optional[float]:
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def _admit(upstream: str) -> None:
+    breaker = breaker_for(upstream)
+    if not breaker.allow():
+        raise CircuitOpenError(upstream, breaker.retry_after())
+
+
+def _next_delay(upstream: str, exc: BaseException, attempt: int,
+                policies: Dict[str, RetryPolicy]) -> Optional[float]:
+    """Seconds to wait before the next attempt, or None to give up"""
+    if isinstance(exc, (CircuitOpenError, BudgetExhausted)):
+        return None
+    error_class = classify_error(exc)
+    if error_class in TRANSIENT_ERRORS:
+        breaker_for(upstream).record_failure()
+    else:
+        breaker_for(upstream).record_success()
+    policy = policies.get(error_class) or DEFAULT_POLICIES["other"]
+    stats = retry_stats.setdefault(upstream, {"retries": 0, "gave_up": 0})
+    if attempt >= policy.max_attempts:
+        stats["gave_up"] += 1
+        return None
+    delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1)))
+    delay = max(delay, retry_after(exc) or 0.0)
+    remaining = remaining_time()
+    if remaining is not None and delay >= remaining:
+        stats["gave_up"] += 1
+        return None
+    stats["retries"] += 1
+    stats[error_class] = stats.get(error_class, 0) + 1
+    print(f"{upstream} {error_class} error (attempt {attempt}), retrying in {delay:.2f}s: {exc}")
+    return delay
+
+
+def call_with_retry(upstream: str, fn: Callable[..., Any], *args,
+                    policies: Dict[str, RetryPolicy] = DEFAULT_POLICIES, **kwargs) -> Any:
+    """Call fn, replaying it on transient errors per the policy of each error class"""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            _admit(upstream)
+            charge_upstream_call(upstream)
+            result = fn(*args, **kwargs)
+        except Exception as exc:
+            delay = _next_delay(upstream, exc, attempt, policies)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        breaker_for(upstream).record_success()
+        return result
+
+
+async def acall_with_retry(upstream: str, fn: Callable[..., Awaitable[Any]], *args,
+                           policies: Dict[str, RetryPolicy] = DEFAULT_POLICIES, **kwargs) -> Any:
+    """Async call_with_retry for coroutine functions"""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            _admit(upstream)
+            charge_upstream_call(upstream)
+            result = await fn(*args, **kwargs)
+        except Exception as exc:
+            delay = _next_delay(upstream, exc, attempt, policies)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        breaker_for(upstream).record_success()
+        return result
+
+
+def record_upstream_failure(upstream: str, error: Any) -> None:
+    """Note that the work in progress degraded because an upstream call failed"""
+    for failures in _failure_collectors.get():
+        failures.append((upstream, str(error)))
+
+
+@contextmanager
+def collect_failures():
+    """Collect upstream failures recorded inside the block (including in nested blocks)"""
+    failures: List[Tuple[str, str]] = []
+    token = _failure_collectors.set(_failure_collectors.get() + (failures,))
+    try:
+        yield failures
+    finally:
+        _failure_collectors.reset(token)
+
+
+def detach_from_request() -> None:
+    """For background work spawned from a request: no deadline, failures not reported to (or charged to) the request"""
+    request_deadline.set(None)
+    _failure_collectors.set(())
+    request_account.set(None)
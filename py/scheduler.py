@@ -0,0 +1,201 @@
+"""
+Priority scheduling of outbound upstream capacity (OpenAI, SerpAPI).
+
+Each upstream gets a FairScheduler with a fixed number of concurrent slots.
+Waiting callers are grouped by priority class ("interactive", "batch") and
+served by weighted fair sharing (stride scheduling), so batches use all spare
+capacity but interactive requests still get most slots under contention. A few
+slots can be reserved for interactive traffic so a batch holding every slot with
+long calls cannot delay them. Within a class, clients are served round-robin.
+
+The priority class and client of the current request travel in context
+variables; use run_in_context() when handing work to another thread.
+
+Threads wait with slot() and coroutines with aslot(); both draw on the same
+slots and queues, so one scheduler governs all of the process's calls to an
+upstream whichever client library makes them.
+"""
+import asyncio
+import contextvars
+import threading
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Deque, Dict, Optional
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+request_priority: contextvars.ContextVar = contextvars.ContextVar("request_priority", default=INTERACTIVE)
+request_client: contextvars.ContextVar = contextvars.ContextVar("request_client", default="anonymous")
+
+
+def run_in_context(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Bind fn to a copy of the caller's context (priority, client) for use in pool threads"""
+    ctx = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "loop", "future")
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.event = threading.Event()
+        self.granted = False
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.future is not None:
+            # Granted from whichever thread released the slot; wake the coroutine on its own loop
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class FairScheduler:
+    """Weighted fair, per-client round-robin admission to a fixed number of slots"""
+
+    def __init__(self, name: str, capacity: int, weights: Dict[str, float], interactive_reserved: int = 0):
+        self.name = name
+        self.capacity = max(1, capacity)
+        self.weights = weights
+        # Slots that only interactive callers may take
+        self.interactive_reserved = min(max(0, interactive_reserved), self.capacity - 1)
+        self._lock = threading.Lock()
+        self._in_use: Dict[str, int] = defaultdict(int)
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {cls: OrderedDict() for cls in weights}
+        self._pass: Dict[str, float] = {cls: 0.0 for cls in weights}
+        self._virtual_time = 0.0
+        self.granted: Dict[str, int] = defaultdict(int)
+
+    def _total_in_use(self) -> int:
+        return sum(self._in_use.values())
+
+    def _can_run(self, cls: str) -> bool:
+        total = self._total_in_use()
+        if total >= self.capacity:
+            return False
+        if cls == INTERACTIVE:
+            return True
+        return total - self._in_use[INTERACTIVE] < self.capacity - self.interactive_reserved
+
+    def _dispatch(self) -> None:
+        while True:
+            ready = [cls for cls, queue in self._queues.items() if queue and self._can_run(cls)]
+            if not ready:
+                return
+            cls = min(ready, key=lambda c: self._pass[c])
+            self._virtual_time = self._pass[cls]
+            self._pass[cls] += 1.0 / self.weights[cls]
+
+            # Round-robin across clients within the class
+            queue = self._queues[cls]
+            client, waiters = next(iter(queue.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                queue.move_to_end(client)
+            else:
+                del queue[client]
+
+            self._in_use[cls] += 1
+            self.granted[cls] += 1
+            waiter.grant()
+
+    def _resolve(self, priority: Optional[str], client: Optional[str]) -> tuple:
+        cls = priority or request_priority.get()
+        if cls not in self._queues:
+            cls = BATCH if BATCH in self._queues else next(iter(self._queues))
+        return cls, client or request_client.get()
+
+    def _enqueue(self, cls: str, client: str, waiter: _Waiter) -> None:
+        with self._lock:
+            queue = self._queues[cls]
+            if not queue:
+                # A class returning from idle must not bank credit from the time it was idle
+                self._pass[cls] = max(self._pass[cls], self._virtual_time)
+            queue.setdefault(client, deque()).append(waiter)
+            self._dispatch()
+
+    def _abandon(self, cls: str, client: str, waiter: _Waiter) -> bool:
+        """Withdraw a waiter that gave up. Returns True if it had been granted a slot meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiters = self._queues[cls].get(client)
+            if waiters is not None:
+                waiters.remove(waiter)
+                if not waiters:
+                    del self._queues[cls][client]
+        return False
+
+    def acquire(self, priority: Optional[str] = None, client: Optional[str] = None,
+                timeout: Optional[float] = None) -> str:
+        """Block until a slot is granted; returns the class charged. Raises TimeoutError"""
+        cls, client = self._resolve(priority, client)
+        waiter = _Waiter()
+        self._enqueue(cls, client, waiter)
+        if waiter.event.wait(timeout) or self._abandon(cls, client, waiter):
+            return cls
+        raise TimeoutError(f"Timed out waiting for {self.name} capacity")
+
+    async def acquire_async(self, priority: Optional[str] = None, client: Optional[str] = None,
+                            timeout: Optional[float] = None) -> str:
+        """Wait for a slot without holding a thread; returns the class charged. Raises TimeoutError"""
+        cls, client = self._resolve(priority, client)
+        waiter = _Waiter(asyncio.get_running_loop())
+        self._enqueue(cls, client, waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            return cls
+        except asyncio.TimeoutError:
+            if self._abandon(cls, client, waiter):
+                return cls
+            raise TimeoutError(f"Timed out waiting for {self.name} capacity")
+        except asyncio.CancelledError:
+            if self._abandon(cls, client, waiter):
+                self.release(cls)
+            raise
+
+    def release(self, cls: str) -> None:
+        with self._lock:
+            self._in_use[cls] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, client: Optional[str] = None, timeout: Optional[float] = None):
+        cls = self.acquire(priority, client, timeout)
+        try:
+            yield
+        finally:
+            self.release(cls)
+
+    @asynccontextmanager
+    async def aslot(self, priority: Optional[str] = None, client: Optional[str] = None, timeout: Optional[float] = None):
+        cls = await self.acquire_async(priority, client, timeout)
+        try:
+            yield
+        finally:
+            self.release(cls)
+
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(w) for queue in self._queues.values() for w in queue.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "interactive_reserved": self.interactive_reserved,
+                "in_use": dict(self._in_use),
+                "waiting": {cls: sum(len(w) for w in queue.values()) for cls, queue in self._queues.items()},
+                "waiting_clients": {cls: len(queue) for cls, queue in self._queues.items()},
+                "granted": dict(self.granted),
+            }
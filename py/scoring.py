@@ -0,0 +1,200 @@
+"""
+Product-level risk scoring over NumPy arrays.
+
+Per-ingredient results (score, NOVA group) and the USDA nutrient amounts of each
+ingredient are held in an IngredientTable, one row per distinct ingredient.
+Products are encoded as index arrays into that table (CSR layout: `ptr` holds
+each product's offset into `idx`), so a whole catalog is scored with a handful
+of array operations and no per-product Python loop:
+
+- label-position weights: ingredients are listed by decreasing weight, so the
+  ingredient at position p weighs POSITION_DECAY ** p.
+- composite risk: a blend of the highest ingredient score and the
+  position-weighted mean score, plus a penalty for the weighted share of
+  ultra-processed (NOVA 4) ingredients, clipped to 0-100.
+- nutrients: position-weighted mean of the known per-100 g amounts.
+- rankings: rank 1 is the riskiest product of the scored set.
+"""
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+POSITION_DECAY = float(os.getenv("SCORING_POSITION_DECAY", "0.8"))  # Weight ratio between consecutive label positions
+MAX_SCORE_WEIGHT = float(os.getenv("SCORING_MAX_WEIGHT", "0.5"))  # Share of the composite taken by the worst ingredient
+NOVA_PENALTY = float(os.getenv("SCORING_NOVA_PENALTY", "10"))  # Points added for a fully ultra-processed product
+HIGH_RISK_THRESHOLD = 80  # Same cut-off as the "High carcinogen risk" warning
+
+# USDA nutrient name fragment -> column
+NUTRIENT_COLUMNS: Tuple[str, ...] = ("sodium", "sugars", "saturated fat", "trans fat", "cholesterol")
+_NUTRIENT_MATCHES = (("sodium", 0), ("sugar", 1), ("saturated", 2), ("trans", 3), ("cholesterol", 4))
+
+
+def numeric_score(value: Any) -> float:
+    """Score as float, NaN for "unknown" and other non-numeric values"""
+    if isinstance(value, bool):
+        return np.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def numeric_nova(value: Any) -> float:
+    """NOVA group 1-4 as float ("4", 4, "NOVA 4"), NaN when absent"""
+    match = re.search(r"[1-4]", str(value)) if value not in (None, "") else None
+    return float(match.group()) if match else np.nan
+
+
+def nutrient_column(name: str) -> Optional[int]:
+    name = name.lower()
+    for fragment, column in _NUTRIENT_MATCHES:
+        if fragment in name:
+            return column
+    return None
+
+
+class IngredientTable:
+    """One row per distinct ingredient: score, NOVA group and nutrient amounts (NaN when unknown)"""
+
+    def __init__(self, names: List[str], scores: np.ndarray, nova: np.ndarray, nutrients: np.ndarray):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.scores = scores
+        self.nova = nova
+        self.nutrients = nutrients
+
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, Dict[str, Any], Optional[List[Dict[str, Any]]]]]) -> "IngredientTable":
+        """Build from (key, assessment dict, USDA nutrient list or None) triples"""
+        names: List[str] = []
+        scores: List[float] = []
+        nova: List[float] = []
+        nutrient_rows: List[List[float]] = []
+        for key, assessment, nutrients in records:
+            names.append(key)
+            scores.append(numeric_score(assessment.get("score")))
+            nova.append(numeric_nova(assessment.get("nova_group")))
+            row = [np.nan] * len(NUTRIENT_COLUMNS)
+            for nutrient in nutrients or []:
+                column = nutrient_column(nutrient.get("name", ""))
+                if column is not None and np.isnan(row[column]):
+                    row[column] = numeric_score(nutrient.get("amount"))
+            nutrient_rows.append(row)
+        return cls(
+            names,
+            np.asarray(scores, dtype=np.float64),
+            np.asarray(nova, dtype=np.float64),
+            np.asarray(nutrient_rows, dtype=np.float64).reshape(len(names), len(NUTRIENT_COLUMNS)),
+        )
+
+    def encode(self, products: Sequence[Sequence[str]]) -> Tuple[np.ndarray, np.ndarray]:
+        """Products as (ptr, idx) arrays; ingredients missing from the table get index -1"""
+        lengths = np.fromiter((len(p) for p in products), dtype=np.int64, count=len(products))
+        ptr = np.zeros(len(products) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=ptr[1:])
+        index = self.index
+        idx = np.fromiter((index.get(name, -1) for p in products for name in p), dtype=np.int64, count=int(ptr[-1]))
+        return ptr, idx
+
+
+@dataclass(slots=True)
+class ProductScores:
+    composite: np.ndarray
+    max_score: np.ndarray
+    weighted_mean: np.ndarray
+    high_risk_count: np.ndarray
+    ultra_processed_share: np.ndarray
+    known_share: np.ndarray
+    nutrients: np.ndarray
+    rank: np.ndarray
+    percentile: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.composite)
+
+    def to_dict(self, i: int) -> Dict[str, Any]:
+        def value(x: float, digits: int = 1) -> Optional[float]:
+            return None if np.isnan(x) else round(float(x), digits)
+
+        return {
+            "composite_risk": value(self.composite[i]),
+            "max_score": value(self.max_score[i]),
+            "weighted_score": value(self.weighted_mean[i]),
+            "high_risk_ingredients": int(self.high_risk_count[i]),
+            "ultra_processed_share": value(self.ultra_processed_share[i], 2),
+            "scored_share": value(self.known_share[i], 2),
+            "nutrients_per_100g": {
+                name: value(self.nutrients[i, column], 2)
+                for column, name in enumerate(NUTRIENT_COLUMNS) if not np.isnan(self.nutrients[i, column])
+            },
+            "rank": int(self.rank[i]),
+            "percentile": value(self.percentile[i]),
+        }
+
+
+def _segment_mean(seg: np.ndarray, values: np.ndarray, weights: np.ndarray, n: int) -> np.ndarray:
+    """Weighted mean of values per segment, ignoring NaN values (NaN when a segment has none)"""
+    known = ~np.isnan(values)
+    w = np.where(known, weights, 0.0)
+    total = np.bincount(seg, w, minlength=n)
+    weighted = np.bincount(seg, w * np.where(known, values, 0.0), minlength=n)
+    return np.divide(weighted, total, out=np.full(n, np.nan), where=total > 0)
+
+
+def score_products(table: IngredientTable, ptr: np.ndarray, idx: np.ndarray) -> ProductScores:
+    """Score every product encoded by (ptr, idx) at once"""
+    n = len(ptr) - 1
+    counts = np.diff(ptr)
+    seg = np.repeat(np.arange(n), counts)
+    positions = np.arange(len(idx)) - np.repeat(ptr[:-1], counts)
+    weights = POSITION_DECAY ** positions
+
+    valid = idx >= 0
+    rows = np.where(valid, idx, 0)
+    scores = np.where(valid, table.scores[rows] if len(table.names) else np.nan, np.nan)
+    nova = np.where(valid, table.nova[rows] if len(table.names) else np.nan, np.nan)
+    known = ~np.isnan(scores)
+
+    weighted_mean = _segment_mean(seg, scores, weights, n)
+    max_score = np.full(n, -np.inf)
+    nonempty = counts > 0
+    if nonempty.any():
+        max_score[nonempty] = np.maximum.reduceat(np.where(known, scores, -np.inf), ptr[:-1][nonempty])
+    max_score[np.isinf(max_score)] = np.nan
+
+    high_risk_count = np.bincount(seg, known & (np.nan_to_num(scores) > HIGH_RISK_THRESHOLD), minlength=n).astype(np.int64)
+    ultra_processed = np.where(np.isnan(nova), np.nan, (nova == 4).astype(np.float64))
+    ultra_processed_share = _segment_mean(seg, ultra_processed, weights, n)
+    known_share = np.divide(np.bincount(seg, known, minlength=n), counts, out=np.full(n, np.nan), where=nonempty)
+
+    composite = MAX_SCORE_WEIGHT * max_score + (1 - MAX_SCORE_WEIGHT) * weighted_mean
+    composite = np.clip(composite + NOVA_PENALTY * np.nan_to_num(ultra_processed_share), 0, 100)
+
+    if len(table.names):
+        entry_nutrients = np.where(valid[:, None], table.nutrients[rows], np.nan)
+    else:
+        entry_nutrients = np.full((len(idx), len(NUTRIENT_COLUMNS)), np.nan)
+    nutrients = np.column_stack([
+        _segment_mean(seg, entry_nutrients[:, column], weights, n) for column in range(len(NUTRIENT_COLUMNS))
+    ]) if n else np.empty((0, len(NUTRIENT_COLUMNS)))
+
+    # Riskiest first; unscored products rank last
+    order = np.argsort(-np.nan_to_num(composite, nan=-1.0), kind="stable")
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(1, n + 1)
+    percentile = 100.0 * (n - rank) / max(n - 1, 1)
+    percentile[np.isnan(composite)] = np.nan
+
+    return ProductScores(composite, max_score, weighted_mean, high_risk_count, ultra_processed_share,
+                         known_share, nutrients, rank, percentile)
+
+
+def score_catalog(products: Sequence[Sequence[str]], table: IngredientTable) -> ProductScores:
+    """Score products given as lists of table keys, ranked against each other"""
+    ptr, idx = table.encode(products)
+    return score_products(table, ptr, idx)
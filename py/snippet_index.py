@@ -0,0 +1,256 @@
+"""
+Local retrieval store for web research snippets.
+
+Every snippet fetched from SerpAPI is persisted with its source URL, query and
+timestamp into an SQLite inverted index. A snippet is stored once however many
+components' searches return it, and is attached to each of those components.
+Component research is answered from the index with BM25 ranking when the
+component's own attached snippets give enough fresh coverage, so common
+components ("sodium nitrite", "BHA", "citric acid") are researched over the
+network once instead of once per product.
+"""
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pipeline_types import ComponentResearch, ResearchSection, SearchSnippet
+from research_cache import normalize_key
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "that", "the", "to", "was", "with",
+}
+
+# Extra terms used to rank snippets for each research angle (mirrors research_component)
+ANGLE_TERMS: Dict[str, str] = {
+    "health": "carcinogen cancer risk studies",
+    "safety": "toxicity safety data sheet health effects",
+    "official": "who iarc classification carcinogenic",
+    "regulatory": "food additive safety fda approval",
+    "recent": "health risks recent studies",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class SnippetIndex:
+    """SQLite-backed inverted index with BM25 ranking"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS snippets (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                component TEXT NOT NULL,
+                search_type TEXT NOT NULL,
+                query TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                title TEXT NOT NULL,
+                snippet TEXT NOT NULL,
+                url TEXT NOT NULL,
+                date TEXT NOT NULL DEFAULT '',
+                source TEXT NOT NULL DEFAULT '',
+                fetched_at REAL NOT NULL,
+                length INTEGER NOT NULL,
+                UNIQUE (search_type, url, snippet)
+            );
+            CREATE INDEX IF NOT EXISTS idx_snippets_fetched_at ON snippets (fetched_at);
+            CREATE TABLE IF NOT EXISTS snippet_components (
+                component TEXT NOT NULL,
+                snippet_id INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (component, snippet_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                snippet_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, snippet_id)
+            ) WITHOUT ROWID;
+        """)
+        # Indexes written before snippet_components existed attach each snippet to the component it was added for
+        if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM snippet_components)").fetchone()[0]:
+            conn.execute("INSERT OR IGNORE INTO snippet_components (component, snippet_id, fetched_at) "
+                         "SELECT component, id, fetched_at FROM snippets")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, component: str, search_type: str, query: str, snippets: Iterable[SearchSnippet]) -> int:
+        """Persist snippets and their postings and attach them to the component. Returns the number of new snippets"""
+        now = time.time()
+        added = 0
+        component = normalize_key(component)
+        conn = self._conn()
+        with self._write_lock:
+            for s in snippets:
+                # The component and query are indexed with the snippet so lookups by
+                # component name match even when the snippet text paraphrases it
+                tokens = tokenize(f"{component} {query} {s.title} {s.snippet}")
+                if not tokens:
+                    continue
+                existing = conn.execute(
+                    "SELECT id FROM snippets WHERE search_type = ? AND url = ? AND snippet = ?",
+                    (search_type, s.url, s.snippet),
+                ).fetchone()
+                if existing:
+                    # Seen before (possibly for another component): refresh its timestamp
+                    snippet_id = existing[0]
+                    conn.execute("UPDATE snippets SET fetched_at = ? WHERE id = ?", (now, snippet_id))
+                else:
+                    cur = conn.execute(
+                        "INSERT INTO snippets (component, search_type, query, kind, title, snippet, url, date, source, fetched_at, length) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (component, search_type, query, s.kind, s.title, s.snippet, s.url, s.date, s.source, now, len(tokens)),
+                    )
+                    snippet_id = cur.lastrowid
+                    conn.executemany(
+                        "INSERT INTO postings (term, snippet_id, tf) VALUES (?, ?, ?)",
+                        [(term, snippet_id, tf) for term, tf in Counter(tokens).items()],
+                    )
+                    added += 1
+                conn.execute(
+                    "INSERT INTO snippet_components (component, snippet_id, fetched_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (component, snippet_id) DO UPDATE SET fetched_at = excluded.fetched_at",
+                    (component, snippet_id, now),
+                )
+            conn.commit()
+        return added
+
+    def _attached(self, component: str, cutoff: float) -> List[int]:
+        """Snippets fetched for this component itself since cutoff"""
+        rows = self._conn().execute(
+            "SELECT snippet_id FROM snippet_components WHERE component = ? AND fetched_at >= ?",
+            (normalize_key(component), cutoff),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def _corpus_stats(self, cutoff: float) -> Tuple[int, float]:
+        n, total = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM snippets WHERE fetched_at >= ?", (cutoff,)
+        ).fetchone()
+        return n, (total / n if n else 0.0)
+
+    def _candidates(self, terms: List[str], cutoff: float) -> List[int]:
+        """Fresh snippets containing every one of the given terms"""
+        unique = sorted(set(terms))
+        if not unique:
+            return []
+        placeholders = ",".join("?" for _ in unique)
+        rows = self._conn().execute(
+            f"SELECT p.snippet_id FROM postings p JOIN snippets s ON s.id = p.snippet_id "
+            f"WHERE p.term IN ({placeholders}) AND s.fetched_at >= ? "
+            f"GROUP BY p.snippet_id HAVING COUNT(*) = ?",
+            (*unique, cutoff, len(unique)),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def _bm25(self, terms: List[str], doc_ids: List[int], cutoff: float) -> Dict[int, float]:
+        """BM25 scores of the given documents for a bag of query terms"""
+        if not doc_ids or not terms:
+            return {}
+        conn = self._conn()
+        n, avgdl = self._corpus_stats(cutoff)
+        unique = sorted(set(terms))
+        term_marks = ",".join("?" for _ in unique)
+        df = dict(conn.execute(
+            f"SELECT p.term, COUNT(*) FROM postings p JOIN snippets s ON s.id = p.snippet_id "
+            f"WHERE p.term IN ({term_marks}) AND s.fetched_at >= ? GROUP BY p.term",
+            (*unique, cutoff),
+        ).fetchall())
+        doc_marks = ",".join("?" for _ in doc_ids)
+        lengths = dict(conn.execute(f"SELECT id, length FROM snippets WHERE id IN ({doc_marks})", doc_ids).fetchall())
+        scores: Dict[int, float] = defaultdict(float)
+        for term, snippet_id, tf in conn.execute(
+            f"SELECT term, snippet_id, tf FROM postings WHERE term IN ({term_marks}) AND snippet_id IN ({doc_marks})",
+            (*unique, *doc_ids),
+        ):
+            idf = math.log(1 + (n - df.get(term, 0) + 0.5) / (df.get(term, 0) + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[snippet_id] / (avgdl or 1))
+            scores[snippet_id] += idf * tf * (BM25_K1 + 1) / norm
+        return scores
+
+    def search(self, text: str, k: int = 10, max_age: float = 30 * 86400) -> List[Tuple[float, SearchSnippet]]:
+        """Rank fresh snippets containing all terms of `text` by BM25"""
+        cutoff = time.time() - max_age
+        terms = tokenize(text)
+        doc_ids = self._candidates(terms, cutoff)
+        scores = self._bm25(terms, doc_ids, cutoff)
+        top = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        docs = self._load([sid for sid, _ in top])
+        return [(score, docs[sid][1]) for sid, score in top]
+
+    def _load(self, ids: List[int]) -> Dict[int, Tuple[str, SearchSnippet]]:
+        if not ids:
+            return {}
+        marks = ",".join("?" for _ in ids)
+        rows = self._conn().execute(
+            f"SELECT id, search_type, kind, title, snippet, url, date, source FROM snippets WHERE id IN ({marks})", ids
+        ).fetchall()
+        return {
+            row[0]: (row[1], SearchSnippet(row[2], row[3], row[4], row[5], date=row[6], source=row[7]))
+            for row in rows
+        }
+
+    def lookup_research(self, component: str, max_age: float, min_snippets: int,
+                        per_section: int = 8) -> Optional[ComponentResearch]:
+        """Answer multi-angle research for a component from the index.
+
+        Returns None when coverage is thin: fewer than `min_snippets` fresh snippets
+        were fetched for the component, or fewer than three research angles are covered.
+        Snippets fetched for other components never count, even when they mention it.
+        `max_age` must not exceed the research cache TTL, or the index would serve
+        research the cache already considers expired.
+        """
+        cutoff = time.time() - max_age
+        component_terms = tokenize(component)
+        doc_ids = self._attached(component, cutoff)
+        if len(doc_ids) < min_snippets:
+            return None
+        docs = self._load(doc_ids)
+        by_type: Dict[str, List[int]] = defaultdict(list)
+        for sid, (search_type, _) in docs.items():
+            by_type[search_type].append(sid)
+        if len([t for t in ANGLE_TERMS if by_type.get(t)]) < 3:
+            return None
+
+        research = ComponentResearch(component)
+        for search_type, angle in ANGLE_TERMS.items():
+            ids = by_type.get(search_type)
+            if not ids:
+                continue
+            scores = self._bm25(component_terms + tokenize(angle), ids, cutoff)
+            ranked = sorted(ids, key=lambda sid: -scores.get(sid, 0.0))[:per_section]
+            snippets = [docs[sid][1] for sid in ranked]
+            for position, snippet in enumerate(s for s in snippets if s.kind == "organic"):
+                snippet.position = position + 1
+            research.sections.append(ResearchSection(search_type, f"{component} {angle} (indexed)", snippets))
+        return research
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._conn()
+        return {
+            "snippets": conn.execute("SELECT COUNT(*) FROM snippets").fetchone()[0],
+            "components": conn.execute("SELECT COUNT(DISTINCT component) FROM snippet_components").fetchone()[0],
+            "terms": conn.execute("SELECT COUNT(DISTINCT term) FROM postings").fetchone()[0],
+        }
@@ -0,0 +1,97 @@
+"""
+Minimal dependency-graph executor for the stages of one ingredient's pipeline.
+
+A Stage names the stages whose results it needs; it starts as soon as they have
+all finished, so independent stages run concurrently and the total latency is
+the critical path. A stage's `expand` hook may add stages once its result is
+known (the component research a breakdown calls for). Stage functions receive
+their dependencies' results as keyword arguments.
+
+run_stages() runs sync stages on a thread pool, each in a copy of the caller's
+context (priority, deadline, failure collectors, quota account). arun_stages()
+runs coroutine stages as tasks and sync stages in worker threads. With an
+InlineExecutor, run_stages() runs every stage in the calling thread instead.
+"""
+import asyncio
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from scheduler import run_in_context
+
+
+@dataclass(slots=True)
+class Stage:
+    name: str
+    fn: Callable[..., Any]
+    deps: Tuple[str, ...] = ()
+    # Called with (result, all results so far); returns stages to add to the graph
+    expand: Optional[Callable[[Any, Dict[str, Any]], List["Stage"]]] = None
+
+
+class InlineExecutor(Executor):
+    """Runs each submitted call at once in the calling thread (for cProfile, which only sees one thread)"""
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+def _ready(pending: Dict[str, Stage], results: Dict[str, Any]) -> List[Stage]:
+    ready = [stage for stage in pending.values() if all(dep in results for dep in stage.deps)]
+    for stage in ready:
+        del pending[stage.name]
+    return ready
+
+
+def _finish(stage: Stage, value: Any, results: Dict[str, Any], pending: Dict[str, Stage]) -> None:
+    results[stage.name] = value
+    if stage.expand is not None:
+        for added in stage.expand(value, results):
+            pending[added.name] = added
+
+
+def run_stages(stages: List[Stage], executor: Executor) -> Dict[str, Any]:
+    """Run the graph on executor threads. Returns every stage's result by name"""
+    pending = {stage.name: stage for stage in stages}
+    results: Dict[str, Any] = {}
+    running: Dict[Future, Stage] = {}
+    while pending or running:
+        for stage in _ready(pending, results):
+            kwargs = {dep: results[dep] for dep in stage.deps}
+            running[executor.submit(run_in_context(stage.fn), **kwargs)] = stage
+        if not running:
+            raise ValueError(f"Stages with unsatisfiable dependencies: {sorted(pending)}")
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            _finish(running.pop(future), future.result(), results, pending)
+    return results
+
+
+async def arun_stages(stages: List[Stage]) -> Dict[str, Any]:
+    """Async run_stages: coroutine functions are awaited, sync functions run in worker threads"""
+    pending = {stage.name: stage for stage in stages}
+    results: Dict[str, Any] = {}
+    running: Dict[asyncio.Task, Stage] = {}
+    try:
+        while pending or running:
+            for stage in _ready(pending, results):
+                kwargs = {dep: results[dep] for dep in stage.deps}
+                if asyncio.iscoroutinefunction(stage.fn):
+                    coroutine = stage.fn(**kwargs)
+                else:
+                    coroutine = asyncio.to_thread(stage.fn, **kwargs)
+                running[asyncio.ensure_future(coroutine)] = stage
+            if not running:
+                raise ValueError(f"Stages with unsatisfiable dependencies: {sorted(pending)}")
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                _finish(running.pop(task), task.result(), results, pending)
+    finally:
+        for task in running:
+            task.cancel()
+    return results
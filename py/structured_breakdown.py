@@ -0,0 +1,197 @@
+"""
+Component breakdowns built from structured database fields instead of the LLM.
+
+OpenFoodFacts products carry `additives_tags` ("en:e250") and an ingredients
+list; USDA detail records carry ingredients and food components. Together with
+the local additive taxonomy below they usually name an ingredient's components
+already, so resolve_breakdown() builds the breakdown from them and the LLM is
+only asked when the matched records are missing or list too little.
+
+An ingredient that is itself a known additive ("sodium nitrite", "E250") is
+resolved from the taxonomy alone.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from label_parser import ingredient_names
+from pipeline_types import Component, DatabaseAnalysis, IngredientBreakdown
+
+BREAKDOWN_MIN_COMPONENTS = int(os.getenv("BREAKDOWN_MIN_COMPONENTS", "3"))  # Fewer structured components fall back to the LLM
+MAX_SUB_INGREDIENTS = 15
+
+# E-number -> (name, function class, known concern or "")
+ADDITIVE_TAXONOMY: Dict[str, Tuple[str, str, str]] = {
+    "E100": ("curcumin", "colour", ""),
+    "E101": ("riboflavin", "colour", ""),
+    "E102": ("tartrazine", "colour", "azo dye; hyperactivity warning label in the EU"),
+    "E104": ("quinoline yellow", "colour", "hyperactivity warning label in the EU"),
+    "E110": ("sunset yellow", "colour", "azo dye; hyperactivity warning label in the EU"),
+    "E120": ("carmine", "colour", ""),
+    "E122": ("carmoisine", "colour", "azo dye; hyperactivity warning label in the EU"),
+    "E124": ("ponceau 4r", "colour", "azo dye; hyperactivity warning label in the EU"),
+    "E127": ("erythrosine", "colour", "thyroid tumours in rodents at high doses"),
+    "E129": ("allura red", "colour", "azo dye; hyperactivity warning label in the EU"),
+    "E133": ("brilliant blue", "colour", ""),
+    "E141": ("copper chlorophyll", "colour", ""),
+    "E150a": ("plain caramel", "colour", ""),
+    "E150c": ("ammonia caramel", "colour", "may contain 4-methylimidazole (IARC group 2B)"),
+    "E150d": ("sulphite ammonia caramel", "colour", "may contain 4-methylimidazole (IARC group 2B)"),
+    "E160a": ("beta-carotene", "colour", ""),
+    "E160c": ("paprika extract", "colour", ""),
+    "E162": ("beetroot red", "colour", ""),
+    "E170": ("calcium carbonate", "colour", ""),
+    "E171": ("titanium dioxide", "colour", "banned in the EU since 2022 over genotoxicity concerns"),
+    "E200": ("sorbic acid", "preservative", ""),
+    "E202": ("potassium sorbate", "preservative", ""),
+    "E210": ("benzoic acid", "preservative", ""),
+    "E211": ("sodium benzoate", "preservative", "can form benzene with ascorbic acid"),
+    "E212": ("potassium benzoate", "preservative", "can form benzene with ascorbic acid"),
+    "E220": ("sulphur dioxide", "preservative", ""),
+    "E223": ("sodium metabisulphite", "preservative", ""),
+    "E224": ("potassium metabisulphite", "preservative", ""),
+    "E249": ("potassium nitrite", "preservative", "forms carcinogenic nitrosamines in cured meat"),
+    "E250": ("sodium nitrite", "preservative", "forms carcinogenic nitrosamines in cured meat"),
+    "E251": ("sodium nitrate", "preservative", "converted to nitrite; nitrosamine formation"),
+    "E252": ("potassium nitrate", "preservative", "converted to nitrite; nitrosamine formation"),
+    "E260": ("acetic acid", "acidity regulator", ""),
+    "E270": ("lactic acid", "acidity regulator", ""),
+    "E282": ("calcium propionate", "preservative", ""),
+    "E296": ("malic acid", "acidity regulator", ""),
+    "E300": ("ascorbic acid", "antioxidant", ""),
+    "E301": ("sodium ascorbate", "antioxidant", ""),
+    "E306": ("tocopherols", "antioxidant", ""),
+    "E310": ("propyl gallate", "antioxidant", ""),
+    "E316": ("sodium erythorbate", "antioxidant", ""),
+    "E319": ("tbhq", "antioxidant", ""),
+    "E320": ("bha", "antioxidant", "butylated hydroxyanisole (IARC group 2B)"),
+    "E321": ("bht", "antioxidant", "butylated hydroxytoluene; limited evidence in animals"),
+    "E322": ("lecithins", "emulsifier", ""),
+    "E330": ("citric acid", "acidity regulator", ""),
+    "E331": ("sodium citrates", "acidity regulator", ""),
+    "E332": ("potassium citrates", "acidity regulator", ""),
+    "E334": ("tartaric acid", "acidity regulator", ""),
+    "E338": ("phosphoric acid", "acidity regulator", ""),
+    "E339": ("sodium phosphates", "acidity regulator", ""),
+    "E340": ("potassium phosphates", "acidity regulator", ""),
+    "E341": ("calcium phosphates", "acidity regulator", ""),
+    "E385": ("calcium disodium edta", "sequestrant", ""),
+    "E407": ("carrageenan", "thickener", "degraded carrageenan (poligeenan) is IARC group 2B"),
+    "E410": ("locust bean gum", "thickener", ""),
+    "E412": ("guar gum", "thickener", ""),
+    "E415": ("xanthan gum", "thickener", ""),
+    "E420": ("sorbitol", "sweetener", ""),
+    "E422": ("glycerol", "humectant", ""),
+    "E433": ("polysorbate 80", "emulsifier", ""),
+    "E440": ("pectins", "gelling agent", ""),
+    "E450": ("diphosphates", "raising agent", ""),
+    "E451": ("triphosphates", "stabiliser", ""),
+    "E452": ("polyphosphates", "stabiliser", ""),
+    "E466": ("carboxymethyl cellulose", "thickener", ""),
+    "E471": ("mono- and diglycerides of fatty acids", "emulsifier", ""),
+    "E472e": ("datem", "emulsifier", ""),
+    "E473": ("sucrose esters of fatty acids", "emulsifier", ""),
+    "E476": ("polyglycerol polyricinoleate", "emulsifier", ""),
+    "E481": ("sodium stearoyl lactylate", "emulsifier", ""),
+    "E491": ("sorbitan monostearate", "emulsifier", ""),
+    "E500": ("sodium carbonates", "raising agent", ""),
+    "E503": ("ammonium carbonates", "raising agent", ""),
+    "E509": ("calcium chloride", "firming agent", ""),
+    "E551": ("silicon dioxide", "anti-caking agent", ""),
+    "E575": ("glucono delta-lactone", "acidity regulator", ""),
+    "E621": ("monosodium glutamate", "flavour enhancer", ""),
+    "E627": ("disodium guanylate", "flavour enhancer", ""),
+    "E631": ("disodium inosinate", "flavour enhancer", ""),
+    "E635": ("disodium 5'-ribonucleotides", "flavour enhancer", ""),
+    "E903": ("carnauba wax", "glazing agent", ""),
+    "E904": ("shellac", "glazing agent", ""),
+    "E950": ("acesulfame k", "sweetener", ""),
+    "E951": ("aspartame", "sweetener", "IARC group 2B (2023)"),
+    "E954": ("saccharin", "sweetener", "bladder tumours in rats; delisted as a human carcinogen"),
+    "E955": ("sucralose", "sweetener", "sucralose-6-acetate genotoxicity reported in vitro"),
+    "E960": ("steviol glycosides", "sweetener", ""),
+    "E965": ("maltitol", "sweetener", ""),
+    "E967": ("xylitol", "sweetener", ""),
+    "E1422": ("acetylated distarch adipate", "thickener", ""),
+}
+
+_E_TAG_RE = re.compile(r"^(?:[a-z]{2}:)?e(\d{3,4}[a-j]?)", re.I)
+_E_NAME_RE = re.compile(r"^e\s?-?(\d{3,4}[a-j]?)$", re.I)
+_BY_NAME = {name: code for code, (name, _, _) in ADDITIVE_TAXONOMY.items()}
+
+
+def additive_code(text: str) -> Optional[str]:
+    """E-number for an OFF tag ("en:e250"), an E-number ("E 250") or a taxonomy name ("sodium nitrite")"""
+    text = text.strip()
+    match = _E_TAG_RE.match(text) if ":" in text else _E_NAME_RE.match(text)
+    if match:
+        return f"E{match.group(1).lower()}"
+    return _BY_NAME.get(text.lower())
+
+
+def additive_component(code: str) -> Tuple[Component, str]:
+    """Component for an E-number and its known concern ("" when none)"""
+    name, function, concern = ADDITIVE_TAXONOMY.get(code, (code, "additive", ""))
+    return Component(name=name, type=function, description=f"{code} {function}".strip()), concern
+
+
+def _tokens(text: str) -> set:
+    return {word.rstrip("s") for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 1}
+
+
+def _matches(ingredient: str, name: str) -> bool:
+    """The record name mentions every word of the ingredient"""
+    wanted = _tokens(ingredient)
+    return bool(wanted) and wanted <= _tokens(name)
+
+
+def resolve_breakdown(ingredient: str, database: Optional[DatabaseAnalysis]) -> Optional[IngredientBreakdown]:
+    """Breakdown from the taxonomy and matched database records, or None when they are too sparse"""
+    code = additive_code(ingredient)
+    if code in ADDITIVE_TAXONOMY:
+        component, concern = additive_component(code)
+        return IngredientBreakdown(ingredient, [component], [], [concern] if concern else [])
+    if database is None:
+        return None
+
+    additives: Dict[str, Component] = {}
+    concerns: List[str] = []
+    sub_ingredients: Dict[str, Component] = {}
+
+    def add_additive(code: str) -> None:
+        if code not in additives:
+            component, concern = additive_component(code)
+            additives[code] = component
+            if concern:
+                concerns.append(f"{component.name}: {concern}")
+
+    def add_sub_ingredient(name: str) -> None:
+        code = additive_code(name)
+        if code is not None:
+            add_additive(code)
+        elif name.lower() != ingredient.lower() and len(sub_ingredients) < MAX_SUB_INGREDIENTS:
+            sub_ingredients.setdefault(name.lower(), Component(name=name, type="sub-ingredient"))
+
+    # The first matching OpenFoodFacts product describes the branded form of the ingredient
+    for product in database.off_products:
+        if _matches(ingredient, product.product_name or ""):
+            for tag in product.additives_tags:
+                code = additive_code(tag)
+                if code is not None:
+                    add_additive(code)
+            for name in ingredient_names(product.ingredients_text or ""):
+                add_sub_ingredient(name)
+            break
+    if database.usda is not None and _matches(ingredient, database.usda.description or ""):
+        for name in ingredient_names(", ".join(database.usda.ingredients)):
+            add_sub_ingredient(name)
+        for name in database.usda.additives:
+            code = additive_code(name)
+            if code is not None:
+                add_additive(code)
+
+    components = list(additives.values()) + list(sub_ingredients.values())
+    if len(components) < BREAKDOWN_MIN_COMPONENTS:
+        return None
+    # Additives come first, so they are researched before sub-ingredients
+    return IngredientBreakdown(ingredient, components, [], concerns)
@@ -0,0 +1,20 @@
+"""
+Test setup: the server modules are flat files in py/, and every database or
+cache they open goes to a temporary directory instead of the checkout.
+"""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="foodsafe-tests-")
+os.environ.update({
+    "ANALYSIS_DB_PATH": os.path.join(_tmp, "analysis_log.db"),
+    "CACHE_BACKEND": "memory",
+    "LLM_MEMO_PATH": os.path.join(_tmp, "completion_memo.db"),
+    "SNIPPET_INDEX_PATH": os.path.join(_tmp, "snippet_index.db"),
+    "OPENAI_API_KEY": "",
+    "SERPAPI_KEY": "",
+    "USE_WEB_SEARCH": "false",
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
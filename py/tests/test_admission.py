@@ -0,0 +1,111 @@
+import pytest
+
+import admission
+from admission import AdmissionController, CircuitBreaker, breaker_for
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def opened(threshold=3, cooldown=10.0):
+    breaker = CircuitBreaker("test", failure_threshold=threshold, cooldown=cooldown)
+    for _ in range(threshold):
+        breaker.record_failure()
+    return breaker
+
+
+def controller(max_in_flight=4, max_queue=10, batch_share=0.5, depth=0, upstreams=()):
+    return AdmissionController(max_in_flight, max_queue, batch_share, retry_after=2.0,
+                               queue_depth=lambda: depth, required_upstreams=list(upstreams))
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, cooldown=10.0)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.stats() == {"state": "open", "consecutive_failures": 3, "opened": 1}
+    assert not breaker.allow()
+    assert breaker.is_open()
+    clock.now += 4
+    assert breaker.retry_after() == 6.0
+
+
+def test_half_open_admits_one_probe_that_closes_it(clock):
+    breaker = opened()
+    clock.now += 10
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert not breaker.allow()  # Only the probe goes out
+    breaker.record_success()
+    assert breaker.stats()["state"] == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_cooldown(clock):
+    breaker = opened()
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.stats()["state"] == "open"
+    assert breaker.stats()["opened"] == 2
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.allow()
+
+
+def test_in_flight_limit_and_release():
+    edge = controller(max_in_flight=2)
+    assert edge.try_acquire() is None
+    assert edge.try_acquire() is None
+    rejection = edge.try_acquire()
+    assert (rejection.status, rejection.reason, rejection.retry_after) == (429, "too many requests in flight", 2.0)
+    edge.release()
+    assert edge.try_acquire() is None
+    assert edge.stats()["admitted"] == 3
+    assert edge.stats()["shed"] == {"too many requests in flight": 1}
+
+
+def test_batch_requests_are_shed_first():
+    edge = controller(max_in_flight=4, batch_share=0.5)
+    assert edge.try_acquire(batch=True) is None
+    assert edge.try_acquire(batch=True) is None
+    assert edge.try_acquire(batch=True).status == 429
+    assert edge.try_acquire() is None
+    assert edge.try_acquire() is None
+    assert edge.try_acquire() is not None
+
+
+def test_deep_upstream_queue_sheds():
+    edge = controller(max_queue=10, batch_share=0.5, depth=6)
+    assert edge.try_acquire() is None
+    assert edge.try_acquire(batch=True).reason == "upstream queue full"
+
+
+def test_open_required_upstream_returns_503(clock):
+    breaker = breaker_for("test-admission-upstream")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    edge = controller(upstreams=["test-admission-upstream"])
+    rejection = edge.try_acquire()
+    assert rejection.status == 503
+    assert rejection.retry_after == breaker.cooldown
+    assert edge.in_flight == 0
+    breaker.record_success()
+    assert edge.try_acquire() is None
@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import rag_server
+from pipeline_types import RiskResult
+
+CATALOG = {
+    "40000001": {"product_name": "Cola", "brands": "Fizz", "ingredients_text": "Water, sugar, caramel colour"},
+    "40000002": {"product_name": "Lemonade", "brands": "Fizz", "ingredients_text": "water, Sugar, citric acid"},
+    "40000003": {"product_name": "Mystery", "brands": "", "ingredients_text": ""},
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Client over a fake OpenFoodFacts; barcode 50000000 is a failing upstream"""
+    fetched, assessed = [], []
+    lock = threading.Lock()
+
+    def product_details(barcode):
+        with lock:
+            fetched.append(barcode)
+        if barcode == "50000000":
+            return {"error": "OpenFoodFacts unavailable"}
+        if barcode not in CATALOG:
+            return {"status": 0}
+        return {"status": 1, "product": dict(CATALOG[barcode])}
+
+    def assess(ingredient, refresh=False):
+        with lock:
+            assessed.append(ingredient)
+        return RiskResult(ingredient, "low", 1.0, "test", "ok")
+
+    monkeypatch.setattr(rag_server, "get_openfoodfacts_product_details", product_details)
+    monkeypatch.setattr(rag_server, "get_ingredient_assessment", assess)
+    monkeypatch.setattr(rag_server, "log_analysis", lambda *args: None)
+    for barcode in [*CATALOG, "49999999", "50000000"]:
+        rag_server.barcode_cache.invalidate(barcode)
+    client = TestClient(rag_server.app)
+    client.fetched, client.assessed = fetched, assessed
+    return client
+
+
+def test_single_barcode(client):
+    response = client.get("/products/40000001")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["barcode"] == "40000001"
+    assert body["product"]["name"] == "Cola"
+    assert [item["name"] for item in body["ingredients"]] == ["Water", "sugar", "caramel colour"]
+    assert "cached" not in body
+    assert rag_server.admission.in_flight == 0
+
+
+def test_single_barcode_is_shed_when_admission_is_full(client, monkeypatch):
+    monkeypatch.setattr(rag_server.admission, "in_flight", rag_server.admission.max_in_flight)
+    response = client.get("/products/40000001")
+    assert response.status_code == 429
+    assert response.json()["retry_after"] >= 1
+    assert "Retry-After" in response.headers
+    assert client.fetched == []
+
+
+def test_barcode_errors(client):
+    assert client.get("/products/12ab").status_code == 400
+    assert client.get("/products/49999999").status_code == 404
+    assert client.get("/products/40000003").json()["error"] == "Product has no ingredient list on OpenFoodFacts."
+    assert client.get("/products/50000000").status_code == 502
+    assert rag_server.admission.in_flight == 0
+
+
+def test_products_are_cached_but_upstream_errors_are_not(client):
+    client.get("/products/40000001")
+    client.get("/products/40000001")
+    client.get("/products/49999999")
+    client.get("/products/49999999")
+    client.get("/products/50000000")
+    client.get("/products/50000000")
+    assert client.fetched.count("40000001") == 1
+    assert client.fetched.count("49999999") == 1
+    assert client.fetched.count("50000000") == 2
+
+
+def test_batch_assesses_shared_ingredients_once(client):
+    response = client.post("/products", json={"barcodes": ["40000001", " 40000002", "40000001", "49999999", "x"]})
+    assert response.status_code == 200
+    results = response.json()
+    assert list(results) == ["40000001", "40000002", "49999999", "x"]
+    assert results["40000002"]["product"]["name"] == "Lemonade"
+    assert "status" not in results["49999999"]
+    assert results["x"]["error"].startswith("Invalid barcode")
+    assert sorted(name.lower() for name in client.assessed) == ["caramel colour", "citric acid", "sugar", "water"]
+    assert rag_server.admission.in_flight == 0
+
+
+def test_batch_is_shed_when_admission_is_full(client, monkeypatch):
+    monkeypatch.setattr(rag_server.admission, "in_flight", rag_server.admission.max_in_flight)
+    response = client.post("/products", json={"barcodes": ["40000001"]})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert client.fetched == []
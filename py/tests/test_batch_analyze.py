@@ -0,0 +1,119 @@
+import json
+import sqlite3
+
+import pytest
+
+import batch_analyze
+import rag_server
+from batch_analyze import NdjsonSink, SQLiteSink, analyze_chunk, iter_chunks, read_products, worker_environment
+
+FINGERPRINT = {"input": "/catalog.csv", "size": 100, "mtime": 1.0, "chunk_size": 2}
+
+
+def record(row, risk=None):
+    return {"row": row, "product": f"p{row}", "summary": {"composite_risk": risk} if risk is not None else None}
+
+
+def test_read_csv(tmp_path):
+    path = tmp_path / "catalog.csv"
+    path.write_text("product,ingredients\nCola,\"water, sugar\"\n,salt\nEmpty,  \n", encoding="utf-8")
+    assert list(read_products(str(path), "csv", "product", "ingredients")) == [
+        (0, "Cola", "water, sugar"), (1, "row 1", "salt"), (2, "Empty", ""),
+    ]
+
+
+def test_read_ndjson_tolerates_malformed_rows(tmp_path):
+    path = tmp_path / "catalog.ndjson"
+    path.write_text('{"name": "Cola", "text": "water"}\n\n{not json\n[1, 2]\n{"name": "Chips"}\n', encoding="utf-8")
+    assert list(read_products(str(path), "ndjson", "name", "text")) == [
+        (0, "Cola", "water"), (1, "row 1", ""), (2, "row 2", ""), (3, "Chips", ""),
+    ]
+
+
+def test_iter_chunks():
+    rows = [(i, f"p{i}", "salt") for i in range(5)]
+    chunks = list(iter_chunks(iter(rows), 2))
+    assert [index for index, _ in chunks] == [0, 1, 2]
+    assert chunks[2][1] == [rows[4]]
+    assert list(iter_chunks(iter([]), 2)) == []
+
+
+def test_worker_environment_splits_the_limits(monkeypatch):
+    monkeypatch.setattr(rag_server, "OPENAI_CONCURRENCY", 16)
+    monkeypatch.setattr(rag_server, "SERPAPI_CONCURRENCY", 3)
+    assert worker_environment(4) == {"OPENAI_CONCURRENCY": "4", "SERPAPI_CONCURRENCY": "1",
+                                     "INTERACTIVE_RESERVED_SLOTS": "0"}
+
+
+def test_analyze_chunk_skips_rows_without_ingredients(monkeypatch):
+    calls = []
+
+    def analyze_product_batch(products, ranked=True, log=True):
+        calls.append((products, ranked, log))
+        return [{"summary": {"composite_risk": len(text)}} for _, text in products]
+    monkeypatch.setattr(rag_server, "analyze_product_batch", analyze_product_batch)
+    index, records = analyze_chunk(3, [(0, "Cola", "water"), (1, "Empty", ""), (2, "Chips", "salt, oil")])
+    assert index == 3
+    assert calls == [([("Cola", "water"), ("Chips", "salt, oil")], False, False)]
+    assert records == [
+        {"row": 0, "product": "Cola", "summary": {"composite_risk": 5}},
+        {"row": 1, "product": "Empty", "error": "No ingredients."},
+        {"row": 2, "product": "Chips", "summary": {"composite_risk": 9}},
+    ]
+    assert analyze_chunk(4, [(5, "Empty", "")]) == (4, [{"row": 5, "product": "Empty", "error": "No ingredients."}])
+
+
+def test_ndjson_sink_resumes_from_its_checkpoint(tmp_path):
+    path = str(tmp_path / "results.ndjson")
+    sink = NdjsonSink(path, FINGERPRINT, restart=False)
+    sink.write_chunk(0, [record(0), record(1)])
+    sink.file.write(b'{"row": 2, "product": "half-written')  # Interrupted mid-chunk
+    sink.file.close()
+
+    resumed = NdjsonSink(path, FINGERPRINT, restart=False)
+    assert resumed.done == {0}
+    resumed.write_chunk(1, [record(2)])
+    resumed.finish(complete=True)
+    with open(path, encoding="utf-8") as f:
+        assert [json.loads(line)["row"] for line in f] == [0, 1, 2]
+    with open(f"{path}.checkpoint.json", encoding="utf-8") as f:
+        assert json.load(f)["complete"]
+
+    with pytest.raises(SystemExit):
+        NdjsonSink(path, {**FINGERPRINT, "chunk_size": 3}, restart=False)
+    restarted = NdjsonSink(path, {**FINGERPRINT, "chunk_size": 3}, restart=True)
+    assert restarted.done == set()
+    restarted.finish(complete=False)
+    assert (tmp_path / "results.ndjson").read_text(encoding="utf-8") == ""
+
+
+def test_sqlite_sink_resumes_and_ranks(tmp_path):
+    path = str(tmp_path / "results.db")
+    sink = SQLiteSink(path, FINGERPRINT, restart=False)
+    sink.write_chunk(0, [record(0, 0.2), record(1, 0.9)])
+    sink.finish(complete=False)
+
+    resumed = SQLiteSink(path, FINGERPRINT, restart=False)
+    assert resumed.done == {0}
+    resumed.write_chunk(1, [record(2, 0.5), {"row": 3, "product": "p3", "error": "No ingredients."}])
+    resumed.finish(complete=True)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT row, rank, error FROM batch_results ORDER BY row").fetchall() == [
+        (0, 3, None), (1, 1, None), (2, 2, None), (3, None, "No ingredients."),
+    ]
+    conn.close()
+
+    with pytest.raises(SystemExit):
+        SQLiteSink(path, {**FINGERPRINT, "size": 1}, restart=False)
+    restarted = SQLiteSink(path, FINGERPRINT, restart=True)
+    assert restarted.done == set()
+    restarted.finish(complete=False)
+
+
+def test_input_fingerprint_changes_with_the_file(tmp_path):
+    path = tmp_path / "catalog.csv"
+    path.write_text("product,ingredients\n", encoding="utf-8")
+    before = batch_analyze.input_fingerprint(str(path), 200)
+    path.write_text("product,ingredients\nCola,water\n", encoding="utf-8")
+    assert batch_analyze.input_fingerprint(str(path), 200) != before
+    assert before["chunk_size"] == 200
@@ -0,0 +1,69 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import rag_server
+from pipeline_types import RiskResult
+from rag_server import analyze_product_batch, plan_batch
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Records assessments and validations; validation flags names starting with "brick" """
+    calls = []
+    lock = threading.Lock()
+
+    def assess(ingredient, refresh=False):
+        with lock:
+            calls.append(ingredient)
+        return RiskResult(ingredient, "low", float(len(ingredient) % 5), "test", "ok")
+
+    validations = []
+
+    def validate(ingredients):
+        validations.append(ingredients)
+        return {"non_food_items": [name for name in ingredients.split(", ") if name.lower().startswith("brick")]}
+    monkeypatch.setattr(rag_server, "get_ingredient_assessment", assess)
+    monkeypatch.setattr(rag_server, "validate_food_input", validate)
+    return SimpleNamespace(assessed=calls, validations=validations)
+
+
+def test_plan_batch_keeps_first_spelling_in_order():
+    vocabulary = plan_batch([
+        ("cola", "Water, Sugar, caramel colour"),
+        ("chips", "potatoes, SUGAR, water."),
+        ("label", "Ingredients: salt"),
+    ])
+    assert vocabulary == {"water": "Water", "sugar": "Sugar", "caramel colour": "caramel colour",
+                          "potatoes": "potatoes", "salt": "salt"}
+
+
+def test_plan_batch_of_nothing():
+    assert plan_batch([]) == {}
+    assert plan_batch([("empty", ""), ("blank", "  ")]) == {}
+
+
+def test_each_distinct_ingredient_is_assessed_once(pipeline):
+    products = [(f"p{i}", "water, sugar, salt" if i % 2 else "Sugar, Water, citric acid") for i in range(50)]
+    responses = analyze_product_batch(products, log=False)
+    assert sorted(name.lower() for name in pipeline.assessed) == ["citric acid", "salt", "sugar", "water"]
+    assert len(pipeline.validations) == 1
+    assert len(responses) == 50
+    # Each product keeps its own spellings
+    assert [item["name"] for item in responses[0]["ingredients"]] == ["Sugar", "Water", "citric acid"]
+    assert [item["name"] for item in responses[1]["ingredients"]] == ["water", "sugar", "salt"]
+    assert sorted(response["summary"]["rank"] for response in responses) == list(range(1, 51))
+
+
+def test_products_with_non_food_items_are_rejected(pipeline):
+    responses = analyze_product_batch([("wall", "brick dust, water"), ("drink", "water")], ranked=False, log=False)
+    assert "Non-food items detected: brick dust" in responses[0]["error"]
+    assert "rank" not in responses[1]["summary"]
+    assert pipeline.assessed == ["water"]
+
+
+def test_analyze_batch_is_keyed_by_product(pipeline):
+    results = rag_server.analyze_batch([("a", "water"), ("b", "salt")])
+    assert set(results) == {"a", "b"}
+    assert results["b"]["ingredients"][0]["name"] == "salt"
@@ -0,0 +1,146 @@
+import threading
+import time
+
+import pytest
+
+from cache_backends import HashRing, MemoryCacheBackend, NetworkCacheBackend, SQLiteCacheBackend, serve_cache_node
+
+KEYS = [f"research:v1:ingredient {i}" for i in range(2000)]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCacheBackend()
+    return SQLiteCacheBackend(str(tmp_path / "cache.db"))
+
+
+@pytest.fixture
+def nodes():
+    servers = [serve_cache_node(port=0) for _ in range(3)]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield [f"127.0.0.1:{server.server_address[1]}" for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_hash_ring_is_stable_and_balanced():
+    nodes = ["http://a", "http://b", "http://c"]
+    ring, same = HashRing(nodes), HashRing(reversed(nodes))
+    owners = [ring.get_node(key) for key in KEYS]
+    assert owners == [same.get_node(key) for key in KEYS]
+    for node in nodes:
+        assert 400 < owners.count(node) < 950
+
+
+def test_adding_a_node_only_moves_its_share_of_keys():
+    ring = HashRing(["http://a", "http://b", "http://c"])
+    before = {key: ring.get_node(key) for key in KEYS}
+    ring.add_node("http://d")
+    moved = [key for key in KEYS if ring.get_node(key) != before[key]]
+    # Only keys now owned by the new node move, about a quarter of them
+    assert all(ring.get_node(key) == "http://d" for key in moved)
+    assert 300 < len(moved) < 750
+    ring.remove_node("http://d")
+    assert {key: ring.get_node(key) for key in KEYS} == before
+
+
+def test_empty_ring_raises():
+    with pytest.raises(ValueError):
+        HashRing([]).get_node("bha")
+
+
+def test_get_set_delete(backend):
+    assert backend.get("bha") is None
+    backend["bha"] = {"risk": "moderate", "sources": ["a"]}
+    assert backend["bha"] == {"risk": "moderate", "sources": ["a"]}
+    assert "bha" in backend
+    backend.delete("bha")
+    assert "bha" not in backend
+    with pytest.raises(KeyError):
+        backend["bha"]
+
+
+def test_delete_prefix(backend):
+    for key in ("research:v1:bha", "research:v1:bht", "research:v2:bha", "products:1"):
+        backend.set(key, 1)
+    assert backend.delete_prefix("research:v1:") == 2
+    assert backend.get("research:v1:bha") is None
+    assert backend.get("research:v2:bha") == 1
+    assert backend.get("products:1") == 1
+
+
+def test_version_registry_keeps_order(backend):
+    assert backend.register_version("research", "v1") == ["v1"]
+    backend.register_version("research", "v2")
+    assert backend.register_version("other", "x") == ["x"]
+    time.sleep(0.01)
+    assert backend.register_version("research", "v1") == ["v2", "v1"]
+    backend.forget_version("research", "v2")
+    assert backend.register_version("research", "v1") == ["v1"]
+
+
+def test_sqlite_evicts_oldest_beyond_max_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteCacheBackend(path, max_entries=100)
+    for i in range(100):
+        cache.set(f"k{i}", i)
+    cache.set("k100", 100)
+    assert cache.evict() == 11
+    assert cache.stats()["entries"] == 90
+    assert cache.get("k0") is None
+    assert cache.get("k100") == 100
+
+
+def test_sqlite_evicts_by_age_on_open(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteCacheBackend(path)
+    cache.set("old", 1)
+    cache._conn().execute("UPDATE cache SET updated_at = updated_at - 1000 WHERE key = 'old'")
+    cache._conn().commit()
+    cache.set("new", 2)
+    reopened = SQLiteCacheBackend(path, max_age=500)
+    assert reopened.get("old") is None
+    assert reopened.get("new") == 2
+    assert reopened.stats()["evicted"] == 1
+
+
+def test_sqlite_imports_the_old_registry_key(tmp_path):
+    path = str(tmp_path / "cache.db")
+    SQLiteCacheBackend(path).set("cache_versions", {"research": ["v1", "v2"]})
+    reopened = SQLiteCacheBackend(path)
+    assert reopened.get("cache_versions") is None
+    assert reopened.register_version("research", "v3") == ["v1", "v2", "v3"]
+
+
+def test_network_backend_shards_across_nodes(nodes):
+    cache = NetworkCacheBackend(nodes)
+    for i in range(30):
+        cache.set(f"research:v1:{i}", {"i": i})
+    cache.set("products:1", 1)
+    assert [cache.get(f"research:v1:{i}")["i"] for i in range(30)] == list(range(30))
+    assert cache.delete_prefix("research:v1:") == 30
+    assert cache.get("research:v1:0") is None
+    assert cache.get("products:1") == 1
+    assert cache.errors == 0
+
+
+def test_network_version_registry(nodes):
+    cache = NetworkCacheBackend(nodes)
+    cache.register_version("research", "v1")
+    # Another host sees the same registry because one node owns it
+    assert NetworkCacheBackend(list(reversed(nodes))).register_version("research", "v2") == ["v1", "v2"]
+    cache.forget_version("research", "v1")
+    assert cache.register_version("research", "v2") == ["v2"]
+
+
+def test_unreachable_node_is_a_miss(nodes):
+    cache = NetworkCacheBackend(nodes + ["127.0.0.1:9"], timeout=0.2)
+    keys = [f"k{i}" for i in range(40)]
+    for key in keys:
+        cache.set(key, 1)
+    assert cache.errors > 0
+    assert sum(cache.get(key) is None for key in keys) > 0
+    assert cache.delete_prefix("k") == -1
@@ -0,0 +1,122 @@
+import zlib
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import completion_memo
+import rag_server
+from completion_memo import CompletionMemo, completion_key, fresh_completions, memoizable, response_content
+
+REQUEST = {"model": "gpt-4o-mini", "temperature": 0, "messages": [{"role": "user", "content": "Is BHA safe?"}]}
+
+
+@pytest.fixture
+def memo(tmp_path):
+    return CompletionMemo(str(tmp_path / "memo.db"), max_bytes=10_000, ttl=100)
+
+
+def compressed_size(text):
+    return len(zlib.compress(text.encode("utf-8"), 6))
+
+
+def test_key_covers_the_whole_request_except_stream():
+    assert completion_key(REQUEST) == completion_key({**REQUEST, "stream": True})
+    assert completion_key(REQUEST) == completion_key(dict(reversed(REQUEST.items())))
+    assert completion_key(REQUEST) != completion_key({**REQUEST, "temperature": 0.2})
+    assert completion_key(REQUEST) != completion_key({**REQUEST, "response_format": {"type": "json_object"}})
+
+
+def test_memoizable(monkeypatch):
+    assert memoizable(REQUEST)
+    assert not memoizable({**REQUEST, "temperature": 0.9})
+    assert not memoizable({"model": "gpt-4o-mini"})  # The API default temperature is 1
+    token = fresh_completions.set(True)
+    try:
+        assert not memoizable(REQUEST)
+    finally:
+        fresh_completions.reset(token)
+    monkeypatch.setattr(completion_memo, "LLM_MEMO_ENABLED", False)
+    assert not memoizable(REQUEST)
+
+
+def test_only_complete_responses_are_memoized():
+    def response(content, finish_reason="stop"):
+        return SimpleNamespace(choices=[SimpleNamespace(finish_reason=finish_reason,
+                                                        message=SimpleNamespace(content=content))])
+    assert response_content(response("Low risk")) == "Low risk"
+    assert response_content(response("Low ri", "length")) is None
+    assert response_content(response("")) is None
+    assert response_content(SimpleNamespace(choices=[])) is None
+
+
+def test_put_then_get(memo):
+    key = completion_key(REQUEST)
+    assert memo.get(key) is None
+    memo.put(key, "gpt-4o-mini", "Low risk at typical intake")
+    hit = memo.get(key)
+    assert hit.choices[0].message.content == "Low risk at typical intake"
+    assert hit.model == "gpt-4o-mini"
+    assert hit.memoized
+    assert memo.stats()["hit_rate"] == 0.5
+
+
+def test_expired_entries_miss(memo, monkeypatch):
+    memo.put("k", "m", "text")
+    now = completion_memo.time.time()
+    monkeypatch.setattr(completion_memo.time, "time", lambda: now + 101)
+    assert memo.get("k") is None
+    assert memo.evict() == 1
+
+
+def test_replacing_an_entry_keeps_the_byte_count_exact(memo):
+    memo.put("k", "m", "a" * 50)
+    memo.put("k", "m", "different text " * 20)
+    assert memo._bytes == compressed_size("different text " * 20)
+    assert memo.stats()["entries"] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    texts = {f"k{i}": f"{i} " + "".join(chr(65 + (i * j) % 26) for j in range(400)) for i in range(1, 6)}
+    memo = CompletionMemo(str(tmp_path / "memo.db"), max_bytes=sum(map(compressed_size, texts.values())), ttl=100)
+    clock = [1000.0]
+    monkeypatch.setattr(completion_memo.time, "time", lambda: clock[0])
+    for key, text in texts.items():
+        clock[0] += 1
+        memo.put(key, "m", text)
+    clock[0] += 1
+    assert memo.get("k1") is not None  # k1 is now the most recently used
+    clock[0] += 1
+    memo.put("k6", "m", "extra " + texts["k5"])
+    assert memo.get("k2") is None
+    assert memo.get("k1") is not None
+    assert memo.get("k6") is not None
+    assert memo._bytes <= memo.max_bytes * completion_memo.EVICT_TO
+    assert memo.stats()["evicted"] >= 1
+
+
+def test_lookup_and_remember_use_the_process_memo(monkeypatch, memo):
+    monkeypatch.setattr(completion_memo, "_memo", memo)
+    key, hit = completion_memo.lookup(REQUEST)
+    assert hit is None
+    completion_memo.remember(key, REQUEST, "Low risk")
+    assert completion_memo.lookup({**REQUEST, "stream": True})[1].choices[0].message.content == "Low risk"
+    assert completion_memo.lookup({**REQUEST, "temperature": 1.0}) == (None, None)
+
+
+def test_fresh_completions_are_an_admin_only_request_flag(monkeypatch):
+    seen = []
+
+    async def validate(ingredients):
+        seen.append(fresh_completions.get())
+        return {"is_valid": False, "non_food_items": [ingredients]}
+    monkeypatch.setattr(rag_server, "OPENAI_ASYNC", True)
+    monkeypatch.setattr(rag_server, "avalidate_food_input", validate)
+    monkeypatch.setattr(rag_server, "ADMIN_API_KEY", "secret")
+    client = TestClient(rag_server.app)
+    body = {"ingredients": "brick"}
+    assert client.post("/ingredients", json=body, headers={"Cache-Control": "no-cache"}).status_code == 200
+    assert client.post("/ingredients?fresh=1", json=body).status_code == 403
+    assert client.post("/ingredients?fresh=1", json=body, headers={"X-Admin-Key": "wrong"}).status_code == 403
+    assert client.post("/ingredients?fresh=1", json=body, headers={"X-Admin-Key": "secret"}).status_code == 200
+    assert seen == [False, True]
@@ -0,0 +1,86 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import rag_server
+from pipeline_types import ComponentResearch, ResearchSection, SearchSnippet
+from research_cache import normalize_key
+from snippet_index import SnippetIndex
+
+DAY = 86400
+ANGLES = ("health", "safety", "official", "regulatory", "recent")
+
+
+@pytest.fixture
+def research(tmp_path, monkeypatch):
+    index = SnippetIndex(str(tmp_path / "snippets.db"))
+    calls = []
+
+    def fetch_web_snippets(query, search_type="general"):
+        calls.append(search_type)
+        return [SearchSnippet("organic", f"{query} {i}", f"{query} finding {i}", f"https://example.com/{search_type}/{i}")
+                for i in range(3)]
+    monkeypatch.setattr(rag_server, "_snippet_index", index)
+    monkeypatch.setattr(rag_server, "web_search_enabled", lambda: True)
+    monkeypatch.setattr(rag_server, "fetch_web_snippets", fetch_web_snippets)
+    return SimpleNamespace(index=index, calls=calls)
+
+
+def index_everything(index, component, days_old=0):
+    """Index full coverage for a component, fetched `days_old` days ago"""
+    for search_type in ANGLES:
+        index.add(component, search_type, f"{component} {search_type}", [
+            SearchSnippet("organic", f"{component} {search_type} {i}", f"{component} {search_type} study {i}",
+                          f"https://indexed.example.com/{component}/{search_type}/{i}") for i in range(3)
+        ])
+    conn = index._conn()
+    conn.execute("UPDATE snippets SET fetched_at = fetched_at - ?", (days_old * DAY,))
+    conn.execute("UPDATE snippet_components SET fetched_at = fetched_at - ?", (days_old * DAY,))
+    conn.commit()
+
+
+def expire_research(component):
+    """Cache research for a component and backdate it past the research TTL"""
+    cache, key = rag_server.research_cache, normalize_key(component)
+    cache.refresh(key, lambda: ComponentResearch(component, [ResearchSection("health", "expired", [])]).to_dict())
+    backend = rag_server.get_ingredient_cache()
+    entry = backend.get(cache._key(key))
+    entry["t"] -= cache.ttl + 1
+    backend.set(cache._key(key), entry)
+    return key
+
+
+def test_fresh_index_coverage_answers_a_miss(research):
+    index_everything(research.index, "potassium sorbate", days_old=2)
+    result = rag_server.research_component("Potassium_Sorbate")
+    assert research.calls == []
+    assert result.component == "Potassium_Sorbate"
+    assert all(section.query.endswith("(indexed)") for section in result.sections)
+
+
+def test_index_coverage_never_outlives_the_research_ttl(research, monkeypatch):
+    monkeypatch.setattr(rag_server, "SNIPPET_INDEX_MAX_AGE_DAYS", 30)
+    index_everything(research.index, "calcium propionate", days_old=8)
+    result = rag_server.research_component("calcium propionate")
+    assert research.calls == list(ANGLES)
+    assert not any(section.query.endswith("(indexed)") for section in result.sections)
+
+
+@pytest.mark.parametrize("days_old", [8, 1])
+def test_revalidating_an_expired_entry_searches_the_network(research, days_old):
+    component = f"sodium benzoate {days_old}"
+    index_everything(research.index, component, days_old)
+    key = expire_research(component)
+    assert rag_server.research_component(component).sections[0].query == "expired"
+    deadline = time.time() + 5
+    while rag_server.research_cache.entry_age(key) > DAY and time.time() < deadline:
+        time.sleep(0.01)
+    assert research.calls == list(ANGLES)
+    assert rag_server.research_component(component).sections[0].query.startswith(component)
+
+
+def test_refresh_ignores_the_index(research):
+    index_everything(research.index, "sorbic acid", days_old=1)
+    rag_server.research_component("sorbic acid", refresh=True)
+    assert research.calls == list(ANGLES)
@@ -0,0 +1,99 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import rag_server
+from pipeline_types import RiskResult
+from rag_server import etag_matches, lookup_etag
+
+
+def request_with(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match is not None else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """Client whose ingredients were assessed before, except for names starting with "new" or "bad" """
+    assessed = []
+
+    async def assess(ingredient, on_field=None):
+        assessed.append(ingredient)
+        if ingredient.startswith("bad"):
+            return RiskResult.failed(ingredient, "Upstream unavailable")
+        return RiskResult(ingredient, "low", 1.0, "test", f"{ingredient} is fine")
+
+    async def validate(ingredients):
+        return {"non_food_items": [name for name in ingredients.split(", ") if name.startswith("new brick")]}
+
+    for name in ("salt", "sugar"):
+        rag_server.assessment_cache.refresh(name, lambda name=name: RiskResult(name, "low", 1.0, "test").to_dict())
+    monkeypatch.setattr(rag_server, "OPENAI_ASYNC", True)
+    monkeypatch.setattr(rag_server, "aget_ingredient_assessment", assess)
+    monkeypatch.setattr(rag_server, "avalidate_food_input", validate)
+    client = TestClient(rag_server.app)
+    client.assessed = assessed
+    return client
+
+
+def test_etag_depends_on_the_body_and_cache_version():
+    etag = lookup_etag({"id": "salt", "score": 1.0})
+    assert etag == lookup_etag({"score": 1.0, "id": "salt"})
+    assert etag != lookup_etag({"id": "salt", "score": 2.0})
+    assert etag.startswith(f'"{rag_server.ASSESSMENT_CACHE_VERSION}-') and etag.endswith('"')
+
+
+def test_etag_matches():
+    etag = '"v1-abc"'
+    assert etag_matches(request_with('"v1-abc"'), etag)
+    assert etag_matches(request_with('"other", W/"v1-abc"'), etag)
+    assert etag_matches(request_with("*"), etag)
+    assert not etag_matches(request_with('"v0-abc"'), etag)
+    assert not etag_matches(request_with(), etag)
+
+
+def test_conditional_get_returns_304(client):
+    response = client.get("/ingredients", params=[("id", "salt"), ("id", "sugar")])
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()["ingredients"]] == ["salt", "sugar"]
+    assert response.headers["cache-control"].startswith("public, max-age=")
+    etag = response.headers["etag"]
+
+    revalidated = client.get("/ingredients?id=salt&id=sugar", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == etag
+    assert revalidated.content == b""
+    assert client.get("/ingredients?id=salt", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_other_spellings_redirect_to_the_canonical_url(client):
+    response = client.get("/ingredients?id=Sugar.&id=salt&id=salt", follow_redirects=False)
+    assert response.status_code == 308
+    assert response.headers["location"] == "/ingredients?id=salt&id=sugar"
+    single = client.get("/ingredients/Sodium_Nitrite", follow_redirects=False)
+    assert single.status_code == 308
+    assert single.headers["location"] == "/ingredients/sodium%20nitrite"
+
+
+def test_single_lookup(client):
+    response = client.get("/ingredients/salt")
+    assert response.status_code == 200
+    assert response.json()["id"] == "salt"
+    assert client.get("/ingredients/salt", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+
+def test_incomplete_or_rejected_results_are_not_cacheable(client):
+    degraded = client.get("/ingredients/bad%20ingredient")
+    assert degraded.status_code == 200
+    assert degraded.headers["cache-control"] == "no-store"
+    assert "etag" not in degraded.headers
+
+    rejected = client.get("/ingredients/new%20brick")
+    assert rejected.status_code == 422
+    assert rejected.headers["cache-control"] == "no-store"
+    assert "new brick" not in client.assessed
+
+
+def test_bad_multi_get_requests(client):
+    assert client.get("/ingredients").status_code == 400
+    assert client.get("/ingredients?id=%20").status_code == 400
@@ -0,0 +1,112 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import rag_server
+import retry
+from json_stream import IncrementalJSONParser, first_json_object
+
+OBJECT = {"name": "sodium nitrite", "risk_level": "High", "score": 85, "confidence": 0.9,
+          "sources": ["IARC", "FDA"], "details": {"note": "a \"quoted\" } brace"}, "nova_group": None}
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalJSONParser()
+    seen = {}
+    for start in range(0, len(text), size):
+        for key, value in parser.feed(text[start:start + size]).items():
+            assert key not in seen
+            seen[key] = value
+    return parser, seen
+
+
+def test_scalar_members_are_reported_as_they_complete():
+    text = json.dumps(OBJECT)
+    parser = IncrementalJSONParser()
+    completed = parser.feed(text[:text.index('"score"')])
+    assert completed == {"name": "sodium nitrite", "risk_level": "High"}
+    assert parser.value() is None
+    parser.feed(text[text.index('"score"'):])
+    assert parser.fields["score"] == 85
+    assert parser.value() == OBJECT
+
+
+def test_every_chunking_gives_the_same_result():
+    text = "Here is the result:\n" + json.dumps(OBJECT, indent=2) + "\nDone."
+    for size in (1, 2, 3, 7, 64, len(text)):
+        parser, seen = feed_in_chunks(text, size)
+        assert parser.value() == OBJECT
+        # Only scalars are reported early; nested values come with the whole object
+        assert seen == {"name": "sodium nitrite", "risk_level": "High", "score": 85, "confidence": 0.9, "nova_group": None}
+
+
+def test_truncated_stream_has_no_value_but_keeps_completed_fields():
+    text = json.dumps(OBJECT)
+    parser, seen = feed_in_chunks(text[:text.index('"details"') + 15], 5)
+    assert not parser.done
+    assert parser.value() is None
+    assert seen["score"] == 85
+    # A scalar cut off mid-number is not reported
+    parser, seen = feed_in_chunks('{"risk_level": "Low", "score": 4', 3)
+    assert seen == {"risk_level": "Low"}
+
+
+def test_text_after_the_object_is_ignored():
+    parser = IncrementalJSONParser()
+    parser.feed('{"a": 1} {"b": 2}')
+    assert parser.value() == {"a": 1}
+    assert parser.feed('{"c": 3}') == {}
+
+
+def test_first_json_object():
+    assert first_json_object('```json\n{"score": 10, "risk_level": "Low"}\n```') == {"score": 10, "risk_level": "Low"}
+    assert first_json_object("no json here") is None
+    assert first_json_object("") is None
+    assert first_json_object('{"score": }') is None
+    assert first_json_object("[1, 2]") is None
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+class FakeStream:
+    def __init__(self, text, size):
+        self.pieces = [text[start:start + size] for start in range(0, len(text), size)]
+        self.closed = False
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+    async def close(self):
+        self.closed = True
+
+
+def test_stream_holds_an_openai_slot_only_while_streaming(monkeypatch):
+    def in_use():
+        return sum(rag_server.openai_scheduler.stats()["in_use"].values())
+    stream = FakeStream(json.dumps(OBJECT), 7)
+    attempts, backing_off, streaming = [], [], []
+
+    async def create(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise Unavailable("overloaded")
+        return stream
+
+    async def sleep(delay):
+        backing_off.append(in_use())
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(rag_server, "get_async_openai_client", lambda: client)
+    monkeypatch.setattr(retry, "asyncio", SimpleNamespace(sleep=sleep))
+    result = asyncio.run(rag_server.astream_json_completion(
+        lambda field, value: streaming.append(in_use()),
+        model="stream-test", messages=[{"role": "user", "content": "slot per attempt"}],
+    ))
+    assert result == OBJECT
+    assert len(attempts) == 2 and attempts[1]["stream"]
+    # The failed attempt's slot is released before the backoff; the stream keeps its own until closed
+    assert backing_off == [0]
+    assert streaming and set(streaming) == {1}
+    assert stream.closed and in_use() == 0
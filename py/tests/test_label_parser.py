@@ -0,0 +1,43 @@
+from label_parser import ingredient_names, label_entries, parse_label
+
+LABEL = ("Ingredients: enriched flour (wheat flour, niacin, reduced iron), sugar 12%, "
+         "emulsifier: soy lecithin (E322), contains 2% or less of: salt, yeast.")
+
+
+def test_compound_ingredients_become_their_listed_sub_ingredients():
+    tree = parse_label(LABEL)
+    assert [node.name for node in tree][:2] == ["enriched flour", "sugar"]
+    assert [child.name for child in tree[0].children] == ["wheat flour", "niacin", "reduced iron"]
+    assert ingredient_names(LABEL) == ["wheat flour", "niacin", "reduced iron", "sugar", "soy lecithin", "salt", "yeast"]
+
+
+def test_annotations():
+    entries = dict(label_entries(LABEL))
+    assert entries["niacin"] == {"part_of": "enriched flour"}
+    assert entries["sugar"] == {"percent": 12.0}
+    assert entries["soy lecithin"] == {"e_number": "E322", "function": "emulsifier"}
+    assert entries["salt"] == {"max_percent": 2.0}
+    assert entries["yeast"] == {"max_percent": 2.0}
+
+
+def test_single_bracketed_item_is_a_note_and_decimal_commas_do_not_split():
+    assert label_entries("thiamine mononitrate [vitamin b1], milk 1,5%") == [
+        ("thiamine mononitrate", {"note": "vitamin b1"}),
+        ("milk", {"percent": 1.5}),
+    ]
+
+
+def test_e_number_alone_names_the_ingredient():
+    assert label_entries("colour: E 150d") == [("E150d", {"e_number": "E150d", "function": "colour"})]
+
+
+def test_empty_labels():
+    assert parse_label("") == []
+    assert ingredient_names("   ") == []
+    assert ingredient_names("Ingredients:") == []
+
+
+def test_malformed_brackets_do_not_lose_ingredients():
+    assert ingredient_names("flour (wheat, barley") == ["wheat", "barley"]
+    assert ingredient_names("salt, (, sugar") == ["salt", "sugar"]
+    assert ingredient_names("a))) b, c") == ["a b", "c"]
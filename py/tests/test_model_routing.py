@@ -0,0 +1,31 @@
+import rag_server
+from pipeline_types import RiskResult
+from rag_server import accept_screening, escalation_reason, parse_score_bands
+
+
+def test_parse_score_bands():
+    assert parse_score_bands("31-60,61-80") == [(31.0, 60.0), (61.0, 80.0)]
+    assert parse_score_bands("") == []
+    assert parse_score_bands("40, 10-20") == [(10.0, 20.0)]
+
+
+def test_escalation_reason(monkeypatch):
+    monkeypatch.setattr(rag_server, "ROUTING_MIN_CONFIDENCE", 0.7)
+    monkeypatch.setattr(rag_server, "_escalate_bands", [(31, 60)])
+    assert escalation_reason(RiskResult("salt", score=10), 0.9) is None
+    assert escalation_reason(RiskResult("bha", score=85), "0.8") is None
+    assert escalation_reason(RiskResult("salt", score="unknown"), 0.9) == "no score"
+    assert escalation_reason(RiskResult("salt", score=True), 0.9) == "no score"
+    assert escalation_reason(RiskResult("salt", score=10), None) == "no confidence"
+    assert escalation_reason(RiskResult("salt", score=10), 0.5) == "confidence 0.50"
+    assert escalation_reason(RiskResult("nitrite", score=45), 0.95) == "borderline score 45"
+
+
+def test_accept_screening_counts_kept_and_escalated(monkeypatch):
+    monkeypatch.setattr(rag_server, "_escalate_bands", [(31, 60)])
+    monkeypatch.setattr(rag_server, "routing_stats", {"assessment_fast": 0, "assessment_escalated": 0})
+    kept = accept_screening("salt", {"risk_level": "low", "score": 5, "confidence": 0.95, "nova_group": 2})
+    assert (kept.name, kept.score, kept.nova_group) == ("salt", 5, "2")
+    assert accept_screening("nitrite", {"score": 50, "confidence": 0.95}) is None
+    assert accept_screening("bha", None) is None
+    assert rag_server.routing_stats == {"assessment_fast": 1, "assessment_escalated": 2}
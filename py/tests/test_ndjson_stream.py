@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import rag_server
+from rag_server import ndjson_batch_results, ndjson_lines, ndjson_product_result
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def lines(*chunks, max_bytes=64):
+    async def collect():
+        return [item async for item in ndjson_lines(stream(*chunks), max_bytes)]
+    return asyncio.run(collect())
+
+
+def test_lines_split_across_chunks():
+    assert lines(b'{"a": 1}\n{"b"', b': 2}\n', b'{"c": 3}') == [(1, '{"a": 1}'), (2, '{"b": 2}'), (3, '{"c": 3}')]
+
+
+def test_blank_lines_are_skipped_but_counted():
+    assert lines(b"one\n\n   \ntwo\n\n") == [(1, "one"), (4, "two")]
+    assert lines() == []
+    assert lines(b"\n\n") == []
+
+
+def test_over_long_lines_are_reported_without_buffering_them():
+    long_line = b"x" * 100
+    assert lines(b"short\n" + long_line[:50], long_line[50:] + b"\nnext\n", max_bytes=64) == [
+        (1, "short"), (2, None), (3, "next"),
+    ]
+    # Longer than the limit within a single chunk, and as the unterminated last line
+    assert lines(long_line + b"\nok\n" + long_line, max_bytes=64) == [(1, None), (2, "ok"), (3, None)]
+
+
+def test_invalid_utf8_is_replaced():
+    assert lines(b"caf\xe9\n") == [(1, "caf�")]
+
+
+def test_malformed_product_lines():
+    async def results():
+        return [await ndjson_product_result(1, None), await ndjson_product_result(2, "{broken"),
+                await ndjson_product_result(3, '["not", "an", "object"]'),
+                await ndjson_product_result(4, '{"product": "Cola", "ingredients": 42}')]
+    too_long, broken, array, wrong_type = asyncio.run(results())
+    assert too_long["error"].startswith("Line longer than")
+    assert broken["line"] == 2 and broken["error"].startswith("Invalid JSON")
+    assert array["error"] == wrong_type["error"] == 'Expected an object with "product" and "ingredients".'
+
+
+def test_batch_results_answer_every_line(monkeypatch):
+    async def analyze(ingredients):
+        await asyncio.sleep(0.01 * (len(ingredients) % 3))  # Finish out of order
+        return {"ingredients": ingredients.split(", ")}
+    monkeypatch.setattr(rag_server, "OPENAI_ASYNC", True)
+    monkeypatch.setattr(rag_server, "aanalyze_ingredients", analyze)
+    upload = [json.dumps({"product": f"p{i}", "ingredients": f"salt, sugar {i}"}).encode() + b"\n" for i in range(20)]
+    upload.insert(5, b"{broken\n")
+
+    async def collect():
+        return [json.loads(line) async for line in ndjson_batch_results(stream(*upload))]
+    records = asyncio.run(collect())
+    assert len(records) == 21
+    by_line = {record["line"]: record for record in records}
+    assert by_line[6]["error"].startswith("Invalid JSON")
+    assert by_line[21] == {"line": 21, "product": "p19", "ingredients": ["salt", "sugar 19"]}
@@ -0,0 +1,58 @@
+import json
+
+from pipeline_types import (ComponentResearch, DatabaseAnalysis, IngredientBreakdown, Nutrient, OpenFoodFactsProduct,
+                            ResearchSection, RiskResult, SearchSnippet, UsdaFood)
+
+
+def test_research_round_trips_through_json():
+    research = ComponentResearch("bha", [
+        ResearchSection("health", "bha health", [SearchSnippet("organic", "BHA", "Possible carcinogen", "https://x", 1)]),
+        ResearchSection("official", "bha iarc", [SearchSnippet("authoritative", "IARC", "Group 2B")]),
+    ])
+    restored = ComponentResearch.from_dict(json.loads(json.dumps(research.to_dict())))
+    assert restored == research
+    text = restored.render()
+    assert "=== HEALTH RESEARCH ===" in text
+    assert "[1] BHA\n   Summary: Possible carcinogen\n   Source: https://x" in text
+    assert "[AUTHORITATIVE] IARC: Group 2B" in text
+
+
+def test_empty_research_renders_a_placeholder():
+    assert ComponentResearch("bha").render() == "No detailed research available for bha"
+    assert ResearchSection("health", "bha health", []).render().endswith("No comprehensive results found for: bha health")
+
+
+def test_usda_food_round_trip():
+    food = UsdaFood("Cheddar", 123, ["milk", "salt"], ["annatto"], [Nutrient("Sodium", 620.0, "mg")])
+    assert UsdaFood.from_dict(json.loads(json.dumps(food.to_dict()))) == food
+    assert "• Sodium: 620.0 mg" in food.render()
+
+
+def test_database_analysis_nova_group():
+    analysis = DatabaseAnalysis("cola", off_products=[
+        OpenFoodFactsProduct("Cola", "Fizz", "1", nova_group="Unknown"),
+        OpenFoodFactsProduct("Cola Zero", "Fizz", "2", nova_group=4),
+    ])
+    assert analysis.has_data
+    assert analysis.nova_group() == "4"
+    assert not DatabaseAnalysis("nothing").has_data
+    assert DatabaseAnalysis("nothing").nova_group() is None
+
+
+def test_breakdown_tolerates_loose_model_output():
+    breakdown = IngredientBreakdown.from_dict("caramel colour", {
+        "components": [{"name": "4-MEI", "type": "byproduct"}, "ammonia", {"type": "nameless"}, 7],
+        "processing_chemicals": ["sulfites"],
+        "potential_concerns": None,
+    })
+    assert breakdown.ingredient == "caramel colour"
+    assert breakdown.research_targets() == ["4-MEI", "ammonia", "sulfites"]
+    assert IngredientBreakdown.from_dict("caramel colour", breakdown.to_dict()) == breakdown
+
+
+def test_risk_result_from_dict():
+    result = RiskResult.from_dict({"risk_level": "low", "score": 1, "nova_group": 3}, "salt")
+    assert (result.name, result.nova_group) == ("salt", "3")
+    assert RiskResult.from_dict({"nova_group": "null"}).nova_group is None
+    assert RiskResult.from_dict(result.to_dict()) == result
+    assert RiskResult.failed("salt", "timeout").score == "unknown"
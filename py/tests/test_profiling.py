@@ -0,0 +1,100 @@
+import threading
+from collections import Counter
+
+import pytest
+from fastapi.testclient import TestClient
+
+import profiling
+import rag_server
+from pipeline_types import DatabaseAnalysis, RiskResult
+from profiling import ProfilerBusy, collapsed, memory_report, profile_call, sample_stacks, top_functions
+from stage_graph import Stage
+
+
+def spin(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampling_sees_a_busy_thread():
+    stop = threading.Event()
+    worker = threading.Thread(target=spin, args=(stop,), name="busy_7")
+    worker.start()
+    try:
+        stacks, rounds = sample_stacks(0.2, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+    assert rounds > 5
+    busy = [stack for stack in stacks if stack.startswith("busy;")]  # Numbered pool threads share one root
+    assert busy and all("spin (test_profiling.py:" in stack for stack in busy)
+    assert collapsed(stacks).endswith("\n")
+
+
+def test_top_functions():
+    stacks = Counter({"main;a (x.py:1);b (x.py:5)": 3, "main;a (x.py:1)": 1})
+    top = top_functions(stacks)
+    assert top[0] == {"function": "b (x.py:5)", "self": 3, "total": 3, "self_pct": 75.0, "total_pct": 75.0}
+    assert top[1] == {"function": "a (x.py:1)", "self": 1, "total": 4, "self_pct": 25.0, "total_pct": 100.0}
+    assert top_functions(Counter()) == []
+
+
+def test_only_one_cpu_profile_at_a_time():
+    def nested():
+        with pytest.raises(ProfilerBusy):
+            sample_stacks(0.1)
+        return 42
+    result, report = profile_call(nested)
+    assert result == 42
+    assert any(row["function"].startswith("nested") for row in report["top"])
+
+
+def test_profiled_assessment_runs_its_stages_in_the_profiled_thread(monkeypatch):
+    threads = set()
+
+    def lookup_stub():
+        threads.add(threading.get_ident())
+        return DatabaseAnalysis("salt")
+
+    def screen_stub(database):
+        threads.add(threading.get_ident())
+        return RiskResult("salt", score=5)
+
+    def stages(ingredient, breakdown, screening):
+        return [Stage("database", lookup_stub), Stage("screening", screen_stub, deps=("database",))]
+    monkeypatch.setattr(rag_server, "ingredient_stages", stages)
+    assert rag_server.assess_ingredient("salt").score == 5
+    assert threading.get_ident() not in threads
+    threads.clear()
+    result, report = profile_call(rag_server.assess_ingredient, "salt")
+    assert result.score == 5
+    assert threads == {threading.get_ident()}
+    assert any(row["function"].startswith("screen_stub") for row in report["top"])
+
+
+def test_memory_report_diffs_snapshots():
+    with pytest.raises(RuntimeError):
+        memory_report()
+    assert profiling.start_tracemalloc(5)
+    try:
+        assert not profiling.start_tracemalloc(5)
+        assert not memory_report(group_by="filename")["diff"]
+        kept = [bytearray(1024) for _ in range(200)]
+        report = memory_report(limit=5)
+        assert report["diff"]
+        assert any(row["size_diff_kb"] >= 200 for row in report["top"])
+        del kept
+    finally:
+        profiling.stop_tracemalloc()
+
+
+def test_admin_endpoints_require_the_admin_key(monkeypatch):
+    client = TestClient(rag_server.app)
+    monkeypatch.setattr(rag_server, "ADMIN_API_KEY", "")
+    assert client.get("/admin/profile/cpu?seconds=0.1").status_code == 403
+    monkeypatch.setattr(rag_server, "ADMIN_API_KEY", "secret")
+    assert client.get("/admin/profile/cpu?seconds=0.1", headers={"X-Admin-Key": "wrong"}).status_code == 403
+    response = client.get("/admin/profile/cpu?seconds=0.1&format=top", headers={"X-Admin-Key": "secret"})
+    assert response.status_code == 200
+    assert response.json()["rounds"] > 0
+    assert client.get("/admin/profile/memory", headers={"X-Admin-Key": "secret"}).status_code == 409
@@ -0,0 +1,108 @@
+import threading
+
+import pytest
+
+import quotas
+from quotas import ClientAccount, QuotaManager, TokenBucket, charge_upstream_call, request_account
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(quotas.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def manager(tmp_path):
+    return QuotaManager(str(tmp_path / "quota.db"))
+
+
+def test_bucket_refills_at_its_rate_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=10)
+    bucket.charge(10)
+    assert bucket.level() == 0
+    clock[0] += 3
+    assert bucket.level() == 6
+    clock[0] += 100
+    assert bucket.level() == 10
+
+
+def test_bucket_goes_into_debt_and_reports_wait_time(clock):
+    bucket = TokenBucket(rate=2, capacity=10)
+    bucket.charge(14)
+    assert bucket.level() == -4
+    assert bucket.wait_time(1) == pytest.approx(2.5)
+    # A request never needs more than a full bucket
+    assert bucket.wait_time(50) == pytest.approx(7.0)
+    clock[0] += 7
+    assert bucket.wait_time(50) == 0.0
+
+
+def test_empty_bucket_with_no_refill_waits_forever(clock):
+    bucket = TokenBucket(rate=0, capacity=5)
+    bucket.charge(5)
+    assert bucket.wait_time(1) == float("inf")
+
+
+def test_keys_authenticate_their_client(manager):
+    api_key = manager.add_key("acme", rate=5, burst=100)
+    account = manager.authenticate(api_key, "10.0.0.1")
+    assert (account.client_id, account.keyed, account.bucket.capacity) == ("acme", True, 100)
+    assert manager.authenticate(api_key, "10.0.0.2") is account
+    assert manager.authenticate("fsk_wrong", "10.0.0.1") is None
+    assert manager.revoke("acme") == 1
+    assert manager.authenticate(api_key, "10.0.0.1") is None
+    assert api_key not in str(manager.list_keys())
+
+
+def test_anonymous_clients_get_one_bucket_per_ip(manager, monkeypatch):
+    a = manager.authenticate(None, "10.0.0.1")
+    assert a.client_id == "anon:10.0.0.1" and not a.keyed
+    assert manager.authenticate(None, "10.0.0.2") is not a
+    monkeypatch.setattr(quotas, "API_KEYS_REQUIRED", True)
+    assert manager.authenticate(None, "10.0.0.1") is None
+
+
+def test_usage_is_flushed_and_accumulated(manager):
+    account = manager.authenticate(manager.add_key("acme"), "ip")
+    manager.record_request(account)
+    manager.charge(account, "openai")
+    manager.charge(account, "serpapi")
+    assert manager.flush() == 1
+    manager.charge(account, "openai")
+    usage = manager.usage("acme")
+    assert len(usage) == 1
+    assert usage[0]["requests"] == 1
+    assert usage[0]["cost_units"] == 3
+    assert usage[0]["calls"] == {"openai": 2, "serpapi": 1}
+    assert manager.flush() == 0
+
+
+def test_concurrent_flushes_do_not_lose_counts(tmp_path):
+    managers = [QuotaManager(str(tmp_path / "shared.db")) for _ in range(4)]
+    account = ClientAccount("acme", TokenBucket(1, 10), True)
+
+    def work(manager):
+        for _ in range(25):
+            manager.charge(account, "openai")
+            manager.flush()
+
+    threads = [threading.Thread(target=work, args=(m,)) for m in managers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert managers[0].usage("acme")[0]["calls"] == {"openai": 100}
+
+
+def test_charge_upstream_call_charges_the_request_account(manager):
+    account = manager.authenticate(manager.add_key("acme", burst=10), "ip")
+    charge_upstream_call("openai")  # No request account: nothing charged
+    token = request_account.set(account)
+    try:
+        charge_upstream_call("openai")
+        charge_upstream_call("usda")
+    finally:
+        request_account.reset(token)
+    assert account.bucket.level() == pytest.approx(8, abs=0.1)
@@ -0,0 +1,166 @@
+import threading
+import time
+
+from cache_backends import MemoryCacheBackend
+from research_cache import SWRCache, normalize_key
+
+TTL = 100
+STALE = 50
+
+
+def make_cache(backend=None, **kwargs):
+    backend = backend or MemoryCacheBackend()
+    return SWRCache(lambda: backend, "research", TTL, STALE, **kwargs), backend
+
+
+def age(backend, key, seconds):
+    """Backdate an entry by `seconds`"""
+    entry = backend.get(key)
+    entry["t"] -= seconds
+    backend.set(key, entry)
+
+
+def counting_loader(value):
+    calls = []
+    done = threading.Event()
+
+    def loader():
+        calls.append(1)
+        done.set()
+        return value
+    return loader, calls, done
+
+
+def test_normalize_key():
+    assert normalize_key("  Sodium_Nitrite. ") == "sodium nitrite"
+    assert normalize_key("BHA;") == "bha"
+
+
+def test_miss_loads_and_fresh_hit_does_not():
+    cache, _ = make_cache()
+    loader, calls, _ = counting_loader("research")
+    assert cache.get_or_load("bha", loader) == "research"
+    assert cache.get_or_load("bha", loader) == "research"
+    assert len(calls) == 1
+    assert cache.counters["miss"] == 1 and cache.counters["fresh"] == 1
+
+
+def test_stale_entry_is_served_while_it_refreshes_in_the_background():
+    cache, backend = make_cache()
+    cache.get_or_load("bha", lambda: "old")
+    age(backend, "research:bha", TTL + 1)
+    loader, calls, done = counting_loader("new")
+    assert cache.get_or_load("bha", loader) == "old"
+    assert done.wait(5)
+    deadline = time.time() + 5
+    while cache.counters["refreshed"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.counters["stale"] == 1 and cache.counters["refreshed"] == 1
+    assert cache.get_or_load("bha", loader) == "new"
+    assert len(calls) == 1
+
+
+def test_revalidation_can_use_its_own_loader():
+    cache, backend = make_cache()
+    cache.get_or_load("bha", lambda: "old")
+    age(backend, "research:bha", TTL + 1)
+    loader, calls, _ = counting_loader("from index")
+    revalidate, _, done = counting_loader("from network")
+    assert cache.get_or_load("bha", loader, revalidate=revalidate) == "old"
+    assert done.wait(5)
+    deadline = time.time() + 5
+    while cache.counters["refreshed"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert cache.get_or_load("bha", loader) == "from network"
+    assert calls == []
+
+
+def test_entry_past_the_stale_window_is_reloaded():
+    cache, backend = make_cache()
+    cache.get_or_load("bha", lambda: "old")
+    age(backend, "research:bha", TTL + STALE + 1)
+    assert cache.get_or_load("bha", lambda: "new") == "new"
+    assert cache.counters["miss"] == 2
+
+
+def test_negative_results_use_the_negative_ttl():
+    cache, backend = make_cache(negative_ttl=10)
+    is_negative = lambda value: value == "not found"
+    cache.get_or_load("usda:unobtainium", lambda: "not found", negative=is_negative)
+    assert backend.get("research:usda:unobtainium")["neg"] is True
+    age(backend, "research:usda:unobtainium", 5)
+    assert cache.get_or_load("usda:unobtainium", lambda: "found", negative=is_negative) == "not found"
+    # Past the negative TTL (but well within the positive one) the miss is served stale and retried
+    age(backend, "research:usda:unobtainium", 10)
+    loader, _, done = counting_loader("found")
+    assert cache.get_or_load("usda:unobtainium", loader, negative=is_negative) == "not found"
+    assert done.wait(5)
+
+
+def test_uncacheable_values_are_not_stored():
+    cache, backend = make_cache()
+    assert cache.get_or_load("bha", lambda: None) is None
+    assert backend.get("research:bha") is None
+    assert cache.get_or_load("bha", lambda: "x", cacheable=lambda value: value != "x") == "x"
+    assert backend.get("research:bha") is None
+
+
+def test_peek_entry_age_and_refresh():
+    cache, _ = make_cache()
+    assert cache.peek("bha") is None and cache.entry_age("bha") is None
+    cache.get_or_load("bha", lambda: "v1")
+    assert cache.peek("bha") == "v1"
+    assert 0 <= cache.entry_age("bha") < 5
+    assert cache.refresh("bha", lambda: "v2") == "v2"
+    assert cache.peek("bha") == "v2"
+
+
+def test_previous_version_is_served_then_migrated():
+    backend = MemoryCacheBackend()
+    v1, _ = make_cache(backend)
+    v1.set_version("v1")
+    v1.get_or_load("bha", lambda: "from v1")
+
+    v2, _ = make_cache(backend)
+    v2.set_version("v2")
+    loader, _, done = counting_loader("from v2")
+    assert v2.get_or_load("bha", loader) == "from v1"
+    assert v2.counters["old_version"] == 1
+    assert done.wait(5)
+    deadline = time.time() + 5
+    while backend.get("research:v1:bha") is not None and time.time() < deadline:
+        time.sleep(0.01)
+    # The key migrated: the new version is stored and its old entry evicted
+    assert backend.get("research:v1:bha") is None
+    assert v2.get_or_load("bha", loader) == "from v2"
+    assert v2.peek("bha") == "from v2"
+
+
+def test_versions_beyond_the_kept_ones_are_purged(tmp_path):
+    from cache_backends import SQLiteCacheBackend
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"))
+    for version in ("v1", "v2", "v3"):
+        cache, _ = make_cache(backend, versions_kept=1)
+        cache.set_version(version)
+        cache.get_or_load("bha", lambda: version)
+    assert cache.previous_versions() == ["v2"]
+    assert backend.get("research:v1:bha") is None
+    assert cache.peek("missing", any_version=True) is None
+    assert backend.register_version("research", "v3") == ["v2", "v3"]
+
+
+def test_concurrent_workers_keep_every_version(tmp_path):
+    from cache_backends import SQLiteCacheBackend
+    path = str(tmp_path / "cache.db")
+
+    def register(version):
+        cache, _ = make_cache(SQLiteCacheBackend(path), versions_kept=50)
+        cache.set_version(version)
+        cache.previous_versions()
+
+    threads = [threading.Thread(target=register, args=(f"v{i}",)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(SQLiteCacheBackend(path).register_version("research", "v0")) == 16
@@ -0,0 +1,157 @@
+import asyncio
+import itertools
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from admission import CircuitOpenError, breaker_for
+from cache_backends import MemoryCacheBackend
+from quotas import BudgetExhausted, UpstreamBudget, upstream_budget
+from research_cache import SWRCache
+from retry import (RetryPolicy, call_with_retry, acall_with_retry, classify_error, collect_failures,
+                   record_upstream_failure, request_deadline, retry_after)
+
+_names = itertools.count()
+NO_WAIT = {name: RetryPolicy(attempts, 0.0, 0.0)
+           for name, attempts in [("rate_limit", 4), ("server", 3), ("timeout", 2), ("connection", 3),
+                                  ("client", 1), ("other", 1)]}
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+class ReadTimeout(Exception):
+    pass
+
+
+class APIConnectionError(Exception):
+    pass
+
+
+@pytest.fixture
+def upstream():
+    """A fresh upstream name, so each test gets its own circuit breaker"""
+    return f"test-upstream-{next(_names)}"
+
+
+def flaky(*errors, result="ok"):
+    """Raise the given errors in turn, then return result"""
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+    return fn, calls
+
+
+def test_classify_error():
+    assert classify_error(StatusError(429)) == "rate_limit"
+    assert classify_error(StatusError(503)) == "server"
+    assert classify_error(StatusError(408)) == "server"
+    assert classify_error(StatusError(404)) == "client"
+    assert classify_error(ReadTimeout()) == "timeout"
+    assert classify_error(APIConnectionError()) == "connection"
+    assert classify_error(ValueError()) == "other"
+
+
+def test_retry_after_header():
+    assert retry_after(StatusError(429, {"Retry-After": "3"})) == 3.0
+    assert retry_after(StatusError(429, {"retry-after": "soon"})) is None
+    assert retry_after(ValueError()) is None
+
+
+def test_transient_errors_are_retried(upstream):
+    fn, calls = flaky(StatusError(503), APIConnectionError())
+    assert call_with_retry(upstream, fn, policies=NO_WAIT) == "ok"
+    assert len(calls) == 3
+    assert breaker_for(upstream).stats()["consecutive_failures"] == 0
+
+
+def test_retries_stop_at_the_policy_limit(upstream):
+    fn, calls = flaky(*[StatusError(500)] * 5)
+    with pytest.raises(StatusError):
+        call_with_retry(upstream, fn, policies=NO_WAIT)
+    assert len(calls) == 3
+
+
+def test_client_errors_are_not_retried(upstream):
+    fn, calls = flaky(StatusError(400), ValueError())
+    with pytest.raises(StatusError):
+        call_with_retry(upstream, fn, policies=NO_WAIT)
+    assert len(calls) == 1
+    # A client error proves the upstream is reachable
+    assert breaker_for(upstream).stats()["state"] == "closed"
+
+
+def test_delay_that_misses_the_deadline_gives_up(upstream):
+    fn, calls = flaky(StatusError(429, {"Retry-After": "30"}))
+    token = request_deadline.set(time.monotonic() + 1)
+    try:
+        with pytest.raises(StatusError):
+            call_with_retry(upstream, fn, policies=NO_WAIT)
+    finally:
+        request_deadline.reset(token)
+    assert len(calls) == 1
+
+
+def test_open_breaker_fails_fast(upstream):
+    breaker = breaker_for(upstream)
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    fn, calls = flaky()
+    with pytest.raises(CircuitOpenError):
+        call_with_retry(upstream, fn, policies=NO_WAIT)
+    assert calls == []
+
+
+def test_exhausted_budget_stops_attempts(upstream):
+    fn, calls = flaky(StatusError(503), StatusError(503))
+    budget = UpstreamBudget(1)
+    token = upstream_budget.set(budget)
+    try:
+        with pytest.raises(BudgetExhausted):
+            call_with_retry(upstream, fn, policies=NO_WAIT)
+    finally:
+        upstream_budget.reset(token)
+    assert len(calls) == 1
+
+
+def test_async_retry(upstream):
+    errors = [APIConnectionError(), StatusError(429)]
+
+    async def fn():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+    assert asyncio.run(acall_with_retry(upstream, fn, policies=NO_WAIT)) == "ok"
+    assert errors == []
+
+
+def test_collect_failures_nests():
+    with collect_failures() as outer:
+        record_upstream_failure("serpapi", "timeout")
+        with collect_failures() as inner:
+            record_upstream_failure("openai", "500")
+    assert outer == [("serpapi", "timeout"), ("openai", "500")]
+    assert inner == [("openai", "500")]
+    record_upstream_failure("serpapi", "outside any collector")
+
+
+def test_degraded_results_are_not_cached():
+    backend = MemoryCacheBackend()
+    cache = SWRCache(lambda: backend, "research", 100, 50)
+
+    def degraded():
+        record_upstream_failure("serpapi", "timeout")
+        return "partial"
+    assert cache.get_or_load("bha", degraded) == "partial"
+    assert cache.peek("bha") is None
+    assert cache.get_or_load("bha", lambda: "complete") == "complete"
+    assert cache.peek("bha") == "complete"
@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scheduler import BATCH, INTERACTIVE, FairScheduler, _Waiter, request_client, request_priority, run_in_context
+
+WEIGHTS = {INTERACTIVE: 4.0, BATCH: 1.0}
+
+
+def queue_waiters(scheduler, cls, client, n):
+    waiters = [_Waiter() for _ in range(n)]
+    for waiter in waiters:
+        scheduler._enqueue(cls, client, waiter)
+    return waiters
+
+
+def grant_order(scheduler, held_class, waiters_by_label):
+    """Release one slot at a time and record whose waiter got it"""
+    order = []
+    remaining = {label: list(waiters) for label, waiters in waiters_by_label.items()}
+    current = held_class
+    while any(remaining.values()):
+        scheduler.release(current)
+        for label, waiters in remaining.items():
+            granted = [w for w in waiters if w.granted]
+            if granted:
+                waiters.remove(granted[0])
+                order.append(label)
+                current = label[0]
+                break
+    return order
+
+
+def test_stride_scheduling_shares_slots_by_weight():
+    scheduler = FairScheduler("test", 1, WEIGHTS)
+    scheduler.acquire(INTERACTIVE, "holder")
+    batch = queue_waiters(scheduler, BATCH, "b", 20)
+    interactive = queue_waiters(scheduler, INTERACTIVE, "i", 20)
+    order = grant_order(scheduler, INTERACTIVE, {(BATCH,): batch, (INTERACTIVE,): interactive})
+    first = [label[0] for label in order[:20]]
+    assert first.count(INTERACTIVE) == 16 and first.count(BATCH) == 4
+    # Interactive waiters finish first, and batch work then gets every slot
+    rest = [label[0] for label in order[20:]]
+    assert rest.count(INTERACTIVE) == 4 and rest[-12:] == [BATCH] * 12
+
+
+def test_clients_within_a_class_are_served_round_robin():
+    scheduler = FairScheduler("test", 1, WEIGHTS)
+    scheduler.acquire(BATCH, "holder")
+    a = queue_waiters(scheduler, BATCH, "a", 3)
+    b = queue_waiters(scheduler, BATCH, "b", 3)
+    order = grant_order(scheduler, BATCH, {(BATCH, "a"): a, (BATCH, "b"): b})
+    assert [label[1] for label in order] == ["a", "b", "a", "b", "a", "b"]
+
+
+def test_reserved_slots_are_only_for_interactive_callers():
+    scheduler = FairScheduler("test", 3, WEIGHTS, interactive_reserved=1)
+    scheduler.acquire(BATCH, "b")
+    scheduler.acquire(BATCH, "b")
+    with pytest.raises(TimeoutError):
+        scheduler.acquire(BATCH, "b", timeout=0.05)
+    assert scheduler.acquire(INTERACTIVE, "i", timeout=0.05) == INTERACTIVE
+    assert scheduler.waiting() == 0
+
+
+def test_timed_out_waiter_is_withdrawn():
+    scheduler = FairScheduler("test", 1, WEIGHTS)
+    scheduler.acquire(INTERACTIVE, "a")
+    with pytest.raises(TimeoutError):
+        scheduler.acquire(INTERACTIVE, "b", timeout=0.05)
+    assert scheduler.waiting() == 0
+    scheduler.release(INTERACTIVE)
+    assert scheduler.stats()["in_use"][INTERACTIVE] == 0
+
+
+def test_threads_and_coroutines_share_the_same_slots():
+    scheduler = FairScheduler("test", 1, WEIGHTS)
+    scheduler.acquire(INTERACTIVE, "thread")
+
+    async def main():
+        waiting = asyncio.ensure_future(scheduler.acquire_async(BATCH, "coroutine", timeout=5))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        threading.Timer(0.05, scheduler.release, args=(INTERACTIVE,)).start()
+        return await waiting
+
+    assert asyncio.run(main()) == BATCH
+    with pytest.raises(TimeoutError):
+        scheduler.acquire(INTERACTIVE, "thread", timeout=0.05)
+
+
+def test_cancelled_coroutine_gives_back_its_place():
+    scheduler = FairScheduler("test", 1, WEIGHTS)
+    scheduler.acquire(INTERACTIVE, "holder")
+
+    async def main():
+        task = asyncio.ensure_future(scheduler.acquire_async(INTERACTIVE, "c"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert scheduler.waiting() == 0
+
+
+def test_run_in_context_carries_priority_and_client_into_threads():
+    def read():
+        return request_priority.get(), request_client.get()
+
+    def caller():
+        request_priority.set(BATCH)
+        request_client.set("acme")
+        with ThreadPoolExecutor(1) as pool:
+            return pool.submit(run_in_context(read)).result(), pool.submit(read).result()
+
+    bound, unbound = contextvars.copy_context().run(caller)
+    assert bound == (BATCH, "acme")
+    assert unbound == (INTERACTIVE, "anonymous")
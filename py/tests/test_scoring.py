@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+import pytest
+
+from scoring import (HIGH_RISK_THRESHOLD, MAX_SCORE_WEIGHT, NOVA_PENALTY, POSITION_DECAY, IngredientTable,
+                     numeric_nova, numeric_score, score_catalog)
+
+TABLE = IngredientTable.from_records([
+    ("bacon", {"score": 90, "nova_group": 4}, [{"name": "Sodium, Na", "amount": 1700}]),
+    ("salt", {"score": 10, "nova_group": "NOVA 2"}, [{"name": "Sodium, Na", "amount": 38000}]),
+    ("sugar", {"score": "25", "nova_group": None}, [{"name": "Sugars, total", "amount": 100}]),
+    ("mystery", {"score": "unknown"}, None),
+])
+
+
+def reference(names):
+    """Per-product loop the vectorized scorer must agree with"""
+    rows = [TABLE.index.get(name) for name in names]
+    known = [(POSITION_DECAY ** p, TABLE.scores[r]) for p, r in enumerate(rows) if r is not None and not np.isnan(TABLE.scores[r])]
+    if not known:
+        return math.nan
+    weighted = sum(w * s for w, s in known) / sum(w for w, _ in known)
+    nova = [(POSITION_DECAY ** p, TABLE.nova[r] == 4) for p, r in enumerate(rows) if r is not None and not np.isnan(TABLE.nova[r])]
+    share = sum(w for w, up in nova if up) / sum(w for w, _ in nova) if nova else 0.0
+    composite = MAX_SCORE_WEIGHT * max(s for _, s in known) + (1 - MAX_SCORE_WEIGHT) * weighted + NOVA_PENALTY * share
+    return min(100.0, max(0.0, composite))
+
+
+def test_numeric_conversions():
+    assert numeric_score("42") == 42.0
+    assert math.isnan(numeric_score("unknown"))
+    assert math.isnan(numeric_score(True))
+    assert numeric_nova("NOVA 4") == 4.0
+    assert math.isnan(numeric_nova(None))
+
+
+def test_composite_matches_the_per_product_definition():
+    products = [["bacon", "salt"], ["salt", "sugar", "bacon"], ["sugar"], ["mystery", "salt"], ["not in table", "bacon"]]
+    scores = score_catalog(products, TABLE)
+    for i, names in enumerate(products):
+        assert scores.composite[i] == pytest.approx(reference(names))
+
+
+def test_ranks_riskiest_first_and_unscored_last():
+    products = [["sugar"], ["bacon"], ["mystery"], [], ["salt"]]
+    scores = score_catalog(products, TABLE)
+    assert list(scores.rank) == [2, 1, 4, 5, 3]
+    assert scores.percentile[1] == 100.0
+    assert math.isnan(scores.percentile[2]) and math.isnan(scores.percentile[3])
+    summary = scores.to_dict(3)
+    assert summary["composite_risk"] is None and summary["scored_share"] is None
+
+
+def test_summary_fields():
+    scores = score_catalog([["bacon", "salt", "mystery"]], TABLE)
+    summary = scores.to_dict(0)
+    assert summary["max_score"] == 90.0
+    assert summary["high_risk_ingredients"] == sum(1 for s in (90, 10) if s > HIGH_RISK_THRESHOLD)
+    assert summary["scored_share"] == round(2 / 3, 2)
+    weights = [1, POSITION_DECAY]
+    expected_sodium = (1700 * weights[0] + 38000 * weights[1]) / sum(weights)
+    assert summary["nutrients_per_100g"] == {"sodium": round(expected_sodium, 2)}
+    assert summary["rank"] == 1
+
+
+def test_empty_catalog_and_empty_table():
+    assert len(score_catalog([], TABLE)) == 0
+    empty = IngredientTable.from_records([])
+    scores = score_catalog([["salt"], []], empty)
+    assert np.isnan(scores.composite).all()
+    assert list(scores.rank) == [1, 2]
@@ -0,0 +1,94 @@
+import pytest
+
+from pipeline_types import SearchSnippet
+from snippet_index import SnippetIndex, tokenize
+
+DAY = 86400
+
+
+@pytest.fixture
+def index(tmp_path):
+    return SnippetIndex(str(tmp_path / "snippets.db"))
+
+
+def snippets(component, search_type, count=2):
+    return [SearchSnippet("organic", f"{component} {search_type} {i}", f"{component} {search_type} finding number {i}",
+                          f"https://example.com/{search_type}/{i}") for i in range(count)]
+
+
+def research_everything(index, component, angles=("health", "safety", "official", "regulatory")):
+    for search_type in angles:
+        index.add(component, search_type, f"{component} {search_type}", snippets(component, search_type))
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("The risk of BHA, in food!") == ["risk", "bha", "food"]
+
+
+def test_snippets_are_stored_once_across_components(index):
+    shared = [SearchSnippet("organic", "Antioxidants", "BHA and BHT are synthetic antioxidants", "https://x/1")]
+    assert index.add("BHA", "health", "bha health", shared) == 1
+    assert index.add("bht", "health", "bht health", shared) == 0
+    stats = index.stats()
+    assert stats["snippets"] == 1
+    assert stats["components"] == 2
+
+
+def test_search_ranks_by_bm25(index):
+    index.add("preservatives", "health", "preservatives", [
+        SearchSnippet("organic", "Cured meat", "sodium nitrite sodium nitrite in cured meat", "https://x/1"),
+        SearchSnippet("organic", "Salt", "sodium chloride in cured meat", "https://x/2"),
+        SearchSnippet("organic", "Long", "sodium nitrite is one of many preservatives studied in a long review "
+                      "covering additives colours emulsifiers sweeteners", "https://x/3"),
+    ])
+    results = index.search("sodium nitrite")
+    assert [snippet.url for _, snippet in results] == ["https://x/1", "https://x/3"]
+    assert results[0][0] > results[1][0]
+    assert index.search("") == []
+    assert index.search("aspartame") == []
+
+
+def test_lookup_research_from_attached_snippets(index):
+    research_everything(index, "Sodium Nitrite")
+    research = index.lookup_research("sodium nitrite", max_age=DAY, min_snippets=6)
+    assert [section.search_type for section in research.sections] == ["health", "safety", "official", "regulatory"]
+    assert all(len(section.snippets) == 2 for section in research.sections)
+    assert research.sections[0].query.endswith("(indexed)")
+
+
+def test_thin_coverage_returns_none(index):
+    research_everything(index, "bha", angles=("health", "safety"))
+    # Two angles are not enough, however many snippets there are
+    assert index.lookup_research("bha", max_age=DAY, min_snippets=1) is None
+    research_everything(index, "bha", angles=("official",))
+    assert index.lookup_research("bha", max_age=DAY, min_snippets=7) is None
+    assert index.lookup_research("bha", max_age=DAY, min_snippets=6) is not None
+    assert index.lookup_research("unknown", max_age=DAY, min_snippets=0) is None
+
+
+def test_other_components_snippets_do_not_count(index):
+    # BHT's snippets mention BHA, but BHA itself was never researched
+    for search_type in ("health", "safety", "official"):
+        index.add("bht", search_type, "bht", [
+            SearchSnippet("organic", "BHA and BHT", f"bha and bht {search_type} {i}", f"https://x/{search_type}/{i}")
+            for i in range(3)
+        ])
+    assert index.lookup_research("bht", max_age=DAY, min_snippets=6) is not None
+    assert index.lookup_research("bha", max_age=DAY, min_snippets=1) is None
+
+
+def test_stale_snippets_are_ignored(index):
+    research_everything(index, "bha")
+    conn = index._conn()
+    conn.execute("UPDATE snippets SET fetched_at = fetched_at - ?", (2 * DAY,))
+    conn.execute("UPDATE snippet_components SET fetched_at = fetched_at - ?", (2 * DAY,))
+    conn.commit()
+    assert index.lookup_research("bha", max_age=DAY, min_snippets=1) is None
+    assert index.search("bha", max_age=DAY) == []
+    assert index.search("bha", max_age=3 * DAY) != []
+
+
+def test_components_are_normalized_like_cache_keys(index):
+    research_everything(index, "Sodium_Nitrite.")
+    assert index.lookup_research("  sodium nitrite", max_age=DAY, min_snippets=6) is not None
+    assert index.stats()["components"] == 1
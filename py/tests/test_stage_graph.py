@@ -0,0 +1,130 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from stage_graph import InlineExecutor, Stage, arun_stages, run_stages
+
+label: contextvars.ContextVar = contextvars.ContextVar("label", default=None)
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        yield pool
+
+
+def test_dependencies_receive_results(executor):
+    stages = [
+        Stage("total", lambda parse, lookup: parse + lookup, deps=("parse", "lookup")),
+        Stage("parse", lambda: 1),
+        Stage("lookup", lambda parse: parse * 10, deps=("parse",)),
+    ]
+    assert run_stages(stages, executor) == {"parse": 1, "lookup": 10, "total": 11}
+
+
+def test_independent_stages_run_concurrently(executor):
+    barrier = threading.Barrier(3, timeout=5)
+
+    def meet():
+        barrier.wait()  # Deadlocks unless all three run at once
+        return True
+    stages = [Stage(f"search{i}", meet) for i in range(3)]
+    assert all(run_stages(stages, executor).values())
+
+
+def test_stages_run_in_the_callers_context(executor):
+    label.set("request-1")
+    assert run_stages([Stage("read", lambda: label.get())], executor) == {"read": "request-1"}
+
+
+def test_expand_adds_stages(executor):
+    def research_components(components, results):
+        return [Stage(f"research:{c}", lambda c=c: c.upper()) for c in components]
+    stages = [
+        Stage("breakdown", lambda: ["bha", "bht"], expand=research_components),
+        Stage("screen", lambda: "ok"),
+    ]
+    results = run_stages(stages, executor)
+    assert results["research:bha"] == "BHA"
+    assert results["research:bht"] == "BHT"
+    assert len(results) == 4
+
+
+def test_inline_executor_runs_every_stage_in_the_calling_thread():
+    stages = [Stage("lookup", lambda parse: threading.get_ident(), deps=("parse",)),
+              Stage("parse", lambda: threading.get_ident())]
+    assert set(run_stages(stages, InlineExecutor()).values()) == {threading.get_ident()}
+
+    def fail():
+        raise RuntimeError("boom")
+    with pytest.raises(RuntimeError, match="boom"):
+        run_stages([Stage("fail", fail)], InlineExecutor())
+
+
+def test_unsatisfiable_dependencies_raise(executor):
+    stages = [Stage("a", lambda: 1), Stage("b", lambda missing: missing, deps=("missing",))]
+    with pytest.raises(ValueError, match="'b'"):
+        run_stages(stages, executor)
+
+
+def test_stage_errors_propagate(executor):
+    def fail():
+        raise RuntimeError("breakdown failed")
+    with pytest.raises(RuntimeError, match="breakdown failed"):
+        run_stages([Stage("breakdown", fail)], executor)
+
+
+def test_empty_graph(executor):
+    assert run_stages([], executor) == {}
+    assert asyncio.run(arun_stages([])) == {}
+
+
+def test_async_stages_mix_coroutines_and_threads():
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return 2
+
+    def compute(fetch):
+        return fetch * 21
+
+    async def main():
+        started = time.monotonic()
+        results = await arun_stages([
+            Stage("fetch", fetch),
+            Stage("slow", lambda: time.sleep(0.2) or "slow"),
+            Stage("compute", compute, deps=("fetch",)),
+        ])
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(main())
+    assert results == {"fetch": 2, "slow": "slow", "compute": 42}
+    assert elapsed < 0.4
+
+
+def test_async_failure_cancels_running_stages():
+    async def main():
+        stopped = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            finally:
+                stopped.set()
+
+        async def fail():
+            raise RuntimeError("lookup failed")
+
+        with pytest.raises(RuntimeError):
+            await arun_stages([Stage("slow", slow), Stage("fail", fail)])
+        await asyncio.wait_for(stopped.wait(), 1)
+
+    asyncio.run(main())
+
+
+def test_async_unsatisfiable_dependencies_raise():
+    with pytest.raises(ValueError):
+        asyncio.run(arun_stages([Stage("b", lambda a: a, deps=("a",))]))
@@ -0,0 +1,55 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+import rag_server
+
+
+def fresh_state():
+    return {"ready": False, "import_seconds": 0.1, "time_to_ready_seconds": None, "warmup_steps": {},
+            "warmup_errors": {}}
+
+
+def test_ready_only_after_the_warmup(monkeypatch):
+    release = threading.Event()
+
+    def failing():
+        raise RuntimeError("no credentials")
+    monkeypatch.setattr(rag_server, "startup_state", fresh_state())
+    monkeypatch.setattr(rag_server, "_warmup_hooks", [("slow", release.wait), ("failing", failing)])
+    monkeypatch.setattr(rag_server, "WARMUP_ON_STARTUP", True)
+    with TestClient(rag_server.app) as client:
+        # Connections are accepted at once; readiness waits for the hooks
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert client.get("/test").status_code == 200
+        release.set()
+        deadline = time.monotonic() + 5
+        while client.get("/ready").status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert client.get("/ready").json()["ready"]
+    state = rag_server.startup_state
+    assert set(state["warmup_steps"]) == {"slow", "failing"}
+    assert state["warmup_errors"] == {"failing": "no credentials"}
+
+
+def test_ready_at_once_without_warmup(monkeypatch):
+    hooks = []
+    monkeypatch.setattr(rag_server, "startup_state", fresh_state())
+    monkeypatch.setattr(rag_server, "_warmup_hooks", [("never", lambda: hooks.append(1))])
+    monkeypatch.setattr(rag_server, "WARMUP_ON_STARTUP", False)
+    with TestClient(rag_server.app) as client:
+        assert client.get("/ready").status_code == 200
+    assert hooks == []
+
+
+def test_register_warmup(monkeypatch):
+    monkeypatch.setattr(rag_server, "_warmup_hooks", [])
+
+    @rag_server.register_warmup("example")
+    def example():
+        return "warm"
+    assert example() == "warm"
+    assert rag_server._warmup_hooks == [("example", example)]
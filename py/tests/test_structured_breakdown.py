@@ -0,0 +1,52 @@
+from pipeline_types import DatabaseAnalysis, OpenFoodFactsProduct, UsdaFood
+from structured_breakdown import additive_code, resolve_breakdown
+
+
+def test_additive_code():
+    assert additive_code("en:e250") == "E250"
+    assert additive_code("en:e150d") == "E150d"
+    assert additive_code("E 250") == "E250"
+    assert additive_code("e-471") == "E471"
+    assert additive_code("Sodium Nitrite") == "E250"
+    assert additive_code("sugar") is None
+    assert additive_code("en:sugar") is None
+
+
+def test_known_additive_needs_no_database():
+    breakdown = resolve_breakdown("E250", None)
+    assert [c.name for c in breakdown.components] == ["sodium nitrite"]
+    assert breakdown.components[0].type == "preservative"
+    assert breakdown.potential_concerns == ["forms carcinogenic nitrosamines in cured meat"]
+    assert resolve_breakdown("citric acid", None).potential_concerns == []
+
+
+def test_breakdown_from_a_matching_product():
+    database = DatabaseAnalysis("hot dogs", off_products=[
+        OpenFoodFactsProduct("Veggie burger", "Green", "1", "soy, E471", additives_tags=["en:e471"]),
+        OpenFoodFactsProduct("Beef Hot Dog", "Franks", "2", "beef, water, salt, E250, spices (paprika, garlic)",
+                             additives_tags=["en:e250", "en:e316"]),
+    ])
+    breakdown = resolve_breakdown("hot dog", database)
+    names = [c.name for c in breakdown.components]
+    # Additives first, then sub-ingredients; E250 from the tags and the label is listed once
+    assert names[:2] == ["sodium nitrite", "sodium erythorbate"]
+    assert names.count("sodium nitrite") == 1
+    assert {"beef", "water", "salt"} <= set(names)
+    assert "mono- and diglycerides of fatty acids" not in names
+    assert breakdown.potential_concerns == ["sodium nitrite: forms carcinogenic nitrosamines in cured meat"]
+
+
+def test_usda_record_adds_sub_ingredients():
+    usda = UsdaFood("Bread, white, commercially prepared", 1, ["enriched wheat flour", "water", "yeast", "E282"])
+    breakdown = resolve_breakdown("white bread", DatabaseAnalysis("white bread", usda=usda))
+    assert [c.name for c in breakdown.components][0] == "calcium propionate"
+    assert len(breakdown.components) == 4
+
+
+def test_sparse_or_unmatched_records_fall_back_to_the_llm():
+    assert resolve_breakdown("hot dog", None) is None
+    sparse = DatabaseAnalysis("cola", off_products=[OpenFoodFactsProduct("Cola", "Fizz", "1", "water, sugar")])
+    assert resolve_breakdown("cola", sparse) is None
+    unmatched = DatabaseAnalysis("cola", off_products=[
+        OpenFoodFactsProduct("Orange juice", "Sun", "1", "oranges, water, sugar, E330")])
+    assert resolve_breakdown("cola", unmatched) is None
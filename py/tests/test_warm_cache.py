@@ -0,0 +1,142 @@
+import contextvars
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import rag_server
+import warm_cache
+from pipeline_types import SearchSnippet
+from quotas import ESTIMATED_INGREDIENT_COST, BudgetExhausted, UpstreamBudget, charge_upstream_call
+from snippet_index import SnippetIndex
+
+CALLS_PER_ASSESSMENT = 3
+
+
+@pytest.fixture
+def analysis_log(tmp_path, monkeypatch):
+    path = str(tmp_path / "analysis_log.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE analysis_log (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT, input TEXT, "
+                 "result TEXT, error TEXT)")
+    conn.commit()
+    monkeypatch.setattr(rag_server, "DB_PATH", path)
+
+    def log(input_str, names=None, days_ago=0):
+        result = json.dumps([{"name": name} for name in names]) if names is not None else None
+        conn.execute("INSERT INTO analysis_log (timestamp, input, result) VALUES (?, ?, ?)",
+                     ((datetime.utcnow() - timedelta(days=days_ago)).isoformat(), input_str, result))
+        conn.commit()
+    yield log
+    conn.close()
+
+
+@pytest.fixture
+def assessments(monkeypatch):
+    """Stand-in for get_ingredient_assessment that makes CALLS_PER_ASSESSMENT charged calls"""
+    assessed = []
+
+    def assess(ingredient, refresh=False):
+        def load():
+            for _ in range(CALLS_PER_ASSESSMENT):
+                charge_upstream_call("openai")
+            return {"name": ingredient}
+        assessed.append(ingredient)
+        return rag_server.assessment_cache.refresh(ingredient, load)
+    monkeypatch.setattr(rag_server, "get_ingredient_assessment", assess)
+    return assessed
+
+
+def run_job(**kwargs):
+    # The job sets its priority and budget in the current context, so give it a copy
+    return contextvars.copy_context().run(warm_cache.run_warmup_job, **kwargs)
+
+
+def test_mine_popular_ingredients(analysis_log):
+    analysis_log("BHA, salt", names=["BHA", "Salt"])
+    analysis_log("salt, sugar")
+    analysis_log("barcode:123", names=["Salt", "Ingredients"])
+    analysis_log("barcode:456")
+    analysis_log("aspartame", names=["aspartame"], days_ago=60)
+    assert warm_cache.mine_popular_ingredients(rag_server.DB_PATH, 30, 10) == [("salt", 3), ("bha", 1), ("sugar", 1)]
+    assert warm_cache.mine_popular_ingredients(rag_server.DB_PATH, 30, 1) == [("salt", 3)]
+
+
+def test_in_offpeak_window():
+    assert warm_cache.in_offpeak_window(3, "2-5")
+    assert not warm_cache.in_offpeak_window(5, "2-5")
+    assert warm_cache.in_offpeak_window(23, "22-4")
+    assert warm_cache.in_offpeak_window(1, "22-4")
+    assert not warm_cache.in_offpeak_window(12, "22-4")
+
+
+def test_upstream_budget():
+    budget = UpstreamBudget(2)
+    budget.charge("openai")
+    budget.charge("serpapi")
+    with pytest.raises(BudgetExhausted):
+        budget.charge("openai")
+    assert (budget.spent, budget.refused) == (2, True)
+    assert not budget.try_spend(0.5)
+
+
+def test_warmup_refreshes_missing_and_skips_fresh(analysis_log, assessments):
+    for name in ("warm-a", "warm-a", "warm-b"):
+        analysis_log(name, names=[name])
+    rag_server.assessment_cache.refresh("warm-b", lambda: {"name": "warm-b"})
+    report = run_job(limit=10, budget=100)
+    assert report["ingredients_refreshed"] == ["warm-a"]
+    assert report["skipped_fresh"] == 1
+    assert report["spent"] == CALLS_PER_ASSESSMENT
+    assert "budget_exhausted" not in report
+    assert rag_server.assessment_cache.peek("warm-a") == {"name": "warm-a"}
+
+
+def test_budget_stops_the_job_without_storing_partial_work(analysis_log, assessments):
+    for name in ("budget-a", "budget-a", "budget-b"):
+        analysis_log(name, names=[name])
+    report = run_job(limit=10, budget=CALLS_PER_ASSESSMENT + 1)
+    assert report["ingredients_refreshed"] == ["budget-a"]
+    assert report["budget_exhausted"]
+    assert report["spent"] == CALLS_PER_ASSESSMENT + 1
+    assert assessments == ["budget-a", "budget-b"]
+    assert rag_server.assessment_cache.peek("budget-b") is None
+
+
+def test_dry_run_charges_estimates_and_makes_no_calls(analysis_log, assessments):
+    for name in ("dry-a", "dry-b", "dry-c"):
+        analysis_log(name, names=[name])
+    report = run_job(limit=10, budget=ESTIMATED_INGREDIENT_COST * 2, dry_run=True)
+    assert len(report["ingredients_refreshed"]) == 2
+    assert report["budget_exhausted"]
+    assert report["spent"] == ESTIMATED_INGREDIENT_COST * 2
+    assert assessments == []
+
+
+def test_component_research_is_fetched_and_counted_only_when_stored(analysis_log, assessments, tmp_path,
+                                                                    monkeypatch):
+    analysis_log("warm-cola", names=["warm-cola"])
+    rag_server.breakdown_cache.refresh("warm-cola", lambda: json.dumps({"components": ["warm caramel", "warm acid"]}))
+    index = SnippetIndex(str(tmp_path / "snippets.db"))
+    # Fresh indexed coverage must not stand in for a network refresh
+    for search_type in ("health", "safety", "official", "regulatory", "recent"):
+        index.add("warm caramel", search_type, search_type, [
+            SearchSnippet("organic", f"caramel {i}", f"warm caramel {search_type} {i}", f"https://x/{search_type}/{i}")
+            for i in range(3)
+        ])
+    searched = []
+
+    def fetch_web_snippets(query, search_type="general"):
+        searched.append(query)
+        if "acid" in query:
+            raise ConnectionError("serpapi unavailable")
+        return [SearchSnippet("organic", query, f"{query} finding", f"https://example.com/{search_type}")]
+    monkeypatch.setattr(rag_server, "_snippet_index", index)
+    monkeypatch.setattr(rag_server, "web_search_enabled", lambda: True)
+    monkeypatch.setattr(rag_server, "fetch_web_snippets", fetch_web_snippets)
+    report = run_job(limit=10, budget=100)
+    assert len([query for query in searched if "caramel" in query]) == 5
+    assert report["components_refreshed"] == ["warm caramel"]
+    assert report["not_refreshed"] == ["warm acid"]
+    assert rag_server.research_cache.peek("warm acid") is None
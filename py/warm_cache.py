@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Cache warm-up job driven by analysis_log popularity.
+
+Mines analysis_log for the most-requested ingredients, then recomputes the
+assessments of those that are missing or close to expiring, followed by the
+component research shared by many of them, all within an upstream cost budget
+charged per call actually made.
+Run after a deploy or cache-version bump so the head of the traffic
+distribution is already warm:
+
+    python warm_cache.py --limit 200 --budget 2000
+    python warm_cache.py --dry-run
+
+The server can also run it in the background during off-peak hours
+(CACHE_WARMER_ENABLED=true, CACHE_WARMER_HOURS=2-5).
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import rag_server
+from label_parser import ingredient_names
+from quotas import ESTIMATED_INGREDIENT_COST, ESTIMATED_RESEARCH_COST, BudgetExhausted, UpstreamBudget, upstream_budget
+from research_cache import normalize_key
+from scheduler import BATCH, request_priority
+
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "false").lower() == "true"  # Background warmer in the server
+CACHE_WARMER_ON_STARTUP = os.getenv("CACHE_WARMER_ON_STARTUP", "false").lower() == "true"  # Also run once right after startup
+CACHE_WARMER_HOURS = os.getenv("CACHE_WARMER_HOURS", "2-5")  # Off-peak local hours, "start-end" (end exclusive, may wrap midnight)
+CACHE_WARMER_LIMIT = int(os.getenv("CACHE_WARMER_LIMIT", "200"))  # Most popular ingredients considered per run
+CACHE_WARMER_BUDGET = float(os.getenv("CACHE_WARMER_BUDGET", "2000"))  # Upstream cost units per run (1 unit = 1 API call)
+CACHE_WARMER_SINCE_DAYS = float(os.getenv("CACHE_WARMER_SINCE_DAYS", "30"))  # analysis_log window mined for popularity
+CACHE_WARMER_REFRESH_AT = float(os.getenv("CACHE_WARMER_REFRESH_AT", "0.8"))  # Refresh entries older than this fraction of their TTL
+
+
+def mine_popular_ingredients(db_path: str, since_days: float, limit: int) -> List[Tuple[str, int]]:
+    """Most frequently analyzed ingredients (normalized) in the recent analysis log"""
+    since = (datetime.utcnow() - timedelta(days=since_days)).isoformat()
+    counts: Counter = Counter()
+    conn = sqlite3.connect(db_path, timeout=10)
+    try:
+        rows = conn.execute("SELECT input, result FROM analysis_log WHERE timestamp >= ?", (since,))
+        for input_str, result in rows:
+            names: List[str] = []
+            try:
+                # Results name every analyzed ingredient, including those of barcode lookups
+                names = [item["name"] for item in json.loads(result or "[]") if isinstance(item, dict)]
+            except (json.JSONDecodeError, TypeError, KeyError):
+                pass
+            if not names and input_str and not input_str.startswith("barcode:"):
+                names = ingredient_names(input_str)
+            for name in names:
+                key = normalize_key(name)
+                if key and key != "ingredients":
+                    counts[key] += 1
+    finally:
+        conn.close()
+    return counts.most_common(limit)
+
+
+def popular_components(ingredients: List[Tuple[str, int]], limit: int) -> List[Tuple[str, int]]:
+    """Components weighted by the popularity of the ingredients whose cached breakdowns list them"""
+    counts: Counter = Counter()
+    for ingredient, count in ingredients:
+        breakdown_json = rag_server.breakdown_cache.peek(ingredient)
+        breakdown = rag_server.parse_ingredient_breakdown(ingredient, breakdown_json) if breakdown_json else None
+        if breakdown is None:
+            continue
+        for component in breakdown.research_targets()[:5]:
+            counts[normalize_key(component)] += count
+    return counts.most_common(limit)
+
+
+def _needs_refresh(cache, key: str) -> bool:
+    age = cache.entry_age(key)
+    return age is None or age > cache.ttl * CACHE_WARMER_REFRESH_AT
+
+
+def _warm(budget: UpstreamBudget, estimate: float, dry_run: bool, work: Callable[[], Any]) -> bool:
+    """Run one refresh charged to the budget; False when the budget ran out before or during it.
+
+    A dry run makes no calls and charges the estimate instead.
+    """
+    if dry_run:
+        return budget.try_spend(estimate)
+    if budget.refused:
+        return False
+    try:
+        work()
+    except BudgetExhausted:
+        return False
+    # A refresh cut short by the budget is degraded, so nothing partial was stored
+    return not budget.refused
+
+
+def run_warmup_job(limit: int = CACHE_WARMER_LIMIT, budget: float = CACHE_WARMER_BUDGET,
+                   since_days: float = CACHE_WARMER_SINCE_DAYS, dry_run: bool = False) -> Dict[str, Any]:
+    """Refresh the most popular assessments and component research within `budget` cost units.
+
+    Every upstream call attempt the refreshes make is charged to the budget as it happens, and
+    the first one that does not fit is refused. A dry run charges the estimated costs instead.
+    Research is always fetched from the network, never rebuilt from the snippet index, and a
+    refresh whose result was degraded or empty (so nothing was stored) is listed under
+    "not_refreshed" instead of being counted as refreshed.
+    """
+    request_priority.set(BATCH)
+    spending = UpstreamBudget(budget)
+    upstream_budget.set(spending)
+    started = time.perf_counter()
+    report: Dict[str, Any] = {"ingredients_refreshed": [], "components_refreshed": [], "skipped_fresh": 0,
+                              "not_refreshed": [], "spent": 0.0, "budget": budget, "dry_run": dry_run}
+
+    ingredients = mine_popular_ingredients(rag_server.DB_PATH, since_days, limit)
+    report["candidates"] = len(ingredients)
+
+    for ingredient, _ in ingredients:
+        if not _needs_refresh(rag_server.assessment_cache, ingredient):
+            report["skipped_fresh"] += 1
+            continue
+        if not dry_run:
+            print(f"Warming assessment for: {ingredient}")
+        if not _warm(spending, ESTIMATED_INGREDIENT_COST, dry_run,
+                     lambda: rag_server.get_ingredient_assessment(ingredient, refresh=True)):
+            report["budget_exhausted"] = True
+            break
+        if dry_run or not _needs_refresh(rag_server.assessment_cache, ingredient):
+            report["ingredients_refreshed"].append(ingredient)
+        else:
+            report["not_refreshed"].append(ingredient)
+
+    if rag_server.web_search_enabled() and not report.get("budget_exhausted"):
+        for component, _ in popular_components(ingredients, limit):
+            if not _needs_refresh(rag_server.research_cache, component):
+                report["skipped_fresh"] += 1
+                continue
+            if not dry_run:
+                print(f"Warming research for component: {component}")
+            if not _warm(spending, ESTIMATED_RESEARCH_COST, dry_run,
+                         lambda: rag_server.research_component(component, refresh=True)):
+                report["budget_exhausted"] = True
+                break
+            if dry_run or not _needs_refresh(rag_server.research_cache, component):
+                report["components_refreshed"].append(component)
+            else:
+                report["not_refreshed"].append(component)
+
+    report["spent"] = spending.spent
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def in_offpeak_window(hour: int, spec: str = CACHE_WARMER_HOURS) -> bool:
+    start, end = (int(part) for part in spec.split("-"))
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+def _run_exclusive(label: str) -> None:
+    """Run the job unless another worker process on this host is already running it"""
+    import fcntl
+    with open(f"{rag_server.DB_PATH}.warmer.lock", "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            print(f"{label} cache warm-up skipped: another worker is running it")
+            return
+        try:
+            print(f"{label} cache warm-up: {run_warmup_job()}")
+        except Exception as e:
+            print(f"{label} cache warm-up failed: {e}")
+
+
+def start_background_warmer(check_interval: float = 600) -> threading.Thread:
+    """Run the warm-up job once per day inside the off-peak window (and optionally at startup)"""
+    def loop():
+        last_run_day: Optional[str] = None
+        if CACHE_WARMER_ON_STARTUP:
+            _run_exclusive("Startup")
+        while CACHE_WARMER_ENABLED:
+            now = datetime.now()
+            today = now.strftime("%Y-%m-%d")
+            if last_run_day != today and in_offpeak_window(now.hour):
+                last_run_day = today
+                _run_exclusive("Off-peak")
+            time.sleep(check_interval)
+
+    thread = threading.Thread(target=loop, name="cache-warmer", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm the FoodSafe AI cache from analysis_log popularity")
+    parser.add_argument("--limit", type=int, default=CACHE_WARMER_LIMIT, help="Most popular ingredients to consider")
+    parser.add_argument("--budget", type=float, default=CACHE_WARMER_BUDGET, help="Upstream cost units to spend")
+    parser.add_argument("--since-days", type=float, default=CACHE_WARMER_SINCE_DAYS, help="Analysis log window to mine")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be refreshed")
+    args = parser.parse_args()
+
+    print(json.dumps(run_warmup_job(args.limit, args.budget, args.since_days, args.dry_run), indent=2))
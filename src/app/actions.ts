@@ -1,5 +1,14 @@
 "use server";
 
+// Server-side key for the backend's per-client quotas (never exposed to the browser)
+function backendHeaders(): Record<string, string> {
+  const headers: Record<string, string> = { "Content-Type": "application/json" };
+  if (process.env.FOODSAFE_API_KEY) {
+    headers["X-API-Key"] = process.env.FOODSAFE_API_KEY;
+  }
+  return headers;
+}
+
 export async function getRagResponse(prompt: string): Promise<{ answer: string | null; error: string | null }> {
   if (!prompt.trim()) {
     return { answer: null, error: "Please enter a prompt." };
@@ -29,7 +38,7 @@ export async function postIngredientsForAnalysis(ingredients: string): Promise<a
     console.log("Attempting to fetch from backend...");
     const response = await fetch(`${backendUrl}/ingredients`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: backendHeaders(),
       body: JSON.stringify({ ingredients })
     });
     
@@ -55,7 +64,7 @@ export async function postBatchProductsForAnalysis(products: { product: string;
     const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || "http://localhost:8002";
     const response = await fetch(`${backendUrl}/ingredients`, {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: backendHeaders(),
       body: JSON.stringify(products)
     });
     if (!response.ok) {